@@ -7,20 +7,21 @@ import time
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from os.path import basename, exists, isfile, join
 from os import walk
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import typer
 
-from .formats import is_supported_filename
-from .jobs import process_file_job
+from .batch import plan_batches
+from .formats import identify_filename, is_supported_filename
+from .jobs import job_options, process_batch_job, process_file_job
 from .models import RepackOptions
 from .progress import ProgressReporter, stderr_is_tty
 from .repack import FileRepacker, normalize_pdf_profile
 from .tools import doctor_rows, install_instructions
 from .utils import (
-    DEFAULT_EXCLUDE_DIRS, create_backup, format_size, output_csv, output_json,
-    parse_dir_names, parse_extensions, parse_jobs, parse_size, setup_logging,
-    should_process_file,
+    DEFAULT_EXCLUDE_DIRS, cpu_budget, create_backup, format_size, output_csv,
+    output_json, parse_dir_names, parse_duration, parse_extensions, parse_jobs,
+    parse_size, setup_logging, should_process_file,
 )
 
 app = typer.Typer()
@@ -81,6 +82,10 @@ def _build_options(
     max_extract_ratio: Optional[float] = None,
     pdf_profile: Optional[str] = None,
     keep_meta: bool = False,
+    threads: Optional[int] = None,
+    max_memory_bytes: Optional[int] = None,
+    video_segments: Optional[int] = None,
+    max_encode_seconds: Optional[float] = None,
 ) -> RepackOptions:
     return RepackOptions(
         debug=debug,
@@ -102,6 +107,10 @@ def _build_options(
         max_extract_bytes=max_extract_bytes,
         max_extract_ratio=max_extract_ratio,
         keep_meta=keep_meta,
+        threads=cpu_budget(threads),
+        max_memory_bytes=max_memory_bytes,
+        video_segments=video_segments or None,
+        max_encode_seconds=max_encode_seconds,
     )
 
 
@@ -123,6 +132,28 @@ def _max_extract_or_exit(value: Optional[str]):
         raise typer.Exit(1)
 
 
+def _max_memory_or_exit(value: Optional[str]) -> Optional[int]:
+    """--max-memory in bytes; None (no ceiling) when unset or 0."""
+    if value is None:
+        return None
+    try:
+        return parse_size(value) or None
+    except ValueError as exc:
+        typer.echo(f"Error: {exc}", err=True)
+        raise typer.Exit(1)
+
+
+def _max_encode_time_or_exit(value: Optional[str]) -> Optional[float]:
+    """--max-encode-time in seconds; None (no budget) when unset or 0."""
+    if value is None:
+        return None
+    try:
+        return parse_duration(value) or None
+    except ValueError as exc:
+        typer.echo(f"Error: {exc}", err=True)
+        raise typer.Exit(1)
+
+
 def _pdf_profile_or_exit(value: Optional[str]) -> Optional[str]:
     if value is None:
         return None
@@ -147,7 +178,7 @@ def _want_progress(progress_flag: Optional[bool]) -> bool:
 @app.command()
 def repack(
     filename: str = typer.Argument(..., help="Path to the file to repack"),
-    ultra: bool = typer.Option(False, "--ultra", help="Ultra parquet compression"),
+    ultra: bool = typer.Option(False, "--ultra", help="Stronger lossless passes (slower)"),
     dryrun: bool = typer.Option(False, "--dryrun", help="Do not modify files"),
     deep: bool = typer.Option(True, "--deep/--no-deep", help="Process nested archives"),
     quiet: bool = typer.Option(False, "--quiet", help="Quiet mode"),
@@ -192,10 +223,26 @@ def repack(
         False, "--keep-meta",
         help="Keep JPEG/PNG metadata (default strips EXIF/ICC)",
     ),
+    threads: Optional[int] = typer.Option(
+        None, "--threads",
+        help="CPU threads per file for concurrent tool trials (default: all cores / jobs)",
+    ),
     max_extract_size: Optional[str] = typer.Option(
         None, "--max-extract-size",
         help="Abort archive extract above this size (0 disables, default 8GB)",
     ),
+    max_memory: Optional[str] = typer.Option(
+        None, "--max-memory",
+        help="Per-job memory ceiling for large PDFs, e.g. 4GB (skips linearization)",
+    ),
+    video_segments: int = typer.Option(
+        0, "--video-segments",
+        help="Encode video as up to N keyframe-aligned segments in parallel (0: off)",
+    ),
+    max_encode_time: Optional[str] = typer.Option(
+        None, "--max-encode-time",
+        help="Skip videos whose predicted encode time exceeds this, e.g. 30m or 2h",
+    ),
     json: bool = typer.Option(False, "--json", help="JSON output"),
     csv: bool = typer.Option(False, "--csv", help="CSV output"),
     log_file: Optional[str] = typer.Option(None, "--log-file", help="Write log to file"),
@@ -246,6 +293,8 @@ def repack(
             echo_verbose(f"Copied to output directory: {output_filepath}", level=2)
 
     max_extract_bytes, max_extract_ratio = _max_extract_or_exit(max_extract_size)
+    max_memory_bytes = _max_memory_or_exit(max_memory)
+    max_encode_seconds = _max_encode_time_or_exit(max_encode_time)
     pdf_profile = _pdf_profile_or_exit(pdf_profile)
     options = _build_options(
         ultra=ultra, dryrun=dryrun, deep=deep, quiet=quiet, debug=debug,
@@ -255,7 +304,8 @@ def repack(
         convert_container=convert_container, keep_if_larger=not allow_grow,
         min_savings=min_savings, max_extract_bytes=max_extract_bytes,
         max_extract_ratio=max_extract_ratio, pdf_profile=pdf_profile,
-        keep_meta=keep_meta,
+        keep_meta=keep_meta, threads=threads, max_memory_bytes=max_memory_bytes,
+        video_segments=video_segments, max_encode_seconds=max_encode_seconds,
     )
 
     start_time = time.time()
@@ -282,6 +332,8 @@ def repack(
         'savings_bytes': results.total_savings_bytes,
         'files_processed': len(results.results),
         'elapsed_time': elapsed_time,
+        'note': results.note,
+        'peak_rss_mb': results.peak_rss_mb,
         'files': [
             {
                 'file': r.filepath,
@@ -289,6 +341,11 @@ def repack(
                 'final_size': r.outsize,
                 'savings_percent': r.savings_pct,
                 'savings_bytes': r.savings_bytes,
+                'method': r.method,
+                'note': r.note,
+                'tier': r.tier,
+                'elapsed_seconds': r.elapsed_seconds,
+                'metrics': r.metrics,
             }
             for r in results.results
         ],
@@ -322,6 +379,8 @@ def repack(
             echo_verbose("\nStatistics:", level=1)
             echo_verbose(f"  Processing time: {elapsed_time:.2f}s", level=1)
             echo_verbose(f"  Files processed: {len(results.results)}", level=1)
+            if results.peak_rss_mb is not None:
+                echo_verbose(f"  Peak PDF memory: {results.peak_rss_mb:.1f} MB", level=1)
 
 
 def _collect_bulk_files(directory: str, skip_dirs: set, skip_zip: bool) -> List[str]:
@@ -348,8 +407,16 @@ class _BulkAcc:
         self.original_size = 0
         self.final_size = 0
         self.results: List[Dict[str, Any]] = []
+        self.tiers: Dict[str, Dict[str, float]] = {}
+        self.peak_rss_mb: Optional[float] = None
         self.abort = False
 
+    def _add_tiers(self, tiers: Dict[str, Dict[str, float]]) -> None:
+        for name, row in tiers.items():
+            acc = self.tiers.setdefault(name, {'files': 0, 'seconds': 0.0, 'saved': 0})
+            for key, value in row.items():
+                acc[key] = acc.get(key, 0) + value
+
     def consume(self, result: Optional[Dict[str, Any]], filepath: str) -> None:
         if not result:
             self.failed += 1
@@ -361,6 +428,10 @@ class _BulkAcc:
             self.processed += 1
             self.original_size += result['original_size']
             self.final_size += result['final_size']
+            self._add_tiers(result.get('tiers') or {})
+            peak = result.get('peak_rss_mb')
+            if peak is not None:
+                self.peak_rss_mb = max(peak, self.peak_rss_mb or 0.0)
             self.results.append(result)
             tag = " [DRYRUN]" if self.dryrun else ""
             echo_verbose(
@@ -380,12 +451,47 @@ class _BulkAcc:
             self.abort = not self.continue_on_error
 
 
+_Task = Tuple[Callable[[Dict[str, Any]], Any], Dict[str, Any], List[str]]
+
+
+def _bulk_tasks(all_files: List[str], job_base: Dict[str, Any]) -> List[_Task]:
+    """One task per file, except small same-tool files which share a batch task."""
+    pairs = []
+    for fp in all_files:
+        kind = identify_filename(basename(fp), peek_path=fp)
+        if kind is not None and not kind.is_archive:
+            pairs.append((fp, kind.packer or kind.key))
+    batches, _ = plan_batches(pairs, job_options(job_base).to_dict())
+    first = {group.paths[0]: group for group in batches}
+    batched = {fp for group in batches for fp in group.paths}
+    tasks: List[_Task] = []
+    for fp in all_files:
+        group = first.get(fp)
+        if group is not None:
+            tasks.append((process_batch_job, {
+                **job_base, 'filepaths': group.paths,
+                'packer': group.packer, 'batch_key': group.key,
+            }, group.paths))
+        elif fp not in batched:
+            tasks.append((process_file_job, {**job_base, 'filepath': fp}, [fp]))
+    return tasks
+
+
+def _consume_task(acc: _BulkAcc, result: Any, files: List[str]) -> None:
+    if isinstance(result, list):
+        for item, fp in zip(result, files):
+            acc.consume(item, fp)
+    else:
+        acc.consume(result, files[0])
+
+
 def _run_bulk_jobs(
     all_files: List[str], job_base: Dict[str, Any], job_count: int,
     acc: _BulkAcc, progress: bool, progress_interval: int,
 ) -> None:
     total = len(all_files)
     show_bar = bool(progress) and _verbose_level > 0 and _output_format is None
+    tasks = _bulk_tasks(all_files, job_base)
     with ProgressReporter(
         show_bar,
         interval=progress_interval,
@@ -394,34 +500,31 @@ def _run_bulk_jobs(
     ) as bar:
         if show_bar:
             bar.set_stage("Repacking", total=total)
-        if job_count > 1 and total > 1:
+        done = 0
+        if job_count > 1 and len(tasks) > 1:
             with ProcessPoolExecutor(max_workers=job_count) as pool:
                 future_map = {
-                    pool.submit(
-                        process_file_job, {**job_base, 'filepath': fp}
-                    ): fp
-                    for fp in all_files
+                    pool.submit(func, job): files for func, job, files in tasks
                 }
-                done = 0
                 for fut in as_completed(future_map):
-                    fp = future_map[fut]
+                    files = future_map[fut]
                     try:
-                        acc.consume(fut.result(), fp)
+                        _consume_task(acc, fut.result(), files)
                     except Exception as exc:
-                        acc.consume(
-                            {'status': 'failed', 'file': fp, 'error': str(exc)},
-                            fp,
-                        )
-                    done += 1
-                    bar.update(done, name=fp)
+                        for fp in files:
+                            acc.consume(
+                                {'status': 'failed', 'file': fp, 'error': str(exc)},
+                                fp,
+                            )
+                    done += len(files)
+                    bar.update(done, name=files[-1])
                     if acc.abort:
                         break
             return
-        for i, filepath in enumerate(all_files, 1):
-            acc.consume(
-                process_file_job({**job_base, 'filepath': filepath}), filepath
-            )
-            bar.update(i, name=filepath)
+        for func, job, files in tasks:
+            _consume_task(acc, func(job), files)
+            done += len(files)
+            bar.update(done, name=files[-1])
             if acc.abort:
                 break
 
@@ -439,6 +542,8 @@ def _emit_bulk_summary(acc: _BulkAcc, dryrun: bool, stats: bool, elapsed: float)
             'total_saved': saved,
             'percent_saved': percent,
             'elapsed_time': elapsed,
+            'tiers': acc.tiers,
+            'peak_rss_mb': acc.peak_rss_mb,
         },
         'files': acc.results,
     }
@@ -473,6 +578,14 @@ def _emit_bulk_summary(acc: _BulkAcc, dryrun: bool, stats: bool, elapsed: float)
                 f"  Processing rate: {acc.processed / elapsed:.2f} files/sec",
                 level=1,
             )
+        if acc.peak_rss_mb is not None:
+            echo_verbose(f"  Peak PDF job memory: {acc.peak_rss_mb:.1f} MB", level=1)
+        for name, row in sorted(acc.tiers.items()):
+            echo_verbose(
+                f"  Tier {name}: {int(row['files'])} files, {row['seconds']:.2f}s, "
+                f"saved {format_size(int(row['saved']))}",
+                level=1,
+            )
 
 
 @app.command()
@@ -481,7 +594,7 @@ def bulk(
     skip_zip: bool = typer.Option(
         True, "--skip-zip/--no-skip-zip", help="Skip .zip files"
     ),
-    ultra: bool = typer.Option(False, "--ultra", help="Ultra parquet compression"),
+    ultra: bool = typer.Option(False, "--ultra", help="Stronger lossless passes (slower)"),
     dryrun: bool = typer.Option(False, "--dryrun", help="Do not modify files"),
     deep: bool = typer.Option(True, "--deep/--no-deep", help="Process nested archives"),
     quiet: bool = typer.Option(False, "--quiet", help="Quiet mode"),
@@ -531,10 +644,26 @@ def bulk(
         False, "--keep-meta",
         help="Keep JPEG/PNG metadata (default strips EXIF/ICC)",
     ),
+    threads: Optional[int] = typer.Option(
+        None, "--threads",
+        help="CPU threads per file for concurrent tool trials (default: all cores / jobs)",
+    ),
     max_extract_size: Optional[str] = typer.Option(
         None, "--max-extract-size",
         help="Abort archive extract above this size (0 disables, default 8GB)",
     ),
+    max_memory: Optional[str] = typer.Option(
+        None, "--max-memory",
+        help="Per-job memory ceiling for large PDFs, e.g. 4GB (skips linearization)",
+    ),
+    video_segments: int = typer.Option(
+        0, "--video-segments",
+        help="Encode video as up to N keyframe-aligned segments in parallel (0: off)",
+    ),
+    max_encode_time: Optional[str] = typer.Option(
+        None, "--max-encode-time",
+        help="Skip videos whose predicted encode time exceeds this, e.g. 30m or 2h",
+    ),
     jobs: str = typer.Option("1", "--jobs", help="Parallel jobs (N or 'auto')"),
     continue_on_error: bool = typer.Option(
         False, "--continue-on-error", help="Do not stop on errors"
@@ -575,6 +704,8 @@ def bulk(
     exclude_exts = parse_extensions(exclude_ext) if exclude_ext else None
     skip_dirs = set(DEFAULT_EXCLUDE_DIRS) | parse_dir_names(exclude_dir)
     max_extract_bytes, max_extract_ratio = _max_extract_or_exit(max_extract_size)
+    max_memory_bytes = _max_memory_or_exit(max_memory)
+    max_encode_seconds = _max_encode_time_or_exit(max_encode_time)
     pdf_profile = _pdf_profile_or_exit(pdf_profile)
 
     if dryrun:
@@ -614,6 +745,10 @@ def bulk(
         'keep_meta': keep_meta,
         'max_extract_bytes': max_extract_bytes,
         'max_extract_ratio': max_extract_ratio,
+        'threads': cpu_budget(threads, job_count),
+        'max_memory_bytes': max_memory_bytes,
+        'video_segments': video_segments or None,
+        'max_encode_seconds': max_encode_seconds,
     }
     acc = _BulkAcc(dryrun, continue_on_error)
     start_time = time.time()
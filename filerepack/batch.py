@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+"""Group small same-packer files into one external tool call per batch."""
+
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from os.path import abspath, basename, join
+from shutil import copyfile
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from . import jpeg as jpeg_scan
+from . import png as png_effort
+from .consts import (
+    BATCH_MAX_FILE_BYTES, BATCH_MAX_FILES, DEFAULT_JPEG_QUALITY, SVG_BATCH_MAX_FILES,
+)
+from .models import PackResult
+from .tools import resolve_tool
+
+_TOOLS: Dict[str, str] = {
+    'jpg': 'jpegoptim',
+    'png': 'oxipng',
+    'gif': 'gifsicle',
+    'flac': 'flac',
+    'svg': 'svgo',
+}
+# Per-packer batch size; others use BATCH_MAX_FILES.
+_MAX_FILES: Dict[str, int] = {'svg': SVG_BATCH_MAX_FILES}
+# Tools that write outputs into one directory by input basename.
+_BY_NAME = ('jpg', 'png')
+
+
+def _r() -> Any:
+    from . import repack as r
+    return r
+
+
+@dataclass
+class Batch:
+    """Files packed by one tool call. key separates presets (e.g. ``png:tiny``)."""
+
+    key: str
+    packer: str
+    paths: List[str] = field(default_factory=list)
+
+
+def _batch_key(packer: str, path: str, options: Dict[str, Any]) -> Optional[str]:
+    if not options.get('pack_images', True):
+        return None
+    if packer == 'jpg':
+        if options.get('lossy') or options.get('jpeg_quality') is not None:
+            return packer
+        cls = jpeg_scan.classify(jpeg_scan.scan(path), bool(options.get('keep_meta')))
+        # pack_jpg skips optimal files and strips metadata-only ones in-process.
+        return f'jpeg:{cls}' if cls == jpeg_scan.REOPTIMIZE else None
+    if packer == 'png':
+        # pngquant and zopflipng stay per file; batches are oxipng-only.
+        if options.get('lossy') or options.get('png_quality') or options.get('ultra'):
+            return None
+        return f'png:{png_effort.choose_tier(path).name}'
+    return packer
+
+
+def plan_batches(
+    files: Iterable[Tuple[str, str]], options: Dict[str, Any],
+) -> Tuple[List[Batch], List[str]]:
+    """Split (path, packer key) pairs into tool batches and paths packed one by one.
+
+    Only files up to BATCH_MAX_FILE_BYTES are batched, BATCH_MAX_FILES per batch
+    (SVG_BATCH_MAX_FILES for svgo). Basenames are unique within jpegoptim and
+    oxipng batches because those tools write outputs into one directory by name.
+    """
+    found: Dict[str, Optional[str]] = {}
+    open_batch: Dict[str, Tuple[Batch, Set[str]]] = {}
+    batches: List[Batch] = []
+    rest: List[str] = []
+    for path, packer in files:
+        key = None
+        if packer in _TOOLS:
+            if packer not in found:
+                found[packer] = resolve_tool(_TOOLS[packer])
+            try:
+                small = os.path.getsize(path) <= BATCH_MAX_FILE_BYTES
+            except OSError:
+                small = False
+            if found[packer] and small:
+                key = _batch_key(packer, path, options)
+        if key is None:
+            rest.append(path)
+            continue
+        name = basename(path)
+        current = open_batch.get(key)
+        limit = _MAX_FILES.get(packer) or BATCH_MAX_FILES
+        clash = current is not None and packer in _BY_NAME and name in current[1]
+        if current is None or len(current[0].paths) >= limit or clash:
+            current = (Batch(key, packer), set())
+            open_batch[key] = current
+            batches.append(current[0])
+        current[0].paths.append(path)
+        current[1].add(name)
+    singles = [b for b in batches if len(b.paths) < 2]
+    rest.extend(p for b in singles for p in b.paths)
+    return [b for b in batches if len(b.paths) >= 2], rest
+
+
+def _jpegoptim(batch: Batch, work_dir: str, options: Dict[str, Any]) -> Dict[str, str]:
+    """Lossless: a progressive and a baseline pass, keeping the smaller per file, as the
+    single-file race of jpegtran -progressive against jpegoptim does."""
+    base = [resolve_tool('jpegoptim') or '', '-p', '-o', '-f']
+    if not options.get('keep_meta'):
+        base.append('--strip-all')
+    quality = options.get('jpeg_quality')
+    lossy = quality is not None or options.get('lossy')
+    if lossy:
+        base.append(f'-m{quality if quality is not None else DEFAULT_JPEG_QUALITY}')
+    passes = [('baseline', [])] if lossy else [('progressive', ['--all-progressive']),
+                                              ('baseline', [])]
+    outputs: Dict[str, str] = {}
+    for name, flags in passes:
+        out_dir = join(work_dir, name)
+        os.makedirs(out_dir)
+        cmd = base + flags + ['-d', out_dir] + [abspath(p) for p in batch.paths]
+        _r()._run_command(
+            cmd, quiet=options.get('quiet', False), debug=options.get('debug', False),
+        )
+        for path in batch.paths:
+            out = join(out_dir, basename(path))
+            best = outputs.get(path)
+            if os.path.exists(out) and (
+                best is None or os.path.getsize(out) < os.path.getsize(best)
+            ):
+                outputs[path] = out
+    return outputs
+
+
+def _oxipng(batch: Batch, work_dir: str, options: Dict[str, Any]) -> Dict[str, str]:
+    tier = png_effort.tier_named(batch.key.split(':', 1)[1])
+    cmd = [resolve_tool('oxipng') or '', '-o', tier.oxipng_level]
+    if not options.get('keep_meta'):
+        cmd += ['--strip', 'safe']
+    cmd += ['--timeout', str(tier.timeout), '--force', '-q', '--dir', work_dir]
+    cmd.extend(abspath(p) for p in batch.paths)
+    _r()._run_command(cmd, quiet=options.get('quiet', False), debug=options.get('debug', False))
+    return {p: join(work_dir, basename(p)) for p in batch.paths}
+
+
+def _copies(batch: Batch, work_dir: str, suffix: str) -> Dict[str, str]:
+    """Numbered scratch copies for tools that rewrite their inputs in place."""
+    copies = {}
+    for i, path in enumerate(batch.paths):
+        copies[path] = join(work_dir, f'{i:05d}{suffix}')
+        copyfile(path, copies[path])
+    return copies
+
+
+def _gifsicle(batch: Batch, work_dir: str, options: Dict[str, Any]) -> Dict[str, str]:
+    copies = _copies(batch, work_dir, '.gif')
+    cmd = [resolve_tool('gifsicle') or '', '--batch', '-O3', '--lossy=0']
+    cmd.extend(copies.values())
+    if _r()._run_command(
+        cmd, quiet=options.get('quiet', False), debug=options.get('debug', False),
+    ) is None:
+        # --batch may have rewritten some inputs before failing; redo them one by one.
+        return {}
+    return copies
+
+
+def _flac(batch: Batch, work_dir: str, options: Dict[str, Any]) -> Dict[str, str]:
+    from .covers import optimize_embedded_covers
+
+    in_dir = join(work_dir, 'in')
+    out_dir = join(work_dir, 'out')
+    os.makedirs(in_dir)
+    os.makedirs(out_dir)
+    copies = _copies(batch, in_dir, '.flac')
+    for work in copies.values():
+        optimize_embedded_covers(work, {
+            'debug': options.get('debug', False), 'quiet': options.get('quiet', False),
+            'pack_images': bool(options.get('pack_images', True)),
+            'keep_meta': bool(options.get('keep_meta', False)),
+            'lossy': bool(options.get('lossy', False)),
+            'ultra': bool(options.get('ultra', False)),
+        })
+    cmd = [
+        resolve_tool('flac') or '', '--best', '--verify', '-f',
+        f'--output-prefix={out_dir}{os.sep}',
+    ]
+    cmd.extend(copies.values())
+    _r()._run_command(cmd, quiet=options.get('quiet', False), debug=options.get('debug', False))
+    return {p: join(out_dir, basename(c)) for p, c in copies.items()}
+
+
+def _svgo(batch: Batch, work_dir: str, options: Dict[str, Any]) -> Dict[str, str]:
+    """One Node start for the whole batch: svgo folder mode, then the data-URI pass."""
+    in_dir = join(work_dir, 'in')
+    out_dir = join(work_dir, 'out')
+    os.makedirs(in_dir)
+    os.makedirs(out_dir)
+    copies = _copies(batch, in_dir, '.svg')
+    debug = options.get('debug', False)
+    quiet = options.get('quiet', False)
+    cmd = [resolve_tool('svgo') or '', '--quiet', '-f', in_dir, '-o', out_dir]
+    # A file svgo cannot parse fails the exit code but not the rest of the folder.
+    _r()._run_command(cmd, quiet=quiet, debug=debug)
+    outputs = {p: join(out_dir, basename(c)) for p, c in copies.items()}
+    for out in outputs.values():
+        if os.path.exists(out):
+            _r()._svg_data_uris(
+                out, debug, quiet, lossy=bool(options.get('lossy')),
+                keep_meta=bool(options.get('keep_meta')),
+            )
+    return outputs
+
+
+_RUNNERS: Dict[str, Callable[[Batch, str, Dict[str, Any]], Dict[str, str]]] = {
+    'jpg': _jpegoptim,
+    'png': _oxipng,
+    'gif': _gifsicle,
+    'flac': _flac,
+    'svg': _svgo,
+}
+
+
+def pack_batch(batch: Batch, options: Dict[str, Any]) -> Dict[str, Optional[PackResult]]:
+    """Pack every file of batch with one tool call; commit and verify each output.
+
+    Files whose output is missing or fails verification are packed on their own.
+    """
+    from .containers import staging_dir
+
+    r = _r()
+    debug = options.get('debug', False)
+    ck = r._commit_kwargs(**options)
+    insizes = {p: os.path.getsize(p) for p in batch.paths}
+    results: Dict[str, Optional[PackResult]] = {}
+    with staging_dir('filerepack-batch-') as work_dir:
+        started = time.monotonic()
+        try:
+            outputs = _RUNNERS[batch.packer](batch, work_dir, options)
+        except Exception as exc:
+            if debug:
+                logging.warning('%s batch failed: %s', batch.key, exc)
+            outputs = {}
+        share = (time.monotonic() - started) / len(batch.paths)
+        for path in batch.paths:
+            out = outputs.get(path)
+            res = None
+            if out is not None and os.path.exists(out):
+                res = r._commit_output(out, path, insizes[path], verify=batch.packer, **ck)
+            if res is None:
+                results[path] = r._dispatch_packer(batch.packer, path, options)
+                continue
+            res.method = f'{_TOOLS[batch.packer]} batch'
+            res.elapsed_seconds = share
+            if ':' in batch.key:
+                res.tier = batch.key
+            results[path] = res
+    return results
@@ -9,6 +9,7 @@ from os.path import abspath
 from shutil import copyfile
 from typing import Any, List, Optional
 
+from . import media
 from .models import PackResult
 from .tools import resolve_tool
 
@@ -93,10 +94,12 @@ def pack_compress(
 
 
 def pack_svgz(
-    filepath: str, debug: bool = False, quiet: bool = False, **commit: Any,
+    filepath: str, debug: bool = False, quiet: bool = False,
+    ultra: bool = False, threads: Optional[int] = None, **commit: Any,
 ) -> Optional[PackResult]:
     import gzip
     from shutil import copyfileobj
+    from .deflate import gzip_ultra
     r = _r()
     insize = os.path.getsize(filepath)
     svg_temp = r._make_temp('.svg')
@@ -109,8 +112,9 @@ def pack_svgz(
             svg_temp, debug=debug, quiet=quiet, dryrun=False,
             keep_if_larger=True, min_savings=None,
         )
-        with open(svg_temp, 'rb') as f_in, gzip.open(gz_temp, 'wb', compresslevel=9) as f_out:
-            copyfileobj(f_in, f_out, length=r._COPY_BUF)
+        if not (ultra and gzip_ultra(svg_temp, gz_temp, debug=debug, threads=threads)):
+            with open(svg_temp, 'rb') as f_in, gzip.open(gz_temp, 'wb', compresslevel=9) as f_out:
+                copyfileobj(f_in, f_out, length=r._COPY_BUF)
         return r._commit_output(
             gz_temp, filepath, insize, verify='svgz', **r._commit_kwargs(**commit)
         )
@@ -123,31 +127,49 @@ def pack_svgz(
 
 def pack_jxl(
     filepath: str, debug: bool = False, quiet: bool = False,
-    lossy: bool = False, **commit: Any,
+    lossy: bool = False, threads: Optional[int] = None, **commit: Any,
 ) -> Optional[PackResult]:
+    """Lossless: cjxl -e from the size preset. JPEG reconstruction data (jbrd) is kept
+    by going through the reconstructed JPEG instead of a PNG."""
     cjxl = resolve_tool('cjxl')
     djxl = resolve_tool('djxl')
     if cjxl is None or djxl is None:
         return None
+    from .effort import choose_effort, jxl_has_jpeg_reconstruction
+    from .png import png_dimensions
+    from .utils import cpu_budget
+
     r = _r()
     insize = os.path.getsize(filepath)
-    png_temp = r._make_temp('.png')
+    reconstruct = not lossy and jxl_has_jpeg_reconstruction(filepath)
+    decoded = r._make_temp('.jpg' if reconstruct else '.png')
     out_temp = r._make_temp('.jxl')
     ck = r._commit_kwargs(**commit)
     try:
         if r._run_command(
-            [djxl, abspath(filepath), png_temp], quiet=quiet, debug=debug
+            [djxl, abspath(filepath), decoded], quiet=quiet, debug=debug
         ) is None:
             return None
+        tier = choose_effort(None if reconstruct else png_dimensions(decoded))
+        encode = [
+            cjxl, decoded, out_temp, '-e', str(tier.jxl_effort),
+            '--num_threads', str(cpu_budget(threads)),
+        ]
         if lossy:
-            encode = [cjxl, png_temp, out_temp, '-q', '85']
+            encode += ['-q', '85']
+        elif reconstruct:
+            encode += ['--lossless_jpeg=1']
         else:
-            encode = [cjxl, png_temp, out_temp, '-d', '0']
+            encode += ['-d', '0']
         if r._run_command(encode, quiet=quiet, debug=debug) is None:
             return None
-        return r._commit_output(out_temp, filepath, insize, verify='jxl', **ck)
+        res = r._commit_output(out_temp, filepath, insize, verify='jxl', **ck)
+        if res is not None:
+            res.method = 'cjxl jpeg' if reconstruct else 'cjxl'
+            res.tier = f'jxl:{tier.name}'
+        return res
     finally:
-        r._remove_quietly(png_temp)
+        r._remove_quietly(decoded)
         r._remove_quietly(out_temp)
 
 
@@ -176,28 +198,40 @@ def _pack_magick(
     )
 
 
+def _pack_raster(
+    filepath: str, suffix: str, kind: str,
+    debug: bool = False, quiet: bool = False, **commit: Any,
+) -> Optional[PackResult]:
+    """Pillow (or built-in PNM) re-encode first; ImageMagick only when that is unavailable."""
+    from .raster import pack_raster
+    res = pack_raster(filepath, kind, suffix, debug=debug, **commit)
+    if res is not None:
+        return res
+    return _pack_magick(filepath, suffix, kind, debug=debug, quiet=quiet, **commit)
+
+
 def pack_bmp(
     filepath: str, debug: bool = False, quiet: bool = False, **commit: Any,
 ) -> Optional[PackResult]:
-    return _pack_magick(filepath, '.bmp', 'bmp', debug=debug, quiet=quiet, **commit)
+    return _pack_raster(filepath, '.bmp', 'bmp', debug=debug, quiet=quiet, **commit)
 
 
 def pack_tga(
     filepath: str, debug: bool = False, quiet: bool = False, **commit: Any,
 ) -> Optional[PackResult]:
-    return _pack_magick(filepath, '.tga', 'tga', debug=debug, quiet=quiet, **commit)
+    return _pack_raster(filepath, '.tga', 'tga', debug=debug, quiet=quiet, **commit)
 
 
 def pack_pnm(
     filepath: str, debug: bool = False, quiet: bool = False, **commit: Any,
 ) -> Optional[PackResult]:
-    return _pack_magick(filepath, '.pnm', 'pnm', debug=debug, quiet=quiet, **commit)
+    return _pack_raster(filepath, '.pnm', 'pnm', debug=debug, quiet=quiet, **commit)
 
 
 def pack_pcx(
     filepath: str, debug: bool = False, quiet: bool = False, **commit: Any,
 ) -> Optional[PackResult]:
-    return _pack_magick(filepath, '.pcx', 'pcx', debug=debug, quiet=quiet, **commit)
+    return _pack_raster(filepath, '.pcx', 'pcx', debug=debug, quiet=quiet, **commit)
 
 
 def pack_xml(
@@ -247,8 +281,18 @@ def pack_jp2(
 
 
 def pack_exr(
-    filepath: str, debug: bool = False, quiet: bool = False, **commit: Any,
+    filepath: str, debug: bool = False, quiet: bool = False,
+    threads: Optional[int] = None, **commit: Any,
 ) -> Optional[PackResult]:
+    """oiiotool lossless codec trials per file; ImageMagick Zip when oiiotool is missing."""
+    from .exr import pack_oiiotool, read_header
+
+    oiiotool_path = resolve_tool('oiiotool')
+    info = read_header(filepath) if oiiotool_path else None
+    if info is not None:
+        return pack_oiiotool(
+            filepath, oiiotool_path, info, threads=threads, debug=debug, quiet=quiet, **commit,
+        )
     return _pack_magick(
         filepath, '.exr', 'exr', extra=['-compress', 'Zip'],
         debug=debug, quiet=quiet, **commit,
@@ -288,11 +332,21 @@ def pack_dcm(
 
 
 def pack_dng(
-    filepath: str, debug: bool = False, quiet: bool = False, **commit: Any,
+    filepath: str, debug: bool = False, quiet: bool = False,
+    threads: Optional[int] = None, **commit: Any,
 ) -> Optional[PackResult]:
+    """Deflate only (the DNG spec's lossless codec); with and without predictor."""
+    from .tiff import pack_tiffcp, read_info, trial_specs
+
     tiffcp_path = resolve_tool('tiffcp')
     if tiffcp_path is None:
         return None
+    info = read_info(filepath)
+    if info is not None:
+        return pack_tiffcp(
+            filepath, tiffcp_path, info, trial_specs(info, zip_only=True), '.dng', 'dng',
+            threads=threads, debug=debug, quiet=quiet, sample=False, restrip=False, **commit,
+        )
     r = _r()
     insize = os.path.getsize(filepath)
     out_temp = r._make_temp('.dng')
@@ -308,22 +362,34 @@ def pack_dng(
     )
 
 
-def pack_ico(
-    filepath: str, debug: bool = False, quiet: bool = False, **commit: Any,
+def _pack_icon(
+    filepath: str, suffix: str, kind: str, debug: bool = False, quiet: bool = False,
+    threads: Optional[int] = None, ultra: bool = False, keep_meta: bool = False,
+    **commit: Any,
 ) -> Optional[PackResult]:
+    """Embedded PNG entries through pack_png; ImageMagick only when the TOC does not parse."""
+    from .icons import pack_icon
+    res = pack_icon(
+        filepath, kind, threads=threads, debug=debug, quiet=quiet,
+        ultra=ultra, keep_meta=keep_meta, **commit,
+    )
+    if res is not None:
+        return res
     return _pack_magick(
-        filepath, '.ico', 'ico', extra=['-strip'],
-        debug=debug, quiet=quiet, **commit,
+        filepath, suffix, kind, extra=['-strip'], debug=debug, quiet=quiet, **commit,
     )
 
 
+def pack_ico(
+    filepath: str, debug: bool = False, quiet: bool = False, **commit: Any,
+) -> Optional[PackResult]:
+    return _pack_icon(filepath, '.ico', 'ico', debug=debug, quiet=quiet, **commit)
+
+
 def pack_icns(
     filepath: str, debug: bool = False, quiet: bool = False, **commit: Any,
 ) -> Optional[PackResult]:
-    return _pack_magick(
-        filepath, '.icns', 'icns', extra=['-strip'],
-        debug=debug, quiet=quiet, **commit,
-    )
+    return _pack_icon(filepath, '.icns', 'icns', debug=debug, quiet=quiet, **commit)
 
 
 def pack_mov(
@@ -366,7 +432,8 @@ def pack_ts(
     )
 
 
-def _probe_audio_codec(filepath: str, ffmpeg: str, debug: bool) -> str:
+def _ffmpeg_audio_codec(filepath: str, ffmpeg: str, debug: bool) -> str:
+    """Audio codec from the `ffmpeg -i` banner, for installs without ffprobe."""
     import logging
     import subprocess
     try:
@@ -391,6 +458,15 @@ def _probe_audio_codec(filepath: str, ffmpeg: str, debug: bool) -> str:
     return ''
 
 
+def _probe_audio_codec(filepath: str, debug: bool) -> str:
+    """ffprobe codec_name of the first audio stream, else the ffmpeg banner ('' when unknown)."""
+    info = media.probe(filepath, debug=debug)
+    if info is not None:
+        return info.audio_codec
+    ffmpeg = resolve_tool('ffmpeg')
+    return _ffmpeg_audio_codec(filepath, ffmpeg, debug) if ffmpeg else ''
+
+
 def _pack_ffmpeg_audio(
     filepath: str, codec: str, suffix: str, verify: str,
     allowed: tuple, debug: bool = False, quiet: bool = False, **commit: Any,
@@ -399,7 +475,7 @@ def _pack_ffmpeg_audio(
     if ffmpeg is None:
         return None
     r = _r()
-    found = _probe_audio_codec(filepath, ffmpeg, debug)
+    found = _probe_audio_codec(filepath, debug)
     if found and found not in allowed:
         return None
     insize = os.path.getsize(filepath)
@@ -460,9 +536,7 @@ def pack_oga(
     filepath: str, debug: bool = False, quiet: bool = False, **commit: Any,
 ) -> Optional[PackResult]:
     ffmpeg = resolve_tool('ffmpeg')
-    found = ''
-    if ffmpeg:
-        found = _probe_audio_codec(filepath, ffmpeg, debug)
+    found = _probe_audio_codec(filepath, debug)
     if found in ('vorbis', 'opus'):
         return pack_ogg(filepath, debug=debug, quiet=quiet, **commit)
     r = _r()
@@ -88,7 +88,64 @@ ZIP_SENSITIVE_EXTS = [
 ]
 
 DEFAULT_JPEG_QUALITY = 85
+# cwebp -q for re-encoding lossy WebP under --lossy.
+DEFAULT_WEBP_QUALITY = 80
 PDF_PROFILES = ('screen', 'ebook', 'printer', 'prepress', 'default')
 DEFAULT_LOSSY_PDF_PROFILE = 'ebook'
 DEFAULT_MAX_EXTRACT_BYTES = 8 * 1024 ** 3
 DEFAULT_MAX_EXTRACT_RATIO = 100.0
+# --ultra deflate: zopfli iterations by payload size (bytes, iterations).
+ULTRA_DEFLATE_ITERATIONS = (
+    (256 * 1024, 100),
+    (4 * 1024 ** 2, 30),
+    (64 * 1024 ** 2, 10),
+    (1024 ** 4, 3),
+)
+# Chunk size for concurrent zopfli members in tarball gzip.
+ULTRA_DEFLATE_CHUNK = 8 * 1024 ** 2
+# Race candidates marked slow (zopflipng) are dropped after this once another
+# candidate has produced an output.
+RACE_SLOW_CANDIDATE_SECONDS = 600
+# Grow watchdog: project final output size once this share of the input has been
+# read, and kill only when the projection exceeds the bound by this margin.
+GROW_WATCH_MIN_FRACTION = 0.25
+GROW_WATCH_MARGIN = 1.15
+# PNGs at or below this size use the cheapest effort tier.
+PNG_TINY_BYTES = 8 * 1024
+# Small JPEG/PNG/GIF/FLAC files are grouped into one tool call of up to
+# BATCH_MAX_FILES inputs (bulk and deep walks).
+BATCH_MAX_FILE_BYTES = 64 * 1024
+BATCH_MAX_FILES = 64
+# svgo folder-mode batches: Node startup dominates small SVGs, so batches are larger.
+SVG_BATCH_MAX_FILES = 512
+# TIFFs larger than this pick a tiffcp codec/predictor from trials on a sample
+# of TIFF_SAMPLE_BYTES uncompressed rows, then rewrite once.
+TIFF_SAMPLE_BYTES = 4 * 1024 ** 2
+# Target uncompressed strip size for tiffcp rewrites (-r rows per strip).
+TIFF_STRIP_BYTES = 256 * 1024
+# EXR images above twice this pixel count pick a codec from trials on a cut of
+# about this many pixels, then rewrite once.
+EXR_SAMPLE_PIXELS = 1_000_000
+# PDFs at or above this size (or any PDF under --max-memory) open memory-mapped and
+# have their image streams packed in batches of about PDF_STREAM_BATCH_BYTES.
+PDF_LARGE_BYTES = 1024 ** 3
+PDF_STREAM_BATCH_BYTES = 64 * 1024 ** 2
+# Flate streams inflating past this are left as they are (decompression bombs, and
+# huge streams whose raw bytes and recompressed copies would blow --max-memory).
+PDF_REDEFLATE_MAX_BYTES = 256 * 1024 ** 2
+# Linearization needs the whole object graph in memory; under --max-memory it is
+# skipped when the file size times this factor exceeds the ceiling.
+PDF_LINEARIZE_RSS_FACTOR = 2
+# Lossy PDFs of at least PDF_GS_RANGE_MIN_BYTES with at least twice this many pages
+# run Ghostscript over page ranges of at least this many pages in parallel (within
+# --threads), then merge.
+PDF_GS_RANGE_MIN_PAGES = 32
+PDF_GS_RANGE_MIN_BYTES = 4 * 1024 ** 2
+# --video-segments: each parallel segment covers at least this much of the timeline.
+VIDEO_SEGMENT_MIN_SECONDS = 30
+# Video pre-flight: files at least VIDEO_PREFLIGHT_MIN_SECONDS long encode this many
+# samples of VIDEO_SAMPLE_SECONDS spread over the timeline to predict output size
+# and encode time before the full encode.
+VIDEO_PREFLIGHT_MIN_SECONDS = 60
+VIDEO_PREFLIGHT_SAMPLES = 3
+VIDEO_SAMPLE_SECONDS = 4
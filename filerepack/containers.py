@@ -2,14 +2,22 @@
 
 """Extract nested assets, run existing packers, reinsert mappings."""
 
+import atexit
 import os
 import shutil
 import tempfile
+import threading
 from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Any, Dict, Iterator, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
+from . import png as png_effort
 from .formats import identify_filename
+from .tools import resolve_tool
+
+_MAGIC = {'.jpg': b'\xff\xd8\xff', '.png': b'\x89PNG\r\n\x1a\n', '.webp': b'RIFF'}
+_scratch = threading.local()
+_scratch_dirs: List[str] = []
 
 
 @dataclass
@@ -75,3 +83,99 @@ def pack_members(
 def shrunken_paths(results: Dict[str, MemberResult]) -> Dict[str, str]:
     """Map original keys to packed paths for members that got smaller."""
     return {key: item.path for key, item in results.items() if item.shrank}
+
+
+def _cleanup_scratch() -> None:
+    for path in _scratch_dirs:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+atexit.register(_cleanup_scratch)
+
+
+def scratch_dir() -> str:
+    """This thread's reusable scratch directory, removed at interpreter exit."""
+    path = getattr(_scratch, 'path', None)
+    if path is None or not os.path.isdir(path):
+        path = tempfile.mkdtemp(prefix='filerepack-blob-')
+        _scratch.path = path
+        _scratch_dirs.append(path)
+    return path
+
+
+def pipe_command(data: bytes, ext: str, options: Dict[str, Any]) -> Optional[List[str]]:
+    """stdin/stdout argv for lossless jpegtran, oxipng or cwebp; None means use a file.
+
+    Lossy, quality and --ultra runs need the full packer, as do WebPs that are not
+    plain lossless stills.
+    """
+    if not data.startswith(_MAGIC.get(ext, b'-')):
+        return None
+    if options.get('lossy') or options.get('ultra'):
+        return None
+    keep_meta = bool(options.get('keep_meta'))
+    if ext == '.jpg' and options.get('jpeg_quality') is None:
+        path = resolve_tool('jpegtran')
+        if path is None:
+            return None
+        return [path, '-optimize', '-progressive', '-copy', 'all' if keep_meta else 'none']
+    if ext == '.png' and options.get('png_quality') is None:
+        path = resolve_tool('oxipng')
+        if path is None:
+            return None
+        dims = png_effort.header_dimensions(data[:24])
+        tier = png_effort.tier_for(len(data), dims[0] * dims[1] if dims else 0)
+        cmd = [path, '-o', tier.oxipng_level]
+        if not keep_meta:
+            cmd += ['--strip', 'safe']
+        return cmd + ['--timeout', str(tier.timeout), '-q', '--stdout', '-']
+    if ext == '.webp' and data[8:16] == b'WEBPVP8L':
+        path = resolve_tool('cwebp')
+        if path is None:
+            return None
+        return [
+            path, '-mt', '-metadata', 'none', '-lossless', '-exact', '-z', '9',
+            '-quiet', '-o', '-', '--', '-',
+        ]
+    return None
+
+
+def _pack_through_file(data: bytes, ext: str, options: Dict[str, Any]) -> Optional[bytes]:
+    path = os.path.join(scratch_dir(), 'blob' + ext)
+    try:
+        with open(path, 'wb') as fh:
+            fh.write(data)
+        result = pack_members({'blob': path}, options).get('blob')
+        if result is None or not result.shrank:
+            return None
+        with open(path, 'rb') as fh:
+            return fh.read()
+    except OSError:
+        return None
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def pack_bytes(
+    data: bytes, ext: str, options: Optional[Dict[str, Any]] = None,
+) -> Optional[bytes]:
+    """Pack an in-memory payload; the smaller bytes, or None when nothing shrank.
+
+    Tools that filter stdin to stdout run without touching disk. Everything else
+    is written once into a per-thread scratch directory and dispatched like an
+    extracted member. Safe to call from worker threads.
+    """
+    from .repack import _run_pipe
+
+    opts: Dict[str, Any] = dict(options or {})
+    if not data:
+        return None
+    cmd = pipe_command(data, ext, opts)
+    if cmd is not None:
+        out = _run_pipe(cmd, data, quiet=bool(opts.get('quiet')), debug=bool(opts.get('debug')))
+        if out is not None and out.startswith(_MAGIC[ext]):
+            return out if len(out) < len(data) else None
+    return _pack_through_file(data, ext, opts)
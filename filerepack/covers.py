@@ -2,10 +2,9 @@
 
 """Extract and recompress attached pictures in audio tags."""
 
-import os
 from typing import Any, Callable, List, Optional, Tuple
 
-from .containers import pack_members, staging_dir
+from .containers import pack_bytes
 
 
 _MIME_EXT = {
@@ -31,15 +30,7 @@ def _pack_picture(
     ext = _MIME_EXT.get((mime or '').split(';', 1)[0].strip().lower())
     if ext is None or not data:
         return None
-    with staging_dir() as tmp:
-        path = os.path.join(tmp, 'cover' + ext)
-        with open(path, 'wb') as fh:
-            fh.write(data)
-        result = pack_members({'cover': path}, options).get('cover')
-        if result is None or not result.shrank:
-            return None
-        with open(result.path, 'rb') as fh:
-            return fh.read()
+    return pack_bytes(data, ext, options)
 
 
 def _mp3_covers(path: str, options: Optional[dict]) -> bool:
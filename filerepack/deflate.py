@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+"""Zopfli-grade deflate for --ultra gzip output (pigz -11, ECT, zopfli), and
+re-deflating single zlib streams (PDF FlateDecode) via redeflate."""
+
+import logging
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from shutil import copyfile, copyfileobj
+from typing import Any, List, Optional
+
+from .consts import ULTRA_DEFLATE_CHUNK, ULTRA_DEFLATE_ITERATIONS
+from .models import PackResult
+from .tools import resolve_tool
+from .utils import cpu_budget
+
+# In-memory binding fallback only; larger payloads use level 9 instead.
+_BINDING_MAX_BYTES = 64 * 1024 * 1024
+# 7-Zip's strongest Deflate settings for ZIP writes.
+ZIP_ULTRA_FLAGS = ['-mm=Deflate', '-mfb=258', '-mpass=15']
+
+
+def _r() -> Any:
+    from . import repack as r
+    return r
+
+
+def zopfli_iterations(size: int) -> int:
+    """Iteration budget: many passes for small assets, few for large ones."""
+    for limit, iterations in ULTRA_DEFLATE_ITERATIONS:
+        if size <= limit:
+            return iterations
+    return ULTRA_DEFLATE_ITERATIONS[-1][1]
+
+
+def redeflate(
+    blob: bytes, ultra: bool = False, max_raw: Optional[int] = None,
+) -> Optional[bytes]:
+    """Re-deflate a zlib stream at level 9 (zopfli binding under ultra when installed).
+
+    None unless the result is smaller and inflates to exactly the same bytes.
+    Trailing data after the zlib stream is not carried over, so such blobs are kept,
+    as are streams inflating past max_raw bytes (inflation stops there).
+    """
+    try:
+        inflater = zlib.decompressobj()
+        raw = inflater.decompress(blob, max_raw or 0)
+        if not inflater.eof or inflater.unused_data or inflater.unconsumed_tail:
+            return None
+        out = zlib.compress(raw, 9)
+        if ultra and len(raw) <= _BINDING_MAX_BYTES:
+            try:
+                import zopfli.zlib
+                out = min(
+                    out, zopfli.zlib.compress(raw, numiterations=zopfli_iterations(len(raw))),
+                    key=len,
+                )
+            except ImportError:
+                pass
+        if len(out) >= len(blob) or zlib.decompress(out) != raw:
+            return None
+    except zlib.error:
+        return None
+    return out
+
+
+def _gzip_pigz(src: str, dest: str, iterations: int, threads: int, debug: bool) -> bool:
+    pigz = resolve_tool('pigz')
+    if pigz is None:
+        return False
+    cmd = [pigz, '-11', '-I', str(iterations), '-p', str(threads), '-n', '-c', src]
+    return _r()._run_to_file(cmd, dest, debug)
+
+
+def _gzip_ect(src: str, dest: str, debug: bool) -> bool:
+    """ECT writes <input>.gz next to its input, so work on a scratch copy."""
+    ect = resolve_tool('ect')
+    if ect is None:
+        return False
+    from .containers import staging_dir
+    with staging_dir('filerepack-ect-') as work_dir:
+        work = os.path.join(work_dir, 'payload')
+        copyfile(src, work)
+        r = _r()
+        if r._run_command([ect, '-9', '-gzip', '--mt-deflate', work], debug=debug) is None:
+            return False
+        produced = work + '.gz'
+        if not os.path.exists(produced) or os.path.getsize(produced) == 0:
+            return False
+        copyfile(produced, dest)
+    return True
+
+
+def _split_chunks(src: str, work_dir: str) -> List[str]:
+    chunks: List[str] = []
+    with open(src, 'rb') as f_in:
+        while True:
+            data = f_in.read(ULTRA_DEFLATE_CHUNK)
+            if not data:
+                break
+            path = os.path.join(work_dir, f'chunk{len(chunks):05d}')
+            with open(path, 'wb') as f_out:
+                f_out.write(data)
+            chunks.append(path)
+    return chunks
+
+
+def _gzip_zopfli(
+    src: str, dest: str, iterations: int, threads: int,
+    members: bool, debug: bool,
+) -> bool:
+    """zopfli CLI. members=True compresses chunks concurrently (RFC 1952 multi-member)."""
+    zopfli = resolve_tool('zopfli')
+    if zopfli is None:
+        return False
+    r = _r()
+    flags = [zopfli, f'--i{iterations}', '-c']
+    size = os.path.getsize(src)
+    if not members or threads < 2 or size <= ULTRA_DEFLATE_CHUNK:
+        return r._run_to_file(flags + [src], dest, debug)
+
+    from .containers import staging_dir
+    with staging_dir('filerepack-zopfli-') as work_dir:
+        chunks = _split_chunks(src, work_dir)
+
+        def _one(chunk: str) -> bool:
+            return r._run_to_file(flags + [chunk], chunk + '.gz', debug)
+
+        with ThreadPoolExecutor(max_workers=min(threads, len(chunks))) as pool:
+            if not all(pool.map(_one, chunks)):
+                return False
+        with open(dest, 'wb') as f_out:
+            for chunk in chunks:
+                with open(chunk + '.gz', 'rb') as f_in:
+                    copyfileobj(f_in, f_out, length=r._COPY_BUF)
+    return os.path.getsize(dest) > 0
+
+
+def _gzip_binding(src: str, dest: str, iterations: int, debug: bool) -> bool:
+    try:
+        import zopfli.gzip
+    except ImportError:
+        return False
+    if os.path.getsize(src) > _BINDING_MAX_BYTES:
+        return False
+    try:
+        with open(src, 'rb') as fh:
+            data = zopfli.gzip.compress(fh.read(), numiterations=iterations)
+        with open(dest, 'wb') as fh:
+            fh.write(data)
+    except Exception as exc:
+        if debug:
+            logging.warning('zopfli binding failed: %s', exc)
+        return False
+    return len(data) > 0
+
+
+def gzip_ultra(
+    src: str, dest: str, debug: bool = False,
+    members: bool = False, threads: Optional[int] = None,
+) -> bool:
+    """Write src as gzip with zopfli-grade deflate. False when no engine is available.
+
+    Tries pigz -11 (zopfli inside pigz, parallel blocks, one stream), then ECT,
+    then the zopfli CLI, then the zopfli Python binding. Multi-member output is
+    only produced when members=True (tarballs); .gz and .svgz stay single-member.
+    """
+    iterations = zopfli_iterations(os.path.getsize(src))
+    workers = cpu_budget(threads)
+    if _gzip_pigz(src, dest, iterations, workers, debug):
+        return True
+    if _gzip_ect(src, dest, debug):
+        return True
+    if _gzip_zopfli(src, dest, iterations, workers, members, debug):
+        return True
+    if _gzip_binding(src, dest, iterations, debug):
+        return True
+    if debug:
+        logging.info('no ultra deflate engine (pigz/ect/zopfli); using level 9')
+    return False
+
+
+def pack_gzip_ultra(
+    filepath: str, debug: bool = False, threads: Optional[int] = None,
+    **commit: Any,
+) -> Optional[PackResult]:
+    """Decompress a .gz and recompress with gzip_ultra. None = use level 9."""
+    import gzip
+    r = _r()
+    insize = os.path.getsize(filepath)
+    dec_temp = r._make_temp('.bin')
+    out_temp = r._make_temp('.gz')
+    try:
+        with gzip.open(filepath, 'rb') as f_in, open(dec_temp, 'wb') as f_out:
+            copyfileobj(f_in, f_out, length=r._COPY_BUF)
+        if not gzip_ultra(dec_temp, out_temp, debug=debug, threads=threads):
+            return None
+        return r._commit_output(
+            out_temp, filepath, insize, verify='gz', **r._commit_kwargs(**commit)
+        )
+    except Exception as exc:
+        if debug:
+            logging.warning('.gz ultra repack failed: %s', exc)
+        return None
+    finally:
+        r._remove_quietly(dec_temp)
+        r._remove_quietly(out_temp)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""Speed/effort presets for AVIF, JPEG XL and HEIC encoders, picked from pixel count."""
+
+import struct
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+# ISOBMFF 'ispe' boxes sit in meta/iprp near the start of AVIF/HEIC files.
+_ISPE_SCAN_BYTES = 256 * 1024
+_JXL_CONTAINER = b'\x00\x00\x00\x0cJXL \r\n\x87\n'
+
+
+@dataclass(frozen=True)
+class EncoderEffort:
+    """avifenc --speed (0 slowest..10), cjxl -e (1..9), libheif speed (0..9)."""
+
+    name: str
+    max_pixels: Optional[int]
+    avif_speed: int
+    jxl_effort: int
+    heic_speed: int
+
+
+EFFORT_TIERS: Tuple[EncoderEffort, ...] = (
+    EncoderEffort('small', 1_000_000, 4, 9, 2),
+    EncoderEffort('medium', 8_000_000, 6, 7, 4),
+    EncoderEffort('large', 32_000_000, 8, 5, 6),
+    EncoderEffort('huge', None, 9, 3, 8),
+)
+
+
+def choose_effort(dims: Optional[Tuple[int, int]]) -> EncoderEffort:
+    """Slower presets for small images; unknown size gets the medium preset."""
+    if dims is None:
+        return EFFORT_TIERS[1]
+    pixels = dims[0] * dims[1]
+    for tier in EFFORT_TIERS:
+        if tier.max_pixels is None or pixels <= tier.max_pixels:
+            return tier
+    return EFFORT_TIERS[-1]
+
+
+def isobmff_dimensions(filepath: str) -> Optional[Tuple[int, int]]:
+    """Largest 'ispe' (image spatial extents) in an AVIF/HEIC header, or None."""
+    try:
+        with open(filepath, 'rb') as fh:
+            data = fh.read(_ISPE_SCAN_BYTES)
+    except OSError:
+        return None
+    best = None
+    pos = data.find(b'ispe')
+    while pos != -1 and pos + 16 <= len(data):
+        width, height = struct.unpack('>II', data[pos + 8:pos + 16])
+        if width and height and (best is None or width * height > best[0] * best[1]):
+            best = (width, height)
+        pos = data.find(b'ispe', pos + 4)
+    return best
+
+
+def jxl_has_jpeg_reconstruction(filepath: str) -> bool:
+    """True when a JPEG XL container carries a 'jbrd' box (losslessly recompressed JPEG)."""
+    try:
+        with open(filepath, 'rb') as fh:
+            if fh.read(12) != _JXL_CONTAINER:
+                return False
+            while True:
+                head = fh.read(8)
+                if len(head) < 8:
+                    return False
+                size, box = struct.unpack('>I4s', head)
+                if box == b'jbrd':
+                    return True
+                if size == 1:
+                    large = fh.read(8)
+                    if len(large) < 8:
+                        return False
+                    size = struct.unpack('>Q', large)[0] - 8
+                if size == 0 or size < 8:
+                    return False
+                fh.seek(size - 8, 1)
+    except OSError:
+        return False
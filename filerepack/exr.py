@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+"""OpenEXR header parsing and per-codec oiiotool trials on a scanline sample."""
+
+import struct
+import time
+from dataclasses import dataclass
+from os.path import abspath
+from typing import Any, BinaryIO, List, Optional, Sequence, Tuple
+
+from . import race
+from .consts import EXR_SAMPLE_PIXELS
+from .models import PackResult
+
+EXR_MAGIC = b'\x76\x2f\x31\x01'
+COMPRESSIONS = ('none', 'rle', 'zips', 'zip', 'piz', 'pxr24', 'b44', 'b44a', 'dwaa', 'dwab')
+UINT, HALF, FLOAT = 0, 1, 2
+_MULTIPART = 0x1000
+_NON_IMAGE = 0x800
+_MAX_ATTR_BYTES = 16 * 1024 ** 2
+
+
+@dataclass(frozen=True)
+class ExrPart:
+    """One part: data window origin and size, compression name, channel pixel types."""
+
+    x: int
+    y: int
+    width: int
+    height: int
+    compression: str
+    channel_types: Tuple[int, ...]
+    tiled: bool = False
+
+
+@dataclass(frozen=True)
+class ExrInfo:
+    parts: Tuple[ExrPart, ...]
+
+    @property
+    def pixels(self) -> int:
+        return sum(part.width * part.height for part in self.parts)
+
+
+def _cstr(fh: BinaryIO) -> Optional[bytes]:
+    out = bytearray()
+    while len(out) < 256:
+        ch = fh.read(1)
+        if not ch:
+            return None
+        if ch == b'\x00':
+            return bytes(out)
+        out += ch
+    return None
+
+
+def _channel_types(value: bytes) -> Tuple[int, ...]:
+    types = []
+    pos = 0
+    while pos < len(value) and value[pos] != 0:
+        end = value.index(b'\x00', pos)
+        types.append(struct.unpack('<i', value[end + 1:end + 5])[0])
+        pos = end + 17
+    return tuple(types)
+
+
+def _read_part(fh: BinaryIO) -> Optional[ExrPart]:
+    window = compression = None
+    channels: Tuple[int, ...] = ()
+    tiled = False
+    while True:
+        name = _cstr(fh)
+        if name is None:
+            return None
+        if not name:
+            break
+        if _cstr(fh) is None:
+            return None
+        size = struct.unpack('<i', fh.read(4))[0]
+        if size < 0 or size > _MAX_ATTR_BYTES:
+            return None
+        value = fh.read(size)
+        if len(value) < size:
+            return None
+        if name == b'dataWindow' and size == 16:
+            window = struct.unpack('<4i', value)
+        elif name == b'compression' and size == 1:
+            compression = value[0]
+        elif name == b'channels':
+            channels = _channel_types(value)
+        elif name == b'tiles':
+            tiled = True
+        elif name == b'type' and value.startswith(b'deep'):
+            return None
+    if window is None or compression is None or compression >= len(COMPRESSIONS):
+        return None
+    xmin, ymin, xmax, ymax = window
+    if xmax < xmin or ymax < ymin:
+        return None
+    return ExrPart(
+        xmin, ymin, xmax - xmin + 1, ymax - ymin + 1,
+        COMPRESSIONS[compression], channels, tiled,
+    )
+
+
+def read_header(filepath: str) -> Optional[ExrInfo]:
+    """All part headers; None for deep data, malformed or non-EXR files."""
+    try:
+        with open(filepath, 'rb') as fh:
+            head = fh.read(8)
+            if len(head) < 8 or head[:4] != EXR_MAGIC:
+                return None
+            flags = struct.unpack('<I', head[4:])[0]
+            if flags & _NON_IMAGE:
+                return None
+            parts = []
+            while True:
+                part = _read_part(fh)
+                if part is None:
+                    return None
+                parts.append(part)
+                if not flags & _MULTIPART:
+                    break
+                if fh.peek(1)[:1] == b'\x00':
+                    break
+    except (OSError, struct.error, ValueError):
+        return None
+    return ExrInfo(tuple(parts))
+
+
+def trial_codecs(info: ExrInfo) -> List[str]:
+    """Lossless codecs only: PXR24 without FLOAT channels, B44 without HALF channels."""
+    types = {t for part in info.parts for t in part.channel_types}
+    codecs = ['zip', 'zips', 'piz', 'rle']
+    if FLOAT not in types:
+        codecs.append('pxr24')
+    if HALF not in types:
+        codecs.append('b44')
+    return codecs
+
+
+def _r() -> Any:
+    from . import repack as r
+    return r
+
+
+def candidates(
+    oiiotool_path: str, filepath: str, codecs: Sequence[str], threads: Optional[int],
+    debug: bool, quiet: bool,
+) -> List[race.Candidate]:
+    """One race candidate per codec ('oiiotool <codec>'); -a keeps every part."""
+    src = abspath(filepath)
+
+    def make(codec: str) -> race.Candidate:
+        def run(out: str) -> bool:
+            cmd = [oiiotool_path]
+            if threads:
+                cmd += ['--threads', str(threads)]
+            cmd += ['-a', src, '--compression', codec, '-o', out]
+            return _r()._run_command(cmd, quiet=quiet, debug=debug) is not None
+
+        return race.Candidate(f'oiiotool {codec}', run)
+
+    return [make(codec) for codec in codecs]
+
+
+def pick_codec(
+    filepath: str, oiiotool_path: str, info: ExrInfo, codecs: Sequence[str],
+    threads: Optional[int] = None, debug: bool = False, quiet: bool = False,
+) -> Optional[str]:
+    """Race codecs on an uncompressed cut of the first part's top scanlines."""
+    r = _r()
+    part = info.parts[0]
+    rows = min(part.height, max(32, EXR_SAMPLE_PIXELS // part.width // 32 * 32))
+    sample = r._make_temp('.exr')
+    try:
+        cmd = [
+            oiiotool_path, abspath(filepath),
+            '--cut', f'{part.width}x{rows}+{part.x}+{part.y}',
+            '--compression', 'none', '-o', sample,
+        ]
+        if r._run_command(cmd, quiet=quiet, debug=debug) is None:
+            return None
+        won = race.run_race(
+            sample, candidates(oiiotool_path, sample, codecs, 1, debug, quiet),
+            '.exr', 'exr', threads=threads, debug=debug,
+        )
+    finally:
+        r._remove_quietly(sample)
+    if won is None:
+        return None
+    r._remove_quietly(won[0])
+    return won[1].split(' ', 1)[1]
+
+
+def pack_oiiotool(
+    filepath: str, oiiotool_path: str, info: ExrInfo, threads: Optional[int] = None,
+    debug: bool = False, quiet: bool = False, **commit: Any,
+) -> Optional[PackResult]:
+    """Large images: pick a codec on a sample, then one full rewrite. Else race all codecs.
+
+    metrics carries megapixels and seconds_per_megapixel; tier is exr:sampled or exr:full.
+    """
+    started = time.monotonic()
+    codecs = trial_codecs(info)
+    tier = 'exr:full'
+    if info.pixels > 2 * EXR_SAMPLE_PIXELS:
+        picked = pick_codec(filepath, oiiotool_path, info, codecs, threads, debug, quiet)
+        if picked is not None:
+            codecs, tier = [picked], 'exr:sampled'
+    inner = threads if len(codecs) == 1 else 1
+    res = race.pack_race(
+        filepath, candidates(oiiotool_path, filepath, codecs, inner, debug, quiet),
+        '.exr', 'exr', threads=threads, debug=debug, **commit,
+    )
+    if res is not None:
+        megapixels = info.pixels / 1e6
+        res.tier = tier
+        res.metrics['megapixels'] = round(megapixels, 3)
+        res.metrics['seconds_per_megapixel'] = round(
+            (time.monotonic() - started) / max(megapixels, 1e-6), 4,
+        )
+    return res
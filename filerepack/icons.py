@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""ICO/CUR and ICNS directories: repack embedded PNG entries, rebuild the container."""
+
+import logging
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Tuple
+
+from .models import PackResult
+from .utils import cpu_budget
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def _r() -> Any:
+    from . import repack as r
+    return r
+
+
+def read_ico(data: bytes) -> Optional[Tuple[bytes, List[Tuple[bytes, bytes]]]]:
+    """(header, [(16-byte directory entry, payload)]) or None. Type 1 is ICO, 2 is CUR."""
+    if len(data) < 6:
+        return None
+    reserved, kind, count = struct.unpack('<HHH', data[:6])
+    if reserved != 0 or kind not in (1, 2) or count == 0 or len(data) < 6 + 16 * count:
+        return None
+    entries = []
+    for i in range(count):
+        entry = data[6 + 16 * i:22 + 16 * i]
+        size, offset = struct.unpack('<II', entry[8:])
+        if offset < 6 + 16 * count or offset + size > len(data):
+            return None
+        entries.append((entry, data[offset:offset + size]))
+    return data[:6], entries
+
+
+def write_ico(header: bytes, entries: List[Tuple[bytes, bytes]]) -> bytes:
+    """Directory first, payloads after it in directory order."""
+    offset = 6 + 16 * len(entries)
+    table, payloads = [], []
+    for entry, payload in entries:
+        table.append(entry[:8] + struct.pack('<II', len(payload), offset))
+        payloads.append(payload)
+        offset += len(payload)
+    return header + b''.join(table) + b''.join(payloads)
+
+
+def read_icns(data: bytes) -> Optional[List[Tuple[bytes, bytes]]]:
+    """[(OSType, payload)] in file order, or None."""
+    if len(data) < 8 or data[:4] != b'icns':
+        return None
+    total = struct.unpack('>I', data[4:8])[0]
+    if total > len(data):
+        return None
+    entries = []
+    pos = 8
+    while pos + 8 <= total:
+        ostype, length = struct.unpack('>4sI', data[pos:pos + 8])
+        if length < 8 or pos + length > total:
+            return None
+        entries.append((ostype, data[pos + 8:pos + length]))
+        pos += length
+    return entries if pos == total else None
+
+
+def write_icns(entries: List[Tuple[bytes, bytes]]) -> bytes:
+    """Rebuild; a 'TOC ' entry is regenerated with the new entry lengths."""
+    body = []
+    for ostype, payload in entries:
+        if ostype == b'TOC ':
+            payload = b''.join(
+                struct.pack('>4sI', other, len(data) + 8)
+                for other, data in entries if other != b'TOC '
+            )
+        body.append(struct.pack('>4sI', ostype, len(payload) + 8) + payload)
+    blob = b''.join(body)
+    return b'icns' + struct.pack('>I', len(blob) + 8) + blob
+
+
+def _pack_payloads(
+    payloads: List[bytes], threads: Optional[int], debug: bool, quiet: bool,
+    ultra: bool, keep_meta: bool,
+) -> List[bytes]:
+    """Run each PNG through pack_png concurrently; the original stays when not smaller."""
+    r = _r()
+    workers = min(len(payloads), cpu_budget(threads))
+    inner = max(1, cpu_budget(threads) // max(1, workers))
+
+    def one(payload: bytes) -> bytes:
+        temp = r._make_temp('.png')
+        try:
+            with open(temp, 'wb') as fh:
+                fh.write(payload)
+            res = r.pack_png(
+                temp, debug=debug, quiet=quiet, ultra=ultra, keep_meta=keep_meta,
+                threads=inner, keep_if_larger=True,
+            )
+            if res is None or not res.replaced:
+                return payload
+            with open(temp, 'rb') as fh:
+                packed = fh.read()
+            return packed if packed.startswith(PNG_SIGNATURE) else payload
+        except OSError as exc:
+            if debug:
+                logging.warning('icon PNG entry failed: %s', exc)
+            return payload
+        finally:
+            r._remove_quietly(temp)
+
+    if workers <= 1:
+        return [one(payload) for payload in payloads]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(one, payloads))
+
+
+def pack_icon(
+    filepath: str, kind: str, threads: Optional[int] = None, debug: bool = False,
+    quiet: bool = False, ultra: bool = False, keep_meta: bool = False, **commit: Any,
+) -> Optional[PackResult]:
+    """kind is 'ico' or 'icns'. None when the directory does not parse.
+
+    Containers without PNG entries are left alone (method 'skip'); other entries are
+    copied byte for byte.
+    """
+    r = _r()
+    try:
+        with open(filepath, 'rb') as fh:
+            data = fh.read()
+    except OSError:
+        return None
+    if kind == 'ico':
+        parsed = read_ico(data)
+        entries = parsed[1] if parsed else None
+        verify = 'cur' if data[2:4] == b'\x02\x00' else 'ico'
+    else:
+        entries = read_icns(data)
+        verify = 'icns'
+    if not entries:
+        return None
+    indexes = [i for i, (_k, payload) in enumerate(entries) if payload.startswith(PNG_SIGNATURE)]
+    if not indexes:
+        return PackResult(filepath, len(data), len(data), 0.0, replaced=False, method='skip')
+    packed = _pack_payloads(
+        [entries[i][1] for i in indexes], threads, debug, quiet, bool(ultra), bool(keep_meta),
+    )
+    for i, payload in zip(indexes, packed):
+        entries[i] = (entries[i][0], payload)
+    if kind == 'ico':
+        out = write_ico(parsed[0], entries)
+    else:
+        out = write_icns(entries)
+    temp = r._make_temp('.' + kind)
+    with open(temp, 'wb') as fh:
+        fh.write(out)
+    res = r._commit_output(temp, filepath, len(data), verify=verify, **r._commit_kwargs(**commit))
+    if res is not None:
+        res.method = 'icon png'
+    return res
@@ -93,6 +93,10 @@ PACKAGES: Dict[str, Dict[str, str]] = {
         'dnf': 'libtiff', 'pacman': 'libtiff', 'zypper': 'tiff',
         'apk': 'tiff', 'choco': 'libtiff',
     },
+    'oiiotool': {
+        'brew': 'openimageio', 'ports': 'openimageio', 'apt': 'openimageio-tools',
+        'dnf': 'OpenImageIO-utils', 'pacman': 'openimageio', 'apk': 'openimageio-tools',
+    },
     'gs': {
         'brew': 'ghostscript', 'ports': 'ghostscript', 'apt': 'ghostscript',
         'dnf': 'ghostscript', 'pacman': 'ghostscript', 'zypper': 'ghostscript',
@@ -109,10 +113,23 @@ PACKAGES: Dict[str, Dict[str, str]] = {
         'pacman': 'ffmpeg', 'zypper': 'ffmpeg', 'apk': 'ffmpeg',
         'choco': 'ffmpeg', 'winget': 'Gyan.FFmpeg', 'scoop': 'ffmpeg',
     },
+    'ffprobe': {
+        'brew': 'ffmpeg', 'ports': 'ffmpeg', 'apt': 'ffmpeg', 'dnf': 'ffmpeg',
+        'pacman': 'ffmpeg', 'zypper': 'ffmpeg', 'apk': 'ffmpeg',
+        'choco': 'ffmpeg', 'winget': 'Gyan.FFmpeg', 'scoop': 'ffmpeg',
+    },
     'pigz': {
         'brew': 'pigz', 'ports': 'pigz', 'apt': 'pigz', 'dnf': 'pigz',
         'pacman': 'pigz', 'zypper': 'pigz', 'apk': 'pigz',
     },
+    'zopfli': {
+        'brew': 'zopfli', 'ports': 'zopfli', 'apt': 'zopfli', 'dnf': 'zopfli',
+        'pacman': 'zopfli', 'zypper': 'zopfli',
+    },
+    'ect': {
+        'url': 'https://github.com/fhanau/Efficient-Compression-Tool/releases',
+        'note': 'not packaged; download the OS zip from',
+    },
     'xz': {
         'brew': 'xz', 'ports': 'xz', 'apt': 'xz-utils', 'dnf': 'xz',
         'pacman': 'xz', 'zypper': 'xz', 'apk': 'xz', 'choco': 'xz',
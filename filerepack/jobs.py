@@ -3,83 +3,142 @@
 """Picklable bulk worker used by ProcessPoolExecutor."""
 
 import os
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
-from .models import RepackOptions
-from .repack import FileRepacker
+from .batch import Batch, pack_batch
+from .models import RepackOptions, RepackSummary
+from .repack import FileRepacker, _normalize_options
 from .utils import create_backup, should_process_file
 
 
+def job_options(job: Dict[str, Any]) -> RepackOptions:
+    """RepackOptions for a bulk job dictionary."""
+    return RepackOptions(
+        debug=bool(job.get('debug')),
+        ultra=bool(job.get('ultra')),
+        dryrun=bool(job.get('dryrun')),
+        deep_walking=bool(job.get('deep', True)),
+        quiet=True,
+        pack_images=not job.get('no_images', False),
+        pack_archives=not job.get('no_archives', False),
+        compression_level=int(job.get('compression_level', 9)),
+        jpeg_quality=job.get('jpeg_quality'),
+        png_quality=job.get('png_quality'),
+        pdf_profile=job.get('pdf_profile'),
+        wmv_lossless=bool(job.get('wmv_lossless')),
+        lossy=bool(job.get('lossy')),
+        convert_container=bool(job.get('convert_container', True)),
+        keep_if_larger=bool(job.get('keep_if_larger', True)),
+        keep_meta=bool(job.get('keep_meta', False)),
+        min_savings=job.get('min_savings'),
+        max_extract_bytes=job.get('max_extract_bytes'),
+        max_extract_ratio=job.get('max_extract_ratio'),
+        threads=job.get('threads'),
+        max_memory_bytes=job.get('max_memory_bytes'),
+        video_segments=job.get('video_segments'),
+        max_encode_seconds=job.get('max_encode_seconds'),
+    )
+
+
+def _prepare(job: Dict[str, Any], filepath: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Filter, back up and copy to output_dir. Returns (skip result, path to pack)."""
+    should, reason = should_process_file(
+        filepath,
+        min_size=job.get('min_size_bytes'),
+        max_size=job.get('max_size_bytes'),
+        include_exts=job.get('include_exts'),
+        exclude_exts=job.get('exclude_exts'),
+    )
+    if not should:
+        return {'status': 'skipped', 'file': filepath, 'reason': reason}, filepath
+
+    if job.get('backup') and not job.get('dryrun'):
+        create_backup(filepath, job.get('backup_dir'))
+
+    output_filepath = filepath
+    output_dir = job.get('output_dir')
+    base_directory = job.get('base_directory') or os.path.dirname(filepath)
+    if output_dir and not job.get('dryrun'):
+        from shutil import copy2
+        os.makedirs(output_dir, exist_ok=True)
+        rel_path = os.path.relpath(filepath, base_directory)
+        output_filepath = os.path.join(output_dir, rel_path)
+        os.makedirs(os.path.dirname(output_filepath) or '.', exist_ok=True)
+        if output_filepath != filepath:
+            copy2(filepath, output_filepath)
+    return None, output_filepath
+
+
+def _processed(filepath: str, results: RepackSummary) -> Dict[str, Any]:
+    original_size = results.total_insize
+    final_size = results.total_outsize
+    return {
+        'status': 'processed',
+        'file': filepath,
+        'original_size': original_size,
+        'final_size': final_size,
+        'savings_percent': results.total_savings_pct,
+        'savings_bytes': original_size - final_size,
+        'note': results.note,
+        'tiers': results.tier_totals(),
+        'peak_rss_mb': results.peak_rss_mb,
+    }
+
+
 def process_file_job(job: Dict[str, Any]) -> Dict[str, Any]:
     """Process one file and return a result dictionary. No stdout."""
     filepath = job['filepath']
     try:
-        should, reason = should_process_file(
-            filepath,
-            min_size=job.get('min_size_bytes'),
-            max_size=job.get('max_size_bytes'),
-            include_exts=job.get('include_exts'),
-            exclude_exts=job.get('exclude_exts'),
-        )
-        if not should:
-            return {'status': 'skipped', 'file': filepath, 'reason': reason}
-
-        if job.get('backup') and not job.get('dryrun'):
-            create_backup(filepath, job.get('backup_dir'))
-
-        output_filepath = filepath
-        output_dir = job.get('output_dir')
-        base_directory = job.get('base_directory') or os.path.dirname(filepath)
-        if output_dir and not job.get('dryrun'):
-            from shutil import copy2
-            os.makedirs(output_dir, exist_ok=True)
-            rel_path = os.path.relpath(filepath, base_directory)
-            output_filepath = os.path.join(output_dir, rel_path)
-            os.makedirs(os.path.dirname(output_filepath) or '.', exist_ok=True)
-            if output_filepath != filepath:
-                copy2(filepath, output_filepath)
-
-        options = RepackOptions(
-            debug=bool(job.get('debug')),
-            ultra=bool(job.get('ultra')),
-            dryrun=bool(job.get('dryrun')),
-            deep_walking=bool(job.get('deep', True)),
-            quiet=True,
-            pack_images=not job.get('no_images', False),
-            pack_archives=not job.get('no_archives', False),
-            compression_level=int(job.get('compression_level', 9)),
-            jpeg_quality=job.get('jpeg_quality'),
-            png_quality=job.get('png_quality'),
-            pdf_profile=job.get('pdf_profile'),
-            wmv_lossless=bool(job.get('wmv_lossless')),
-            lossy=bool(job.get('lossy')),
-            convert_container=bool(job.get('convert_container', True)),
-            keep_if_larger=bool(job.get('keep_if_larger', True)),
-            keep_meta=bool(job.get('keep_meta', False)),
-            min_savings=job.get('min_savings'),
-            max_extract_bytes=job.get('max_extract_bytes'),
-            max_extract_ratio=job.get('max_extract_ratio'),
-        )
-
-        target = output_filepath if output_filepath != filepath else filepath
-        outfile = output_filepath if output_filepath != filepath else None
+        skipped, target = _prepare(job, filepath)
+        if skipped is not None:
+            return skipped
+        outfile = target if target != filepath else None
         results = FileRepacker(quiet=True).repack_zip_file(
-            target, outfile=outfile, def_options=options
+            target, outfile=outfile, def_options=job_options(job)
         )
         if results is None:
             return {'status': 'failed', 'file': filepath, 'error': 'No results'}
-
-        original_size = results.total_insize
-        final_size = results.total_outsize
-        savings = results.total_savings_pct
-
-        return {
-            'status': 'processed',
-            'file': filepath,
-            'original_size': original_size,
-            'final_size': final_size,
-            'savings_percent': savings,
-            'savings_bytes': original_size - final_size,
-        }
+        return _processed(filepath, results)
     except Exception as exc:
         return {'status': 'failed', 'file': filepath, 'error': str(exc)}
+
+
+def process_batch_job(job: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Process job['filepaths'] (one planned batch) with a single tool call.
+
+    Returns one result dictionary per file, in order. No stdout.
+    """
+    out: Dict[str, Dict[str, Any]] = {}
+    targets: Dict[str, str] = {}
+    for filepath in job['filepaths']:
+        try:
+            skipped, target = _prepare(job, filepath)
+        except Exception as exc:
+            out[filepath] = {'status': 'failed', 'file': filepath, 'error': str(exc)}
+            continue
+        if skipped is not None:
+            out[filepath] = skipped
+        else:
+            targets[filepath] = target
+    if targets:
+        options = _normalize_options(job_options(job))
+        group = Batch(job['batch_key'], job['packer'], list(targets.values()))
+        try:
+            packed = pack_batch(group, options)
+        except Exception as exc:
+            packed = {}
+            for filepath in targets:
+                out[filepath] = {'status': 'failed', 'file': filepath, 'error': str(exc)}
+        for filepath, target in targets.items():
+            if filepath in out:
+                continue
+            size = os.path.getsize(target)
+            summary = RepackSummary(filepath=target, total_insize=size, total_outsize=size)
+            res = packed.get(target)
+            if res is not None:
+                summary.total_insize = res.insize
+                summary.total_outsize = res.outsize
+                summary.note = res.note
+                summary.results.append(res)
+            out[filepath] = _processed(filepath, summary)
+    return [out[fp] for fp in job['filepaths']]
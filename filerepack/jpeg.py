@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""JPEG marker scan: classify files as already optimal, metadata-only or re-optimizable."""
+
+import struct
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, Optional
+
+OPTIMAL = 'optimal'
+METADATA = 'metadata'
+REOPTIMIZE = 'reoptimize'
+
+_SOI = b'\xff\xd8'
+_SOS = 0xDA
+_EOI = 0xD9
+_DHT = 0xC4
+_COM = 0xFE
+_CHUNK = 1 << 16
+_SOF = frozenset({
+    0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+    0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF,
+})
+_PROGRESSIVE = frozenset({0xC2, 0xC6, 0xCA, 0xCE})
+_ARITHMETIC = frozenset({0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF})
+# Code-length counts of the ITU T.81 Annex K AC tables that non-optimizing
+# encoders emit; an AC table with these counts means Huffman coding was not optimized.
+_STANDARD_AC_BITS = frozenset({
+    (0, 2, 1, 3, 3, 2, 4, 3, 5, 5, 4, 4, 0, 0, 1, 0x7D),
+    (0, 2, 1, 2, 4, 4, 3, 4, 7, 5, 4, 4, 0, 1, 2, 0x77),
+})
+
+
+@dataclass
+class JpegInfo:
+    """Segment facts (tables from every scan). metadata maps kind -> header segment bytes."""
+
+    sof: int = 0
+    standard_tables: bool = False
+    metadata: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def progressive(self) -> bool:
+        return self.sof in _PROGRESSIVE
+
+    @property
+    def arithmetic(self) -> bool:
+        return self.sof in _ARITHMETIC
+
+    @property
+    def metadata_bytes(self) -> int:
+        return sum(self.metadata.values())
+
+
+def metadata_kind(marker: int, head: bytes) -> Optional[str]:
+    """Kind of a droppable APPn/COM segment; None for JFIF APP0, Adobe APP14 and non-APP."""
+    if marker == _COM:
+        return 'comment'
+    if not 0xE0 <= marker <= 0xEF:
+        return None
+    if marker == 0xE0 and head.startswith(b'JFIF\x00'):
+        return None
+    if marker == 0xEE and head.startswith(b'Adobe'):
+        return None
+    if marker == 0xE1 and head.startswith(b'Exif\x00'):
+        return 'exif'
+    if marker == 0xE1 and head.startswith(b'http://ns.adobe.com/xap/'):
+        return 'xmp'
+    if marker == 0xE2 and head.startswith(b'ICC_PROFILE\x00'):
+        return 'icc'
+    return 'other'
+
+
+def read_marker(fh: BinaryIO) -> Optional[int]:
+    """Next marker byte after 0xFF (fill bytes skipped); None when fh is not at a marker."""
+    if fh.read(1) != b'\xff':
+        return None
+    byte = fh.read(1)
+    while byte == b'\xff':
+        byte = fh.read(1)
+    return byte[0] if byte else None
+
+
+def _standard_ac(data: bytes) -> bool:
+    pos = 0
+    while pos + 17 <= len(data):
+        counts = tuple(data[pos + 1:pos + 17])
+        if data[pos] >> 4 == 1 and counts in _STANDARD_AC_BITS:
+            return True
+        pos += 17 + sum(counts)
+    return False
+
+
+def _skip_entropy(fh: BinaryIO) -> None:
+    """Advance fh past entropy-coded scan data to the next marker (stuffed 0xFF00 and RSTn
+    are part of the scan)."""
+    while True:
+        start = fh.tell()
+        chunk = fh.read(_CHUNK)
+        if not chunk:
+            return
+        pos = chunk.find(b'\xff')
+        while pos != -1 and pos + 1 < len(chunk):
+            nxt = chunk[pos + 1]
+            if nxt != 0 and not 0xD0 <= nxt <= 0xD7 and nxt != 0xFF:
+                fh.seek(start + pos)
+                return
+            pos = chunk.find(b'\xff', pos + 1)
+        if pos != -1:
+            # 0xFF at the chunk end: re-read it with the following byte.
+            fh.seek(start + pos)
+            if len(chunk) < _CHUNK:
+                return
+        elif len(chunk) < _CHUNK:
+            return
+
+
+def scan(filepath: str) -> Optional[JpegInfo]:
+    """Walk every segment, skipping scan data, so DHTs between progressive scans are
+    checked too. None when the header is malformed."""
+    info = JpegInfo()
+    scans = 0
+    try:
+        with open(filepath, 'rb') as fh:
+            if fh.read(2) != _SOI:
+                return None
+            while True:
+                marker = read_marker(fh)
+                if marker is None or marker == _EOI:
+                    return info if scans and info.sof else None
+                if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+                    continue
+                raw = fh.read(2)
+                if len(raw) < 2 or struct.unpack('>H', raw)[0] < 2:
+                    return info if scans and info.sof else None
+                size = struct.unpack('>H', raw)[0] - 2
+                if marker == _SOS:
+                    if not info.sof:
+                        return None
+                    scans += 1
+                    fh.seek(size, 1)
+                    _skip_entropy(fh)
+                    continue
+                if marker == _DHT:
+                    info.standard_tables |= _standard_ac(fh.read(size))
+                    continue
+                if marker in _SOF:
+                    info.sof = marker
+                    fh.seek(size, 1)
+                    continue
+                if scans:
+                    # Only header metadata is stripped in-process; later segments stay.
+                    fh.seek(size, 1)
+                    continue
+                head = fh.read(min(size, 32))
+                fh.seek(size - len(head), 1)
+                kind = metadata_kind(marker, head)
+                if kind is not None:
+                    info.metadata[kind] = info.metadata.get(kind, 0) + size + 4
+    except OSError:
+        return None
+
+
+def classify(info: Optional[JpegInfo], keep_meta: bool = False) -> str:
+    """optimal: progressive or arithmetic coded, no standard Huffman tables, nothing
+    to strip; metadata: only stripping can help; reoptimize: everything else."""
+    if info is None or info.sof in (0xC3, 0xC7, 0xCB, 0xCF):
+        return REOPTIMIZE
+    entropy_optimal = (info.progressive or info.arithmetic) and not info.standard_tables
+    if not entropy_optimal:
+        return REOPTIMIZE
+    if info.metadata and not keep_meta:
+        return METADATA
+    return OPTIMAL
@@ -4,12 +4,11 @@
 
 import base64
 import json
-import os
 import re
 from typing import Any, Optional, cast
 from xml.etree import ElementTree as ET
 
-from .containers import pack_members, staging_dir
+from .containers import pack_bytes
 from .models import PackResult
 
 
@@ -84,15 +83,7 @@ def minify_xml_bytes(data: bytes) -> Optional[bytes]:
 def _pack_image_bytes(
     data: bytes, ext: str, options: Optional[dict],
 ) -> Optional[bytes]:
-    with staging_dir() as tmp:
-        path = os.path.join(tmp, 'embed' + ext)
-        with open(path, 'wb') as fh:
-            fh.write(data)
-        result = pack_members({'img': path}, options).get('img')
-        if result is None or not result.shrank:
-            return None
-        with open(result.path, 'rb') as fh:
-            return fh.read()
+    return pack_bytes(data, ext, options)
 
 
 def rewrite_data_uris(text: str, options: Optional[dict] = None) -> str:
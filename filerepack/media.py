@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""One ffprobe JSON probe per media file, cached by path, size, and mtime."""
+
+import json
+import logging
+import os
+import subprocess
+import threading
+from dataclasses import dataclass
+from os.path import abspath
+from typing import Any, Dict, Optional, Tuple
+
+from .tools import resolve_tool
+
+_CACHE: Dict[Tuple[str, int, int], Optional['MediaInfo']] = {}
+_CACHE_MAX = 512
+_LOCK = threading.Lock()
+
+
+@dataclass(frozen=True)
+class MediaStream:
+    """One stream: kind is ffprobe's codec_type (video, audio, subtitle, data...)."""
+
+    kind: str
+    codec: str
+    width: int = 0
+    height: int = 0
+    bit_rate: int = 0
+    pix_fmt: str = ''
+    encoder: str = ''
+    attached_pic: bool = False
+
+
+@dataclass(frozen=True)
+class MediaInfo:
+    format_name: str
+    duration: float
+    bit_rate: int
+    encoder: str
+    streams: Tuple[MediaStream, ...]
+
+    @property
+    def video(self) -> Optional[MediaStream]:
+        """First real video stream; embedded cover art does not count."""
+        return next(
+            (s for s in self.streams if s.kind == 'video' and not s.attached_pic), None,
+        )
+
+    @property
+    def audio(self) -> Optional[MediaStream]:
+        return next((s for s in self.streams if s.kind == 'audio'), None)
+
+    @property
+    def audio_codec(self) -> str:
+        return self.audio.codec if self.audio is not None else ''
+
+
+def _int(value: Any) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _stream(raw: Dict[str, Any]) -> MediaStream:
+    tags = raw.get('tags') or {}
+    return MediaStream(
+        str(raw.get('codec_type') or ''), str(raw.get('codec_name') or ''),
+        _int(raw.get('width')), _int(raw.get('height')), _int(raw.get('bit_rate')),
+        str(raw.get('pix_fmt') or ''), str(tags.get('encoder') or ''),
+        bool((raw.get('disposition') or {}).get('attached_pic')),
+    )
+
+
+def parse(text: str) -> Optional[MediaInfo]:
+    """MediaInfo from `ffprobe -print_format json` output; None when unparsable."""
+    try:
+        doc = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(doc, dict) or not isinstance(doc.get('format'), dict):
+        return None
+    fmt = doc['format']
+    streams = tuple(_stream(s) for s in doc.get('streams') or () if isinstance(s, dict))
+    return MediaInfo(
+        str(fmt.get('format_name') or ''), _float(fmt.get('duration')),
+        _int(fmt.get('bit_rate')), str((fmt.get('tags') or {}).get('encoder') or ''),
+        streams,
+    )
+
+
+def _run_probe(ffprobe: str, filepath: str, debug: bool) -> Optional[MediaInfo]:
+    cmd = [
+        ffprobe, '-v', 'error', '-print_format', 'json',
+        '-show_format', '-show_streams', abspath(filepath),
+    ]
+    try:
+        proc = subprocess.run(
+            cmd, capture_output=True, text=True, encoding='utf-8',
+            errors='replace', timeout=60,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if proc.returncode != 0:
+        if debug:
+            logging.debug('ffprobe failed for %s: %s', filepath, (proc.stderr or '')[:200])
+        return None
+    return parse(proc.stdout or '')
+
+
+def probe(filepath: str, debug: bool = False) -> Optional[MediaInfo]:
+    """Codecs, bitrates, resolution, duration, and encoder tags; None without ffprobe.
+
+    Results (including failed probes) are cached until the file's size or mtime changes.
+    """
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    key = (abspath(filepath), st.st_size, st.st_mtime_ns)
+    with _LOCK:
+        if key in _CACHE:
+            return _CACHE[key]
+    ffprobe = resolve_tool('ffprobe')
+    if ffprobe is None:
+        return None
+    info = _run_probe(ffprobe, filepath, debug)
+    if debug:
+        logging.debug('ffprobe %s: %s', filepath, info)
+    with _LOCK:
+        if len(_CACHE) >= _CACHE_MAX:
+            _CACHE.pop(next(iter(_CACHE)))
+        _CACHE[key] = info
+    return info
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""Resident-set sampling for memory-bounded jobs (/proc on Linux, psutil elsewhere)."""
+
+import os
+import threading
+from typing import Any, Optional
+
+ABORTED_MEMORY = 'aborted: memory ceiling'
+_SAMPLE_SECONDS = 0.2
+try:
+    _PAGE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, OSError, ValueError):
+    _PAGE = 4096
+
+
+def rss(pid: Optional[int] = None) -> Optional[int]:
+    """Resident bytes of *pid* (default: this process). None when unknown."""
+    try:
+        with open(f'/proc/{pid or "self"}/statm', encoding='ascii') as fh:
+            return int(fh.read().split()[1]) * _PAGE
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    try:
+        return int(psutil.Process(pid).memory_info().rss)
+    except Exception:
+        return None
+
+
+def megabytes(nbytes: int) -> float:
+    return round(nbytes / 1024 ** 2, 1)
+
+
+class MemoryWatch:
+    """Samples this process's RSS on a thread while active.
+
+    peak also takes child-process peaks passed to note(); exceeded is true once
+    the peak crosses ceiling. Without a ceiling it only measures. Callers that shed
+    work to stay under the ceiling set degraded.
+    """
+
+    def __init__(self, ceiling: Optional[int] = None, interval: float = _SAMPLE_SECONDS):
+        self.ceiling = ceiling or None
+        self.interval = interval
+        self.peak = 0
+        self.degraded = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self) -> None:
+        self.note(rss() or 0)
+
+    def note(self, nbytes: int) -> None:
+        self.peak = max(self.peak, nbytes)
+
+    @property
+    def exceeded(self) -> bool:
+        return self.ceiling is not None and self.peak > self.ceiling
+
+    def fits(self, estimate: int) -> bool:
+        """True when *estimate* more bytes stay under the ceiling (always without one)."""
+        return self.ceiling is None or estimate <= self.ceiling
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self) -> 'MemoryWatch':
+        self.sample()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sample()
@@ -12,6 +12,12 @@ class PackResult:
     outsize: int
     savings_pct: float
     replaced: bool = True
+    method: Optional[str] = None
+    note: Optional[str] = None
+    tier: Optional[str] = None
+    elapsed_seconds: float = 0.0
+    # Packer-specific measurements (for example EXR seconds_per_megapixel).
+    metrics: Dict[str, float] = field(default_factory=dict)
 
     @property
     def savings_bytes(self) -> int:
@@ -42,6 +48,10 @@ class RepackOptions:
     max_extract_ratio: Optional[float] = None
     repack_archive: bool = True
     log: bool = False
+    threads: Optional[int] = None
+    max_memory_bytes: Optional[int] = None
+    video_segments: Optional[int] = None
+    max_encode_seconds: Optional[float] = None
 
     def to_dict(self) -> Dict[str, Any]:
         return asdict(self)
@@ -58,6 +68,7 @@ class RepackSummary:
     inner_count: int = 0
     inner_insize: int = 0
     inner_outsize: int = 0
+    note: Optional[str] = None
 
     @property
     def total_savings_bytes(self) -> int:
@@ -69,6 +80,24 @@ class RepackSummary:
             return (self.total_insize - self.total_outsize) * 100.0 / self.total_insize
         return 0.0
 
+    @property
+    def peak_rss_mb(self) -> Optional[float]:
+        """Largest peak_rss_mb metric among results (PDF jobs record one)."""
+        peaks = [r.metrics['peak_rss_mb'] for r in self.results if 'peak_rss_mb' in r.metrics]
+        return max(peaks) if peaks else None
+
+    def tier_totals(self) -> Dict[str, Dict[str, float]]:
+        """Per effort tier: file count, packer seconds, bytes saved."""
+        totals: Dict[str, Dict[str, float]] = {}
+        for res in self.results:
+            if not res.tier:
+                continue
+            row = totals.setdefault(res.tier, {'files': 0, 'seconds': 0.0, 'saved': 0})
+            row['files'] += 1
+            row['seconds'] += res.elapsed_seconds
+            row['saved'] += res.savings_bytes
+        return totals
+
     def as_legacy_dict(self) -> Dict[str, Any]:
         """Dict shape used by the 0.1.x FileRepacker API."""
         return {
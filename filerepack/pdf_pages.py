@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+"""Lossy PDF: Ghostscript over page ranges in parallel, grafted back onto the source."""
+
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from .consts import PDF_GS_RANGE_MIN_BYTES, PDF_GS_RANGE_MIN_PAGES
+from .models import PackResult
+from .pdf_streams import pikepdf_available
+from .utils import cpu_budget
+
+_SHARED_TYPES = ('/Font', '/FontDescriptor', '/ExtGState', '/Encoding')
+_MAX_DEDUPE_PASSES = 4
+# Page keys taken from the Ghostscript output; /Annots, /StructParents and the rest stay.
+_GRAFT_KEYS = ('/Contents', '/Resources', '/MediaBox', '/CropBox', '/Rotate', '/UserUnit')
+
+
+def _r() -> Any:
+    from . import repack as r
+    return r
+
+
+def page_count(qpdf_path: str, src: str, debug: bool = False, quiet: bool = False) -> int:
+    """Pages per qpdf --show-npages; 0 when qpdf cannot read the file."""
+    result = _r()._run_command([qpdf_path, '--show-npages', src], quiet=quiet, debug=debug)
+    try:
+        return int(result.stdout.strip()) if result is not None else 0
+    except (AttributeError, ValueError):
+        return 0
+
+
+def page_ranges(pages: int, workers: int) -> List[Tuple[int, int]]:
+    """Contiguous 1-based (first, last) ranges of near-equal length."""
+    workers = max(1, min(workers, pages))
+    size, extra = divmod(pages, workers)
+    ranges = []
+    first = 1
+    for i in range(workers):
+        last = first + size - 1 + (1 if i < extra else 0)
+        ranges.append((first, last))
+        first = last + 1
+    return ranges
+
+
+def _shape(value: Any, alias: Dict[Tuple[int, int], Tuple[int, int]], top: bool = False) -> Any:
+    import pikepdf
+
+    if not isinstance(value, pikepdf.Object):
+        return ('v', repr(value))
+    if value.is_indirect and not top:
+        objgen = tuple(value.objgen)
+        return ('ref',) + alias.get(objgen, objgen)
+    if isinstance(value, pikepdf.Array):
+        return ('a',) + tuple(_shape(v, alias) for v in value)
+    if isinstance(value, (pikepdf.Dictionary, pikepdf.Stream)):
+        return ('d',) + tuple(sorted(
+            (k, _shape(v, alias)) for k, v in value.items() if k != '/Length'
+        ))
+    return ('v', repr(value))
+
+
+def _resource_key(obj: Any, alias: Dict[Tuple[int, int], Tuple[int, int]]) -> Optional[Any]:
+    """Content key for streams and shared font/graphics-state dictionaries; None otherwise."""
+    import pikepdf
+
+    if isinstance(obj, pikepdf.Stream):
+        try:
+            raw = obj.read_raw_bytes()
+        except Exception:
+            return None
+        return ('s', hashlib.sha256(raw).hexdigest(), _shape(obj, alias, top=True))
+    if isinstance(obj, pikepdf.Dictionary) and str(obj.get('/Type', '')) in _SHARED_TYPES:
+        return _shape(obj, alias, top=True)
+    return None
+
+
+def _repoint(value: Any, canonical: Dict[Tuple[int, int], Any]) -> None:
+    import pikepdf
+
+    if isinstance(value, pikepdf.Array):
+        items = list(enumerate(value))
+    elif isinstance(value, (pikepdf.Dictionary, pikepdf.Stream)):
+        items = list(value.items())
+    else:
+        return
+    for key, child in items:
+        if not isinstance(child, pikepdf.Object):
+            continue
+        if child.is_indirect:
+            target = canonical.get(tuple(child.objgen))
+            if target is not None:
+                value[key] = target
+        else:
+            _repoint(child, canonical)
+
+
+def graft_pages(src: str, parts: List[str], dest: str) -> bool:
+    """Copy src to dest with each page's content taken, in order, from the parts.
+
+    The page objects themselves are kept, so outlines, named and link destinations,
+    /Info, XMP and page labels still point at them; the replaced content is no longer
+    referenced and is not written. False without pikepdf, on a page-count mismatch
+    or on any error.
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        return False
+    try:
+        with pikepdf.open(src) as pdf:
+            pages = list(pdf.pages)
+            index = 0
+            for part in parts:
+                with pikepdf.open(part) as doc:
+                    if index + len(doc.pages) > len(pages):
+                        return False
+                    for page in doc.pages:
+                        copied = pdf.copy_foreign(page.obj)
+                        target = pages[index].obj
+                        for key in _GRAFT_KEYS:
+                            if key in copied:
+                                target[key] = copied[key]
+                            elif key in target:
+                                del target[key]
+                        index += 1
+            if index != len(pages):
+                return False
+            pdf.save(dest)
+        return os.path.exists(dest) and os.path.getsize(dest) > 0
+    except Exception:
+        return False
+
+
+def dedupe_resources(src: str, dest: str) -> bool:
+    """Point identical streams and font/graphics-state objects at one copy, then save.
+
+    Each range's Ghostscript output embeds its own fonts and ICC profiles; after the
+    merge they are byte-identical objects. False without pikepdf or on any error.
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        return False
+    try:
+        with pikepdf.open(src) as pdf:
+            alias: Dict[Tuple[int, int], Tuple[int, int]] = {}
+            canonical: Dict[Tuple[int, int], Any] = {}
+            for _ in range(_MAX_DEDUPE_PASSES):
+                seen: Dict[Any, Any] = {}
+                found = False
+                for obj in pdf.objects:
+                    objgen = tuple(obj.objgen)
+                    if objgen in alias:
+                        continue
+                    key = _resource_key(obj, alias)
+                    if key is None:
+                        continue
+                    first = seen.setdefault(key, obj)
+                    if tuple(first.objgen) != objgen:
+                        alias[objgen] = tuple(first.objgen)
+                        canonical[objgen] = first
+                        found = True
+                if not found:
+                    break
+            if canonical:
+                for obj in pdf.objects:
+                    if tuple(obj.objgen) not in canonical:
+                        _repoint(obj, canonical)
+            pdf.save(
+                dest, object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                compress_streams=True,
+            )
+        return os.path.exists(dest) and os.path.getsize(dest) > 0
+    except Exception:
+        return False
+
+
+def pack_gs_ranges(
+    filepath: str, gs_path: str, qpdf_path: str, profile: str,
+    jpeg_quality: Optional[int] = None, threads: Optional[int] = None,
+    debug: bool = False, quiet: bool = False, **commit: Any,
+) -> Optional[PackResult]:
+    """Split with qpdf --pages, one Ghostscript per range, graft, resource dedupe.
+
+    None when the document is too small or short, the budget is one core, pikepdf
+    is missing or any step fails; the caller then runs a single Ghostscript over
+    the whole file.
+    """
+    r = _r()
+    budget = cpu_budget(threads)
+    src = os.path.abspath(filepath)
+    if budget < 2 or os.path.getsize(src) < PDF_GS_RANGE_MIN_BYTES:
+        return None
+    if not pikepdf_available():
+        return None
+    pages = page_count(qpdf_path, src, debug, quiet)
+    if pages < 2 * PDF_GS_RANGE_MIN_PAGES:
+        return None
+    ranges = page_ranges(pages, min(budget, pages // PDF_GS_RANGE_MIN_PAGES))
+    temps: List[str] = []
+
+    def one(span: Tuple[int, int]) -> Optional[str]:
+        part, out = r._make_temp('.pdf'), r._make_temp('.pdf')
+        temps.extend((part, out))
+        cmd = [qpdf_path, '--empty', '--pages', src, f'{span[0]}-{span[1]}', '--', part]
+        if r._run_command(cmd, quiet=quiet, debug=debug) is None:
+            return None
+        cmd = r.build_gs_pdf_cmd(gs_path, part, out, profile=profile, jpeg_quality=jpeg_quality)
+        if r._run_command(cmd, quiet=quiet, debug=debug) is None:
+            return None
+        return out if r.verify_output(out, 'pdf') else None
+
+    merged, final = r._make_temp('.pdf'), r._make_temp('.pdf')
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+            outs = list(pool.map(one, ranges))
+        if not all(outs):
+            if debug:
+                logging.warning('page-range Ghostscript failed; running one process')
+            return None
+        # A qpdf --pages merge would null every destination into the source pages;
+        # grafting the new content onto those pages keeps the catalog pointing at them.
+        if not graft_pages(src, [str(o) for o in outs], merged):
+            return None
+        if not dedupe_resources(merged, final):
+            os.replace(merged, final)
+        res = r._commit_output(
+            final, filepath, os.path.getsize(filepath), verify='pdf',
+            **r._commit_kwargs(**commit),
+        )
+    finally:
+        for path in temps + [merged, final]:
+            r._remove_quietly(path)
+    if res is not None:
+        res.method = 'gs ranges'
+        res.metrics['ranges'] = float(len(ranges))
+    return res
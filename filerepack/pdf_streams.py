@@ -2,10 +2,19 @@
 
 """Lossless PDF image-stream walking via pikepdf."""
 
+import hashlib
 import os
-from typing import Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
-from .containers import pack_members, staging_dir
+from .consts import PDF_LARGE_BYTES, PDF_REDEFLATE_MAX_BYTES, PDF_STREAM_BATCH_BYTES
+from .containers import pack_bytes
+from .deflate import redeflate
+from .memory import MemoryWatch
+from .utils import cpu_budget
+
+
+_REDEFLATE_COPIES = 2
 
 
 def pikepdf_available() -> bool:
@@ -56,59 +65,264 @@ def _filter_name(obj: Any) -> str:
 def _pack_stream_bytes(
     data: bytes, ext: str, options: Optional[dict],
 ) -> Optional[bytes]:
-    with staging_dir() as tmp:
-        path = os.path.join(tmp, 'stream' + ext)
-        with open(path, 'wb') as fh:
-            fh.write(data)
-        result = pack_members({'img': path}, options).get('img')
-        if result is None or not result.shrank:
-            return None
-        with open(result.path, 'rb') as fh:
-            return fh.read()
+    return pack_bytes(data, ext, options)
+
+
+def _unique_images(pdf: Any) -> Dict[Tuple[int, int], Any]:
+    """Image XObjects by (objnum, gen); a logo shared by every page appears once."""
+    found: Dict[Tuple[int, int], Any] = {}
+    for page in pdf.pages:
+        try:
+            images = page.images
+        except Exception:
+            continue
+        for _name, obj in images.items():
+            key = tuple(getattr(obj, 'objgen', (0, 0)))
+            if key == (0, 0):
+                key = (-len(found) - 1, 0)
+            found.setdefault(key, obj)
+    return found
+
+
+def _pack_all(
+    contents: Dict[str, Tuple[bytes, str]], options: Optional[dict],
+) -> Dict[str, Optional[bytes]]:
+    """Pack each distinct content once, concurrently (the tools run as subprocesses)."""
+    budget = cpu_budget((options or {}).get('threads'))
+    workers = min(len(contents), budget)
+    inner = dict(options or {}, threads=max(1, budget // max(1, workers)))
+
+    def one(item: Tuple[str, Tuple[bytes, str]]) -> Tuple[str, Optional[bytes]]:
+        digest, (raw, ext) = item
+        return digest, _pack_stream_bytes(raw, ext, inner)
+
+    if workers <= 1:
+        return dict(one(item) for item in contents.items())
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(one, contents.items()))
+
+
+def _redirect_images(pdf: Any, alias: Dict[Tuple[int, int], Any]) -> None:
+    """Point page XObject entries at the first written copy of a duplicate image.
+
+    The duplicates become unreferenced and are not written by save.
+    """
+    for page in pdf.pages:
+        try:
+            xobjects = page.obj.Resources.XObject
+        except (AttributeError, KeyError):
+            continue
+        for name in list(xobjects.keys()):
+            target = alias.get(tuple(getattr(xobjects[name], 'objgen', (0, 0))))
+            if target is not None:
+                xobjects[name] = target
+
+
+def _replace_images(
+    pdf: Any, options: Optional[dict], batch_bytes: Optional[int] = None,
+    watch: Optional[MemoryWatch] = None,
+) -> bool:
+    """Pack and write back DCT/JPX image streams in an open document. True if any changed.
+
+    With batch_bytes, raw streams are read, packed and written back in batches of
+    about that size instead of all at once, and each batch's packed bytes are dropped
+    once written; packing stops early once watch exceeds its ceiling. Later streams
+    with the same content are pointed at the first written object, not written again.
+    """
+    from pikepdf import Name
+
+    filters = {'/DCTDecode': ('.jpg', Name.DCTDecode), '/JPXDecode': ('.jp2', Name.JPXDecode)}
+    targets: List[Tuple[Any, str, Any]] = []
+    contents: Dict[str, Tuple[bytes, str]] = {}
+    seen: Set[str] = set()
+    written: Dict[str, Any] = {}
+    alias: Dict[Tuple[int, int], Any] = {}
+    held = 0
+    changed = False
+
+    def flush() -> None:
+        nonlocal changed, held
+        packed = _pack_all(contents, options) if contents else {}
+        for obj, digest, filt_name in targets:
+            first = written.get(digest)
+            objgen = tuple(getattr(obj, 'objgen', (0, 0)))
+            if first is not None and objgen != (0, 0):
+                alias[objgen] = first
+                continue
+            data = packed.get(digest)
+            if data is None and first is not None:
+                data = first.read_raw_bytes()
+            if data is None:
+                continue
+            try:
+                obj.write(data, filter=filt_name)
+                written.setdefault(digest, obj)
+                changed = True
+            except Exception:
+                continue
+        seen.update(contents)
+        targets.clear()
+        contents.clear()
+        held = 0
+
+    for obj in _unique_images(pdf).values():
+        known = filters.get(_filter_name(obj))
+        if known is None:
+            continue
+        try:
+            raw = obj.read_raw_bytes()
+        except Exception:
+            continue
+        digest = hashlib.sha256(raw).hexdigest() + known[0]
+        if digest not in seen and digest not in contents:
+            contents[digest] = (raw, known[0])
+            held += len(raw)
+        targets.append((obj, digest, known[1]))
+        del raw
+        if batch_bytes and held >= batch_bytes:
+            flush()
+            if watch is not None and watch.exceeded:
+                break
+    else:
+        flush()
+    if alias:
+        _redirect_images(pdf, alias)
+    return changed
+
+
+def _flate_streams(pdf: Any) -> Iterator[Tuple[Any, Any]]:
+    """(stream, DecodeParms or None) for single-filter FlateDecode streams.
+
+    Cross-reference and object streams are skipped (the writer regenerates them).
+    Predictor parameters are carried over unchanged: only the deflate layer is redone.
+    """
+    import pikepdf
+
+    for obj in pdf.objects:
+        if not isinstance(obj, pikepdf.Stream) or _filter_name(obj) != '/FlateDecode':
+            continue
+        if str(obj.get('/Type', '')) in ('/XRef', '/ObjStm'):
+            continue
+        parms = obj.get('/DecodeParms')
+        if isinstance(parms, pikepdf.Array):
+            parms = parms[0] if len(parms) == 1 else None
+        if parms is not None and not isinstance(parms, pikepdf.Dictionary):
+            parms = None
+        yield obj, parms
+
+
+def _redeflate_streams(
+    pdf: Any, options: Optional[dict], batch_bytes: Optional[int] = None,
+    watch: Optional[MemoryWatch] = None,
+) -> int:
+    """Re-deflate Flate streams at level 9 (zopfli under ultra) on a thread pool.
+
+    A stream is rewritten only when smaller and inflating to the same bytes. Streams
+    inflating past PDF_REDEFLATE_MAX_BYTES are skipped; under a watch ceiling the cap
+    and the pool shrink so every worker's inflated copies fit. Returns the number
+    rewritten.
+    """
+    from pikepdf import Name
+
+    ultra = bool((options or {}).get('ultra'))
+    workers = cpu_budget((options or {}).get('threads'))
+    cap = PDF_REDEFLATE_MAX_BYTES
+    if watch is not None and watch.ceiling is not None:
+        # Raw plus recompressed copies per worker.
+        cap = min(cap, watch.ceiling // _REDEFLATE_COPIES)
+        while workers > 1 and not watch.fits(workers * cap * _REDEFLATE_COPIES):
+            workers -= 1
+    pending: List[Tuple[Any, Any, bytes]] = []
+    held = 0
+    count = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def flush() -> None:
+            nonlocal held, count
+            packed = pool.map(
+                lambda blob: redeflate(blob, ultra, max_raw=cap), [p[2] for p in pending],
+            )
+            for (obj, parms, _blob), data in zip(pending, packed):
+                if data is None:
+                    continue
+                try:
+                    obj.write(data, filter=Name.FlateDecode, decode_parms=parms)
+                    count += 1
+                except Exception:
+                    continue
+            pending.clear()
+            held = 0
+
+        for obj, parms in _flate_streams(pdf):
+            try:
+                blob = obj.read_raw_bytes()
+            except Exception:
+                continue
+            pending.append((obj, parms, blob))
+            held += len(blob)
+            if batch_bytes and held >= batch_bytes:
+                flush()
+                if watch is not None and watch.exceeded:
+                    return count
+        flush()
+    return count
 
 
 def rebuild_pdf_images(
     src: str, dest: str, options: Optional[dict] = None,
 ) -> bool:
-    """Copy *src* to *dest* with packed image streams. False if nothing changed."""
+    """Copy *src* to *dest* with packed image streams. False if nothing changed.
+
+    Streams are deduplicated by object id and by raw-content hash, packed on a
+    thread pool, and written back once per object.
+    """
     try:
         import pikepdf
-        from pikepdf import Name
     except ImportError:
         return False
     try:
         with pikepdf.open(src) as pdf:
-            if _pdf_is_locked(pdf):
-                return False
-            changed = False
-            for page in pdf.pages:
-                try:
-                    images = page.images
-                except Exception:
-                    continue
-                for _name, obj in images.items():
-                    filt = _filter_name(obj)
-                    if filt == '/DCTDecode':
-                        ext, filt_name = '.jpg', Name.DCTDecode
-                    elif filt == '/JPXDecode':
-                        ext, filt_name = '.jp2', Name.JPXDecode
-                    else:
-                        continue
-                    try:
-                        raw = obj.read_raw_bytes()
-                    except Exception:
-                        continue
-                    packed = _pack_stream_bytes(raw, ext, options)
-                    if packed is None:
-                        continue
-                    try:
-                        obj.write(packed, filter=filt_name)
-                        changed = True
-                    except Exception:
-                        continue
-            if not changed:
+            if _pdf_is_locked(pdf) or not _replace_images(pdf, options):
                 return False
             pdf.save(dest)
             return os.path.exists(dest) and os.path.getsize(dest) > 0
     except Exception:
         return False
+
+
+def save_pdf(
+    src: str, dest: str, options: Optional[dict] = None, linearize: bool = True,
+    watch: Optional[MemoryWatch] = None,
+) -> bool:
+    """Lossless rewrite in one pikepdf save: packed images, re-deflated Flate streams,
+    object streams, optional linearization. False without pikepdf, for locked or
+    unreadable files.
+
+    Large files, and any file under a watch with a ceiling, open memory-mapped and pack
+    images in batches; linearization is dropped once the watch exceeds its ceiling.
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        return False
+    try:
+        bounded = watch is not None and watch.ceiling is not None
+        large = bounded or os.path.getsize(src) >= PDF_LARGE_BYTES
+        access = pikepdf.AccessMode.mmap if large else pikepdf.AccessMode.default
+        with pikepdf.open(src, access_mode=access) as pdf:
+            if _pdf_is_locked(pdf):
+                return False
+            if options is None or options.get('pack_images', True):
+                _replace_images(
+                    pdf, options, PDF_STREAM_BATCH_BYTES if large else None, watch,
+                )
+            _redeflate_streams(pdf, options, PDF_STREAM_BATCH_BYTES if large else None, watch)
+            if linearize and watch is not None and watch.exceeded:
+                linearize = False
+                watch.degraded = True
+            pdf.save(
+                dest, object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                compress_streams=True, linearize=linearize,
+            )
+            return os.path.exists(dest) and os.path.getsize(dest) > 0
+    except Exception:
+        return False
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""PNG header probe and size-tiered lossless effort presets."""
+
+import os
+import struct
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from .consts import PNG_TINY_BYTES
+
+_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+@dataclass(frozen=True)
+class PngTier:
+    """Effort preset. timeout is oxipng --timeout and the zopflipng race deadline."""
+
+    name: str
+    max_pixels: Optional[int]
+    oxipng_level: str
+    optipng_level: str
+    timeout: int
+    zopfli: bool
+    threads: Optional[int] = None
+
+
+TINY = PngTier('tiny', None, '2', '2', 10, True, threads=1)
+PNG_TIERS: Tuple[PngTier, ...] = (
+    PngTier('standard', 4_000_000, '4', '7', 120, True),
+    PngTier('large', 32_000_000, '3', '5', 300, True),
+    PngTier('huge', None, '2', '3', 600, False),
+)
+
+
+def png_dimensions(filepath: str) -> Optional[Tuple[int, int]]:
+    """(width, height) from IHDR, or None when the header is not a PNG."""
+    try:
+        with open(filepath, 'rb') as fh:
+            head = fh.read(24)
+    except OSError:
+        return None
+    return header_dimensions(head)
+
+
+def header_dimensions(head: bytes) -> Optional[Tuple[int, int]]:
+    """png_dimensions for the first 24 bytes already in memory."""
+    if len(head) < 24 or head[:8] != _SIGNATURE or head[12:16] != b'IHDR':
+        return None
+    width, height = struct.unpack('>II', head[16:24])
+    if width == 0 or height == 0:
+        return None
+    return width, height
+
+
+def choose_tier(filepath: str) -> PngTier:
+    """Tiny files get one cheap pass; otherwise effort drops as pixel count grows."""
+    size = os.path.getsize(filepath)
+    dims = png_dimensions(filepath) if size > PNG_TINY_BYTES else None
+    return tier_for(size, dims[0] * dims[1] if dims else 0)
+
+
+def tier_for(size: int, pixels: int) -> PngTier:
+    """choose_tier for a payload already in memory."""
+    if size <= PNG_TINY_BYTES:
+        return TINY
+    for tier in PNG_TIERS:
+        if tier.max_pixels is None or pixels <= tier.max_pixels:
+            return tier
+    return PNG_TIERS[-1]
+
+
+def tier_named(name: str) -> PngTier:
+    """Tier by name (batch keys carry the name, not the tier)."""
+    return next((t for t in (TINY,) + PNG_TIERS if t.name == name), PNG_TIERS[0])
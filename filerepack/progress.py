@@ -14,6 +14,12 @@ def stderr_is_tty() -> bool:
         return False
 
 
+def _clock(seconds: float) -> str:
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+
 class ProgressReporter:
     """Rich progress bar when installed; otherwise prints every ``interval`` items."""
 
@@ -34,6 +40,8 @@ class ProgressReporter:
         self._rich: Any = None
         self._task: Any = None
         self._total: Optional[int] = None
+        self._encoding = ""
+        self._encode_step = -1
         if enabled:
             self._start_rich()
 
@@ -99,6 +107,36 @@ class ProgressReporter:
         if total and completed % self.interval == 0:
             self._print(f"Progress: {completed}/{total} files processed")
 
+    def encode(
+        self, current: int, total: int, name: str = "",
+        speed: Optional[float] = None, eta: Optional[float] = None,
+    ) -> None:
+        """Encoder position in seconds of media, with percent, speed, and ETA."""
+        if not self.enabled:
+            return
+        label = f"Encoding {os.path.basename(name)}" if name else "Encoding"
+        if self._encoding != label:
+            self._encoding = label
+            self._encode_step = -1
+            self.set_stage(label, total=total or None)
+        parts = []
+        if total:
+            parts.append(f"{100 * min(current, total) // total}%")
+        if speed:
+            parts.append(f"{speed:.2f}\u00d7")
+        if eta is not None:
+            parts.append(f"ETA {_clock(eta)}")
+        detail = " ".join(parts)
+        if self._rich is not None and self._task is not None:
+            self._rich.update(
+                self._task, completed=current, description=f"{label} {detail}".rstrip(),
+            )
+            return
+        step = 10 * current // total if total else -1
+        if step > self._encode_step:
+            self._encode_step = step
+            self._print(f"{label}: {detail}")
+
     def close(self) -> None:
         if self._rich is not None:
             self._rich.stop()
@@ -112,8 +150,14 @@ class ProgressReporter:
         current: int = 0,
         total: int = 0,
         name: str = "",
+        speed: Optional[float] = None,
+        eta: Optional[float] = None,
+        **extra: Any,
     ) -> None:
-        """FileRepacker progress callback: extract / files / file / write / standalone."""
+        """FileRepacker progress callback.
+
+        Events: extract / files / file / write / standalone / segment / encode.
+        """
         if event == "extract":
             self.set_stage("Extracting")
         elif event == "files":
@@ -125,3 +169,10 @@ class ProgressReporter:
         elif event == "standalone":
             label = f"Repacking {os.path.basename(name)}" if name else "Repacking"
             self.set_stage(label)
+        elif event == "encode":
+            self.encode(current, total, name=name, speed=speed, eta=eta)
+        elif event == "segment":
+            if current == 0:
+                self.set_stage(f"Encoding {os.path.basename(name)} segments", total=total)
+            else:
+                self.update(current)
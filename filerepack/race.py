@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+
+"""Run packer candidates concurrently and keep the smallest verified output."""
+
+import logging
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from shutil import copyfile
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+from . import memory
+from .consts import GROW_WATCH_MARGIN, GROW_WATCH_MIN_FRACTION
+from .models import PackResult
+from .utils import cpu_budget
+
+_POLL_SECONDS = 0.25
+_LOCAL = threading.local()
+ABORTED_WOULD_GROW = 'aborted: would grow'
+
+
+@dataclass
+class Candidate:
+    """One pipeline: run(out_path) produces out_path and returns success.
+
+    in_place: out_path starts as a copy of the source and is rewritten in place,
+    so its size says nothing about progress and is not watched.
+    """
+
+    name: str
+    run: Callable[[str], bool]
+    timeout: Optional[float] = None
+    in_place: bool = False
+
+
+class KillScope:
+    """Conditions under which commands run on this thread are killed.
+
+    output/limit: kill once output grows past limit() bytes.
+    read_total: bytes the command is expected to read; with /proc/<pid>/io this
+    projects the final output size and kills early when it clearly overshoots.
+    deadline/may_expire: kill after deadline (monotonic) when may_expire() is true.
+    max_rss: kill once the command's resident set exceeds this many bytes.
+    track_rss: record the command's sampled peak RSS in peak_rss.
+    on_stdout: receives the command's stdout line by line while it runs.
+    fraction: share of the work done as the command reports it; preferred over
+    /proc/<pid>/io for the output projection.
+    abort: extra check returning a kill reason (e.g. a time budget), or None.
+    """
+
+    def __init__(
+        self,
+        output: Optional[str] = None,
+        limit: Optional[Callable[[], Optional[int]]] = None,
+        deadline: Optional[float] = None,
+        may_expire: Optional[Callable[[], bool]] = None,
+        read_total: Optional[int] = None,
+        over_limit: str = 'output exceeds best',
+        max_rss: Optional[int] = None,
+        track_rss: bool = False,
+        on_stdout: Optional[Callable[[str], None]] = None,
+        fraction: Optional[Callable[[], Optional[float]]] = None,
+        abort: Optional[Callable[[], Optional[str]]] = None,
+    ):
+        self.output = output
+        self.limit = limit
+        self.deadline = deadline
+        self.may_expire = may_expire
+        self.read_total = read_total
+        self.over_limit = over_limit
+        self.max_rss = max_rss
+        self.track_rss = track_rss or bool(max_rss)
+        self.on_stdout = on_stdout
+        self.fraction = fraction
+        self.abort = abort
+        self.peak_rss = 0
+        self.pid: Optional[int] = None
+        self.reason = ''
+
+    def _projected(self, size: int) -> Optional[float]:
+        fraction = self.fraction() if self.fraction is not None else None
+        if fraction is None:
+            if not self.read_total or self.pid is None:
+                return None
+            consumed = _bytes_read(self.pid)
+            if consumed is None:
+                return None
+            fraction = min(1.0, consumed / self.read_total)
+        if fraction < GROW_WATCH_MIN_FRACTION:
+            return None
+        return size / fraction
+
+    def check(self) -> Optional[str]:
+        if self.track_rss and self.pid is not None:
+            used = memory.rss(self.pid) or 0
+            self.peak_rss = max(self.peak_rss, used)
+            if self.max_rss and used > self.max_rss:
+                return memory.ABORTED_MEMORY
+        if self.output and self.limit is not None:
+            bound = self.limit()
+            try:
+                size = os.path.getsize(self.output)
+            except OSError:
+                size = 0
+            if bound is not None and size > bound:
+                return self.over_limit
+            projected = self._projected(size) if bound is not None else None
+            if projected is not None and projected > bound * GROW_WATCH_MARGIN:
+                return self.over_limit
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            if self.may_expire is None or self.may_expire():
+                return 'deadline'
+        if self.abort is not None:
+            return self.abort()
+        return None
+
+
+def _bytes_read(pid: int) -> Optional[int]:
+    """rchar from /proc/<pid>/io (Linux). None elsewhere."""
+    try:
+        with open(f'/proc/{pid}/io', encoding='ascii') as fh:
+            for line in fh:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        return None
+    return None
+
+
+def grow_guard(output: str, bound: int, read_total: Optional[int] = None) -> KillScope:
+    """Scope that kills a single encoder once its output can no longer beat bound."""
+    return KillScope(
+        output=output, limit=lambda: bound, read_total=read_total,
+        over_limit=ABORTED_WOULD_GROW,
+    )
+
+
+def current_scope() -> Optional[KillScope]:
+    return getattr(_LOCAL, 'scope', None)
+
+
+@contextmanager
+def scoped(scope: KillScope) -> Iterator[KillScope]:
+    previous = current_scope()
+    _LOCAL.scope = scope
+    try:
+        yield scope
+    finally:
+        _LOCAL.scope = previous
+
+
+class _Drain:
+    """Read stdout line by line into on_line, and collect stderr, on daemon threads."""
+
+    def __init__(self, proc: subprocess.Popen, on_line: Callable[[str], None]):
+        self.err: List[str] = []
+        self.threads = [
+            threading.Thread(target=self._read, args=(proc.stdout, None, on_line), daemon=True),
+            threading.Thread(target=self._read, args=(proc.stderr, self.err, None), daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    @staticmethod
+    def _read(
+        stream: Any, sink: Optional[List[str]], on_line: Optional[Callable[[str], None]],
+    ) -> None:
+        for line in stream:
+            if sink is not None:
+                sink.append(line)
+            if on_line is not None:
+                try:
+                    on_line(line)
+                except Exception:
+                    # A failing callback must not stop the drain and stall the pipe.
+                    logging.debug('stdout callback failed', exc_info=True)
+
+    def finish(self) -> Tuple[str, str]:
+        for thread in self.threads:
+            thread.join()
+        return '', ''.join(self.err)
+
+
+def run_scoped(
+    cmd: List[str], cwd: Optional[str], scope: KillScope,
+    debug: bool = False, timeout: float = 3600,
+) -> Optional[subprocess.CompletedProcess]:
+    """Popen + poll so the active scope can kill the command early.
+
+    With scope.on_stdout, stdout is streamed to it instead of being returned.
+    """
+    try:
+        proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            encoding='utf-8', errors='replace', cwd=cwd,
+        )
+    except OSError as exc:
+        if debug:
+            logging.warning('command exception: %s', str(exc))
+        return None
+    scope.pid = proc.pid
+    drain = _Drain(proc, scope.on_stdout) if scope.on_stdout is not None else None
+    started = time.monotonic()
+    while True:
+        try:
+            if drain is None:
+                stdout, stderr = proc.communicate(timeout=_POLL_SECONDS)
+            else:
+                proc.wait(timeout=_POLL_SECONDS)
+                stdout, stderr = drain.finish()
+            break
+        except subprocess.TimeoutExpired:
+            reason = scope.check()
+            if reason is None and time.monotonic() - started > timeout:
+                reason = 'timeout'
+            if reason is not None:
+                scope.reason = reason
+                proc.kill()
+                if drain is None:
+                    proc.communicate()
+                else:
+                    proc.wait()
+                    drain.finish()
+                if debug:
+                    logging.info('killed (%s): %s', reason, ' '.join(cmd))
+                return None
+    if proc.returncode != 0:
+        if debug:
+            logging.warning(
+                'command failed with return code %d: %s',
+                proc.returncode, ' '.join(cmd),
+            )
+        return None
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+
+def _r() -> Any:
+    from . import repack as r
+    return r
+
+
+class _Race:
+    def __init__(
+        self, source: str, suffix: str, verify: str,
+        limit: Optional[int], debug: bool,
+    ):
+        self.source = source
+        self.suffix = suffix
+        self.verify = verify
+        self.debug = debug
+        self.lock = threading.Lock()
+        self.best: Optional[Tuple[str, str]] = None
+        self.best_size = limit
+
+    def bound(self) -> Optional[int]:
+        return self.best_size
+
+    def has_winner(self) -> bool:
+        return self.best is not None
+
+    def run(self, cand: Candidate) -> None:
+        r = _r()
+        out = r._make_temp(self.suffix)
+        deadline = time.monotonic() + cand.timeout if cand.timeout else None
+        watched = None if cand.in_place else out
+        scope = KillScope(watched, self.bound, deadline, self.has_winner)
+        try:
+            if cand.in_place:
+                copyfile(self.source, out)
+            with scoped(scope):
+                ok = cand.run(out)
+        except Exception as exc:
+            if self.debug:
+                logging.warning('candidate %s failed: %s', cand.name, exc)
+            ok = False
+        if scope.reason and self.debug:
+            logging.info('candidate %s dropped: %s', cand.name, scope.reason)
+        if not ok or not os.path.exists(out) or os.path.getsize(out) == 0:
+            r._remove_quietly(out)
+            return
+        if not r.verify_output(out, self.verify):
+            r._remove_quietly(out)
+            return
+        size = os.path.getsize(out)
+        with self.lock:
+            if self.best_size is None or size < self.best_size or self.best is None:
+                if self.best is not None:
+                    r._remove_quietly(self.best[0])
+                self.best = (out, cand.name)
+                self.best_size = size
+                return
+        r._remove_quietly(out)
+
+
+def run_race(
+    source: str, candidates: List[Candidate], suffix: str, verify: str,
+    threads: Optional[int] = None, limit: Optional[int] = None,
+    debug: bool = False,
+) -> Optional[Tuple[str, str]]:
+    """Return (path, name) of the smallest verified output, or None.
+
+    limit: initial size bound; candidates growing past it are killed.
+    """
+    race = _Race(source, suffix, verify, limit, debug)
+    workers = min(len(candidates), cpu_budget(threads))
+    if workers <= 1:
+        for cand in candidates:
+            race.run(cand)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(race.run, candidates))
+    return race.best
+
+
+def pack_race(
+    filepath: str, candidates: List[Candidate], suffix: str, verify: str,
+    threads: Optional[int] = None, debug: bool = False, **commit: Any,
+) -> Optional[PackResult]:
+    """Race candidates, commit the winner, record its name as PackResult.method."""
+    if not candidates:
+        return None
+    r = _r()
+    ck = r._commit_kwargs(**commit)
+    insize = os.path.getsize(filepath)
+    won = run_race(
+        filepath, candidates, suffix, verify, threads=threads,
+        limit=insize if ck['keep_if_larger'] else None, debug=debug,
+    )
+    if won is None:
+        return None
+    path, name = won
+    res = r._commit_output(path, filepath, insize, verify=verify, **ck)
+    if res is not None:
+        res.method = name
+    return res
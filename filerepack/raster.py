@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+"""In-process lossless re-encode of BMP, TGA, PNM and PCX (Pillow, ImageMagick fallback)."""
+
+import logging
+import os
+import re
+import struct
+import sys
+from array import array
+from io import BytesIO
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .models import PackResult
+
+_PIL_FORMATS: Dict[str, str] = {'bmp': 'BMP', 'tga': 'TGA', 'pnm': 'PPM', 'pcx': 'PCX'}
+# Modes whose RGBA conversion is exact; 16-bit and float images go to ImageMagick.
+_SAFE_MODES = frozenset({'1', 'L', 'LA', 'P', 'RGB', 'RGBA'})
+_SAVE_MODES: Dict[str, frozenset] = {
+    'bmp': frozenset({'1', 'L', 'P', 'RGB', 'RGBA'}),
+    'tga': frozenset({'L', 'LA', 'P', 'RGB', 'RGBA'}),
+    'pnm': frozenset({'1', 'L', 'RGB'}),
+    'pcx': frozenset({'1', 'L', 'P', 'RGB'}),
+}
+_PNM_ASCII = {b'P1': b'P4', b'P2': b'P5', b'P3': b'P6'}
+_PNM_COMMENT = re.compile(rb'#[^\r\n]*')
+
+
+def _r() -> Any:
+    from . import repack as r
+    return r
+
+
+def _bmp_has_alpha_bits(filepath: str) -> bool:
+    """32-bit BMPs may carry alpha that Pillow decodes as RGB; leave them to ImageMagick."""
+    try:
+        with open(filepath, 'rb') as fh:
+            head = fh.read(30)
+    except OSError:
+        return True
+    return len(head) < 30 or struct.unpack('<H', head[28:30])[0] == 32
+
+
+def _to_palette(image: Any) -> Optional[Any]:
+    """Exact palette for an RGB image with at most 256 colours."""
+    from PIL import Image
+    colors = image.getcolors(256)
+    if colors is None:
+        return None
+    palette = Image.new('P', (1, 1))
+    palette.putpalette([c for _, rgb in colors for c in rgb])
+    return image.quantize(palette=palette, dither=Image.Dither.NONE)
+
+
+def _to_gray(image: Any) -> Optional[Any]:
+    red, green, blue = image.split()
+    if red.tobytes() == green.tobytes() == blue.tobytes():
+        return red
+    return None
+
+
+def _variants(image: Any, kind: str, ext: str) -> Iterator[Tuple[str, Any]]:
+    yield 'pillow', image
+    if image.mode != 'RGB':
+        return
+    if kind == 'pnm':
+        # .ppm/.pgm/.pbm promise a specific subtype; only generic .pnm may change it.
+        if ext == 'pnm':
+            gray = _to_gray(image)
+            if gray is not None:
+                yield 'pillow-gray', gray
+        return
+    reduced = _to_palette(image)
+    if reduced is not None:
+        yield 'pillow-palette', reduced
+
+
+def _encode(image: Any, kind: str) -> List[bytes]:
+    options: List[Dict[str, Any]] = [{}]
+    if kind == 'tga':
+        options = [{'compression': 'tga_rle'}, {}]
+    out: List[bytes] = []
+    for kwargs in options:
+        buf = BytesIO()
+        image.save(buf, format=_PIL_FORMATS[kind], **kwargs)
+        out.append(buf.getvalue())
+    return out
+
+
+def _same_pixels(original: Any, data: bytes) -> bool:
+    from PIL import Image
+    with Image.open(BytesIO(data)) as decoded:
+        if decoded.size != original.size:
+            return False
+        return decoded.convert('RGBA').tobytes() == original.convert('RGBA').tobytes()
+
+
+def _encode_pillow(filepath: str, kind: str, dest: str, debug: bool) -> Optional[str]:
+    """Write the smallest pixel-identical re-encode to dest; return its method name."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    if kind == 'bmp' and _bmp_has_alpha_bits(filepath):
+        return None
+    ext = os.path.splitext(filepath)[1].lower().lstrip('.')
+    best: Optional[Tuple[bytes, str]] = None
+    try:
+        with Image.open(filepath) as src:
+            if getattr(src, 'n_frames', 1) != 1 or src.mode not in _SAFE_MODES:
+                return None
+            src.load()
+            for name, image in _variants(src, kind, ext):
+                if image.mode not in _SAVE_MODES[kind]:
+                    continue
+                for data in _encode(image, kind):
+                    if best is not None and len(data) >= len(best[0]):
+                        continue
+                    if _same_pixels(src, data):
+                        best = (data, name)
+    except Exception as exc:
+        if debug:
+            logging.warning('Pillow re-encode of %s failed: %s', filepath, exc)
+        return None
+    if best is None:
+        return None
+    with open(dest, 'wb') as fh:
+        fh.write(best[0])
+    return best[1]
+
+
+def pnm_ascii_to_binary(data: bytes) -> Optional[bytes]:
+    """Plain (ASCII) P1/P2/P3 to raw P4/P5/P6 with identical samples. None if not plain."""
+    magic = data[:2]
+    if magic not in _PNM_ASCII:
+        return None
+    fields = _PNM_COMMENT.sub(b' ', data[2:]).split()
+    try:
+        width, height = int(fields[0]), int(fields[1])
+        if width <= 0 or height <= 0:
+            return None
+        header = b'%s\n%d %d\n' % (_PNM_ASCII[magic], width, height)
+        if magic == b'P1':
+            # P1 bits may be written without separators.
+            bits = b''.join(fields[2:])
+            if len(bits) < width * height or bits.translate(None, b'01'):
+                return None
+            row_bytes = (width + 7) // 8
+            rows = []
+            for y in range(height):
+                row = bits[y * width:(y + 1) * width].ljust(row_bytes * 8, b'0')
+                rows.append(int(row, 2).to_bytes(row_bytes, 'big'))
+            return header + b''.join(rows)
+        maxval = int(fields[2])
+        if not 0 < maxval < 65536:
+            return None
+        count = width * height * (3 if magic == b'P3' else 1)
+        samples = [int(v) for v in fields[3:3 + count]]
+    except (ValueError, IndexError):
+        return None
+    if len(samples) < count or min(samples) < 0 or max(samples) > maxval:
+        return None
+    header += b'%d\n' % maxval
+    if maxval < 256:
+        return header + bytes(samples)
+    wide = array('H', samples)
+    if sys.byteorder == 'little':
+        wide.byteswap()
+    return header + wide.tobytes()
+
+
+def _encode_pnm_ascii(filepath: str, dest: str) -> Optional[str]:
+    with open(filepath, 'rb') as fh:
+        if fh.read(2) not in _PNM_ASCII:
+            return None
+        fh.seek(0)
+        binary = pnm_ascii_to_binary(fh.read())
+    if binary is None:
+        return None
+    with open(dest, 'wb') as fh:
+        fh.write(binary)
+    return 'pnm-binary'
+
+
+def pack_raster(
+    filepath: str, kind: str, suffix: str, debug: bool = False, **commit: Any,
+) -> Optional[PackResult]:
+    """Lossless re-encode without spawning a process. None = fall back to ImageMagick."""
+    r = _r()
+    insize = os.path.getsize(filepath)
+    out_temp = r._make_temp(suffix)
+    try:
+        method = _encode_pillow(filepath, kind, out_temp, debug)
+        if method is None and kind == 'pnm':
+            method = _encode_pnm_ascii(filepath, out_temp)
+        if method is None:
+            return None
+        res = r._commit_output(
+            out_temp, filepath, insize, verify=kind, **r._commit_kwargs(**commit)
+        )
+        if res is not None:
+            res.method = method
+        return res
+    except Exception as exc:
+        if debug:
+            logging.warning('in-process %s repack failed: %s', kind, exc)
+        return None
+    finally:
+        r._remove_quietly(out_temp)
@@ -3,30 +3,39 @@
 
 import glob
 import gzip
+import inspect
 import logging
 import lzma
 import bz2
 import os
 import subprocess
 import tempfile
+import time
 import uuid
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from os.path import abspath, exists, isfile, join
 from os import listdir, walk
 from shutil import copyfile, copyfileobj, rmtree
-from typing import Any, Callable, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from . import codecs as extra_codecs
+from . import batch, deflate, media, memory, race, strip, tiff, video
+from . import effort as encoder_effort
+from . import jpeg as jpeg_scan
+from . import png as png_effort
+from . import webp as webp_scan
 from .consts import (
-    DEFAULT_JPEG_QUALITY, DEFAULT_LOSSY_PDF_PROFILE,
-    DEFAULT_MAX_EXTRACT_BYTES, DEFAULT_MAX_EXTRACT_RATIO,
-    PDF_PROFILES, ZIP_SENSITIVE_EXTS,
+    DEFAULT_JPEG_QUALITY, DEFAULT_LOSSY_PDF_PROFILE, DEFAULT_WEBP_QUALITY,
+    DEFAULT_MAX_EXTRACT_BYTES, DEFAULT_MAX_EXTRACT_RATIO, PDF_LINEARIZE_RSS_FACTOR,
+    PDF_PROFILES, RACE_SLOW_CANDIDATE_SECONDS, ZIP_SENSITIVE_EXTS,
 )
 from .formats import identify_filename
 from .models import PackResult, RepackOptions, RepackSummary
 from .tools import resolve_szip, resolve_tool
 from .utils import (
-    dir_total_size, extract_exceeds_limit, verify_output, zip_uncompressed_size,
+    cpu_budget, dir_total_size, extract_exceeds_limit, verify_output,
+    zip_uncompressed_size,
 )
 
 TEMP_PATH = tempfile.gettempdir()
@@ -60,6 +69,9 @@ def _run_command(
     cmd = _expand_globs(cmd, cwd)
     if debug:
         logging.info('command: %s', ' '.join(cmd))
+    scope = race.current_scope()
+    if scope is not None:
+        return race.run_scoped(cmd, cwd, scope, debug=debug)
     try:
         result = subprocess.run(
             cmd,
@@ -84,6 +96,27 @@ def _run_command(
         return None
 
 
+def _run_pipe(
+    cmd: List[str], data: bytes, quiet: bool = False, debug: bool = False,
+) -> Optional[bytes]:
+    """Run a filter command: *data* on stdin, stdout returned. None on failure."""
+    if debug:
+        logging.info('pipe: %s (%d bytes in)', ' '.join(cmd), len(data))
+    try:
+        result = subprocess.run(cmd, input=data, capture_output=True, timeout=3600)
+    except (OSError, subprocess.TimeoutExpired) as exc:
+        if debug:
+            logging.warning('pipe exception: %s', str(exc))
+        return None
+    if result.returncode != 0 or not result.stdout:
+        if debug:
+            logging.warning(
+                'pipe failed with return code %d: %s', result.returncode, ' '.join(cmd),
+            )
+        return None
+    return result.stdout
+
+
 def _calc_savings(insize: int, outsize: int) -> float:
     if insize > 0:
         return (insize - outsize) * 100.0 / insize
@@ -161,6 +194,57 @@ def _commit_output(
         _remove_quietly(temp_path)
 
 
+def _grow_bound(insize: int, ck: Dict[str, Any]) -> Optional[int]:
+    """Largest output _commit_output would still keep; None when growth is allowed."""
+    bounds = []
+    if ck.get('keep_if_larger', True):
+        bounds.append(insize - 1)
+    min_savings = ck.get('min_savings')
+    if min_savings is not None:
+        bounds.append(int(insize * (100.0 - min_savings) / 100.0))
+    return min(bounds) if bounds else None
+
+
+@contextmanager
+def _grow_watch(
+    output: str, bound: Optional[int], read_total: Optional[int] = None,
+) -> Iterator[Optional[race.KillScope]]:
+    """Kill commands run inside once output can no longer come in under bound."""
+    if bound is None:
+        yield None
+        return
+    with race.scoped(race.grow_guard(output, bound, read_total)) as scope:
+        yield scope
+
+
+@contextmanager
+def _encode_watch(
+    output: str, bound: Optional[int], read_total: int, tracker: 'video.EncodeProgress',
+) -> Iterator[race.KillScope]:
+    """Grow watch for ffmpeg encodes, driven by the encoder's -progress stream.
+
+    The reported position projects the output size and checks the time budget;
+    each progress block also reaches on_progress.
+    """
+    scope = race.KillScope(
+        output=output, limit=(lambda: bound) if bound is not None else None,
+        read_total=read_total, over_limit=race.ABORTED_WOULD_GROW,
+        on_stdout=tracker.feed, fraction=tracker.fraction, abort=tracker.over_budget,
+    )
+    with race.scoped(scope):
+        yield scope
+
+
+def _grew(scope: Optional[race.KillScope]) -> bool:
+    return scope is not None and scope.reason == race.ABORTED_WOULD_GROW
+
+
+def _aborted_result(
+    filepath: str, insize: int, note: str = race.ABORTED_WOULD_GROW,
+) -> PackResult:
+    return PackResult(filepath, insize, insize, 0.0, replaced=False, note=note)
+
+
 def _run_to_file(cmd: List[str], out_path: str, debug: bool = False) -> bool:
     if debug:
         logging.info('command: %s', ' '.join(cmd))
@@ -243,9 +327,16 @@ def _pack_pipe_codec(
         _remove_quietly(out_temp)
 
 
-def _compress_file(src: str, dest: str, codec: str, debug: bool = False) -> bool:
+def _compress_file(
+    src: str, dest: str, codec: str, debug: bool = False, ultra: bool = False,
+    threads: Optional[int] = None,
+) -> bool:
     """Compress a single payload file with the named stream codec."""
     if codec == 'gz':
+        if ultra and deflate.gzip_ultra(
+            src, dest, debug=debug, members=True, threads=threads,
+        ):
+            return True
         tool = resolve_tool('pigz')
         if tool:
             return _run_to_file([tool, '-9', '-c', src], dest, debug)
@@ -336,8 +427,16 @@ def pack_parquet(
 
 
 def pack_gzip(
-    filepath: str, debug: bool = False, quiet: bool = False, **commit: Any,
+    filepath: str, debug: bool = False, quiet: bool = False,
+    ultra: bool = False, threads: Optional[int] = None, **commit: Any,
 ) -> Optional[PackResult]:
+    if ultra:
+        res = deflate.pack_gzip_ultra(
+            filepath, debug=debug, threads=threads, **commit,
+        )
+        if res is not None:
+            return res
+
     def _gz_out(path: str):
         return gzip.open(path, 'wb', compresslevel=9)
 
@@ -401,7 +500,7 @@ def pack_brotli(
 
 def pack_avif(
     filepath: str, debug: bool = False, quiet: bool = False,
-    lossy: bool = False, **commit: Any,
+    lossy: bool = False, threads: Optional[int] = None, **commit: Any,
 ) -> Optional[PackResult]:
     avifenc = resolve_tool('avifenc')
     avifdec = resolve_tool('avifdec')
@@ -412,6 +511,7 @@ def pack_avif(
         return None
     insize = os.path.getsize(filepath)
     ck = _commit_kwargs(**commit)
+    workers = str(cpu_budget(threads))
     if avifenc and avifdec:
         png_temp = _make_temp('.png')
         out_temp = _make_temp('.avif')
@@ -421,52 +521,63 @@ def pack_avif(
             )
             if decode is None:
                 return None
-            if lossy:
-                encode_cmd = [avifenc, '-q', '80', png_temp, out_temp]
-            else:
-                encode_cmd = [avifenc, '--lossless', png_temp, out_temp]
-            encode = _run_command(encode_cmd, quiet=quiet, debug=debug)
+            tier = encoder_effort.choose_effort(png_effort.png_dimensions(png_temp))
+            encode_cmd = [avifenc, '--speed', str(tier.avif_speed), '--jobs', workers]
+            encode_cmd += ['-q', '80'] if lossy else ['--lossless']
+            encode = _run_command(encode_cmd + [png_temp, out_temp], quiet=quiet, debug=debug)
             if encode is None:
                 _remove_quietly(out_temp)
                 return None
-            return _commit_output(
+            res = _commit_output(
                 out_temp, filepath, insize, verify='avif', **ck
             )
+            if res is not None:
+                res.method, res.tier = 'avifenc', f'avif:{tier.name}'
+            return res
         finally:
             _remove_quietly(png_temp)
             _remove_quietly(out_temp)
-    out_temp = _make_temp('.avif')
+    return _magick_heif(
+        convert_path or '', filepath, '.avif', 'avif', lossy, workers, debug, quiet, ck,
+    )
+
+
+def _magick_heif(
+    convert_path: str, filepath: str, suffix: str, verify: str, lossy: bool,
+    workers: str, debug: bool, quiet: bool, ck: Dict[str, Any],
+) -> Optional[PackResult]:
+    """ImageMagick (libheif) AVIF/HEIC rewrite with a size-based heic:speed."""
+    insize = os.path.getsize(filepath)
+    tier = encoder_effort.choose_effort(encoder_effort.isobmff_dimensions(filepath))
+    out_temp = _make_temp(suffix)
     quality = '80' if lossy else '100'
     cmd = [
-        convert_path or '', abspath(filepath), '-quality', quality, out_temp
+        convert_path, '-limit', 'thread', workers, abspath(filepath),
+        '-define', f'heic:speed={tier.heic_speed}', '-quality', quality, out_temp,
     ]
     result = _run_command(cmd, quiet=quiet, debug=debug)
     if result is None:
         _remove_quietly(out_temp)
         return None
-    return _commit_output(out_temp, filepath, insize, verify='avif', **ck)
+    res = _commit_output(out_temp, filepath, insize, verify=verify, **ck)
+    if res is not None:
+        res.method, res.tier = 'magick', f'{verify}:{tier.name}'
+    return res
 
 
 def pack_heic(
     filepath: str, debug: bool = False, quiet: bool = False,
-    lossy: bool = False, **commit: Any,
+    lossy: bool = False, threads: Optional[int] = None, **commit: Any,
 ) -> Optional[PackResult]:
     convert_path = resolve_tool('convert')
     if convert_path is None:
         if debug:
             logging.warning('ImageMagick not installed for HEIC')
         return None
-    insize = os.path.getsize(filepath)
     ext = '.' + filepath.rsplit('.', 1)[-1].lower() if '.' in filepath else '.heic'
-    out_temp = _make_temp(ext)
-    quality = '80' if lossy else '100'
-    cmd = [convert_path, abspath(filepath), '-quality', quality, out_temp]
-    result = _run_command(cmd, quiet=quiet, debug=debug)
-    if result is None:
-        _remove_quietly(out_temp)
-        return None
-    return _commit_output(
-        out_temp, filepath, insize, verify='heic', **_commit_kwargs(**commit)
+    return _magick_heif(
+        convert_path, filepath, ext, 'heic', lossy, str(cpu_budget(threads)),
+        debug, quiet, _commit_kwargs(**commit),
     )
 
 
@@ -562,48 +673,93 @@ def build_gs_pdf_cmd(
     return cmd
 
 
-def _maybe_walk_pdf_images(
-    abs_in: str, debug: bool, quiet: bool, commit: Dict[str, Any],
-) -> Tuple[str, Optional[str]]:
-    """Lossless pikepdf image-stream walk. Returns (source, temp-or-None)."""
-    from .pdf_streams import rebuild_pdf_images
-    walked = _make_temp('.pdf')
+def _pikepdf_pdf(
+    abs_in: str, filepath: str, insize: int, debug: bool, quiet: bool,
+    commit: Dict[str, Any], ck: Dict[str, Any], linearize: bool = True,
+    watch: Optional[memory.MemoryWatch] = None,
+) -> Optional[PackResult]:
+    """Image walk, object streams, stream compression and linearization in one pikepdf
+    save. None when pikepdf is missing or cannot rewrite the file (qpdf runs instead).
+    """
+    from .pdf_streams import save_pdf
+    tempfpath = _make_temp('.pdf')
     options = {
         'debug': debug, 'quiet': quiet, 'pack_images': True,
         'keep_meta': bool(commit.get('keep_meta', False)),
         'ultra': bool(commit.get('ultra', False)),
+        'threads': commit.get('threads'),
     }
-    if rebuild_pdf_images(abs_in, walked, options):
-        return walked, walked
-    _remove_quietly(walked)
-    return abs_in, None
+    if not save_pdf(abs_in, tempfpath, options, linearize=linearize, watch=watch):
+        _remove_quietly(tempfpath)
+        return None
+    res = _commit_output(tempfpath, filepath, insize, verify='pdf', **ck)
+    if res is not None:
+        res.method = 'pikepdf'
+    return res
 
 
 def _qpdf_linearize(
-    qpdf_path: Optional[str], walk_src: str, walked: Optional[str],
-    filepath: str, insize: int, debug: bool, quiet: bool, ck: Dict[str, Any],
+    qpdf_path: Optional[str], abs_in: str, filepath: str, insize: int,
+    debug: bool, quiet: bool, ck: Dict[str, Any], linearize: bool = True,
+    watch: Optional[memory.MemoryWatch] = None,
 ) -> Optional[PackResult]:
+    """qpdf rewrite. Under a watch with a ceiling, qpdf is killed above it and retried
+    once without --linearize.
+    """
     if not qpdf_path:
-        if walked:
-            return _commit_output(walked, filepath, insize, verify='pdf', **ck)
         return None
     tempfpath = _make_temp('.pdf')
-    cmd = [
-        qpdf_path, '--linearize', '--object-streams=generate',
-        '--compress-streams=y', walk_src, tempfpath,
+    cmd = [qpdf_path] + (['--linearize'] if linearize else []) + [
+        '--object-streams=generate', '--compress-streams=y', abs_in, tempfpath,
     ]
     if debug:
         logging.info('qpdf cmd: %s', ' '.join(cmd))
-    result = _run_command(cmd, quiet=quiet, debug=debug)
+    if watch is None:
+        result = _run_command(cmd, quiet=quiet, debug=debug)
+    else:
+        base = memory.rss() or 0
+        ceiling = max(1, watch.ceiling - base) if watch.ceiling else None
+        with race.scoped(race.KillScope(max_rss=ceiling, track_rss=True)) as scope:
+            result = _run_command(cmd, quiet=quiet, debug=debug)
+        watch.note(base + scope.peak_rss)
+        if result is None and linearize and scope.reason == memory.ABORTED_MEMORY:
+            _remove_quietly(tempfpath)
+            watch.degraded = True
+            return _qpdf_linearize(
+                qpdf_path, abs_in, filepath, insize, debug, quiet, ck, False, watch,
+            )
     if result is None:
         _remove_quietly(tempfpath)
-        if walked:
-            return _commit_output(walked, filepath, insize, verify='pdf', **ck)
         return None
-    _remove_quietly(walked)
     return _commit_output(tempfpath, filepath, insize, verify='pdf', **ck)
 
 
+def _lossless_pdf(
+    qpdf_path: Optional[str], abs_in: str, filepath: str, insize: int,
+    debug: bool, quiet: bool, commit: Dict[str, Any], ck: Dict[str, Any],
+) -> Optional[PackResult]:
+    """pikepdf, else qpdf, under a memory watch. metrics carries peak_rss_mb.
+
+    With max_memory_bytes, files too large to linearize under the ceiling are written
+    without linearization, and the note says so.
+    """
+    with memory.MemoryWatch(commit.get('max_memory_bytes')) as watch:
+        linearize = watch.fits(insize * PDF_LINEARIZE_RSS_FACTOR)
+        watch.degraded = not linearize
+        res = _pikepdf_pdf(
+            abs_in, filepath, insize, debug, quiet, commit, ck, linearize, watch,
+        )
+        if res is None:
+            res = _qpdf_linearize(
+                qpdf_path, abs_in, filepath, insize, debug, quiet, ck, linearize, watch,
+            )
+    if res is not None:
+        res.metrics['peak_rss_mb'] = memory.megabytes(watch.peak)
+        if watch.degraded and res.note is None:
+            res.note = 'memory ceiling: not linearized'
+    return res
+
+
 def _gs_pdf(
     gs_path: Optional[str], abs_in: str, filepath: str, insize: int,
     gs_profile: str, jpeg_quality: Optional[int],
@@ -618,10 +774,11 @@ def _gs_pdf(
     )
     if debug:
         logging.info('ghostscript cmd: %s', ' '.join(cmd))
-    result = _run_command(cmd, quiet=quiet, debug=debug)
+    with _grow_watch(tempfpath, _grow_bound(insize, ck), insize) as watch:
+        result = _run_command(cmd, quiet=quiet, debug=debug)
     if result is None:
         _remove_quietly(tempfpath)
-        return None
+        return _aborted_result(filepath, insize) if _grew(watch) else None
     return _commit_output(tempfpath, filepath, insize, verify='pdf', **ck)
 
 
@@ -630,13 +787,17 @@ def pack_pdf(
     lossy: bool = False, pdf_profile: Optional[str] = None,
     jpeg_quality: Optional[int] = None, **commit: Any,
 ) -> Optional[PackResult]:
-    """Compress PDF. Default is lossless qpdf; Ghostscript is opt-in lossy."""
+    """Compress PDF. Lossless is one pikepdf save (qpdf without pikepdf);
+    Ghostscript is opt-in lossy.
+    """
+    from .pdf_streams import pikepdf_available
+
     insize = os.path.getsize(filepath)
     gs_path = resolve_tool('gs')
     qpdf_path = resolve_tool('qpdf')
-    if gs_path is None and qpdf_path is None:
+    if gs_path is None and qpdf_path is None and not pikepdf_available():
         if debug:
-            logging.warning('Neither ghostscript nor qpdf is installed')
+            logging.warning('Neither ghostscript, qpdf nor pikepdf is installed')
         return None
 
     try:
@@ -650,20 +811,23 @@ def pack_pdf(
     ck = _commit_kwargs(**commit)
     use_gs = bool(lossy or profile is not None or jpeg_quality is not None)
     gs_profile = profile or DEFAULT_LOSSY_PDF_PROFILE
-    walk_src, walked = abs_in, None
     if not use_gs:
-        walk_src, walked = _maybe_walk_pdf_images(abs_in, debug, quiet, commit)
-
-    if use_gs:
+        return _lossless_pdf(qpdf_path, abs_in, filepath, insize, debug, quiet, commit, ck)
+    gs_result = None
+    if gs_path and qpdf_path:
+        from .pdf_pages import pack_gs_ranges
+        gs_result = pack_gs_ranges(
+            filepath, gs_path, qpdf_path, gs_profile, jpeg_quality,
+            threads=commit.get('threads'), debug=debug, quiet=quiet, **ck,
+        )
+    if not gs_result:
         gs_result = _gs_pdf(
             gs_path, abs_in, filepath, insize, gs_profile, jpeg_quality,
             debug, quiet, ck,
         )
-        if gs_result:
-            return gs_result
-    return _qpdf_linearize(
-        qpdf_path, walk_src, walked, filepath, insize, debug, quiet, ck,
-    )
+    if gs_result:
+        return gs_result
+    return _qpdf_linearize(qpdf_path, abs_in, filepath, insize, debug, quiet, ck)
 
 
 def pack_gif(
@@ -688,44 +852,67 @@ def pack_gif(
     )
 
 
-def pack_webp(
-    filepath: str, debug: bool = False, quiet: bool = False, **commit: Any,
-) -> Optional[PackResult]:
-    dwebp_path = resolve_tool('dwebp')
+def _webp_candidates(
+    filepath: str, keep_meta: bool, lossy: bool, debug: bool, quiet: bool,
+    info: Optional[webp_scan.WebpInfo] = None,
+) -> List[race.Candidate]:
+    """In-process metadata strip, plus cwebp straight from the WebP input.
+
+    Lossless files re-encode with -lossless -exact; lossy ones only under --lossy.
+    Animated files get the strip alone, which keeps every frame.
+    """
+    info = info or webp_scan.inspect(filepath)
+    candidates: List[race.Candidate] = []
+    if not keep_meta:
+        candidates.append(race.Candidate(
+            'strip', lambda out: strip.strip_metadata(filepath, out, 'webp'),
+        ))
+    if info is None or info.kind == webp_scan.ANIMATED:
+        return candidates
+    if info.kind == webp_scan.LOSSY and not lossy:
+        return candidates
+    if keep_meta and info.metadata:
+        # cwebp does not carry EXIF/XMP/ICC over from WebP input.
+        return candidates
     cwebp_path = resolve_tool('cwebp')
-    if dwebp_path is None or cwebp_path is None:
+    if cwebp_path is None:
         if debug:
-            logging.warning('dwebp or cwebp not installed')
-        return None
-    insize = os.path.getsize(filepath)
-    temp_png = _make_temp('.png')
-    tempfpath = _make_temp('.webp')
-    try:
-        abs_in = abspath(filepath)
-        decode = _run_command(
-            [dwebp_path, abs_in, '-o', temp_png], quiet=quiet, debug=debug
-        )
-        if decode is None:
-            return None
-        encode = _run_command(
-            [cwebp_path, '-lossless', '-z', '9', temp_png, '-o', tempfpath],
-            quiet=quiet, debug=debug,
-        )
-        if encode is None:
-            _remove_quietly(tempfpath)
-            return None
-        return _commit_output(
-            tempfpath, filepath, insize, verify='webp', **_commit_kwargs(**commit)
-        )
-    finally:
-        _remove_quietly(temp_png)
-        _remove_quietly(tempfpath)
+            logging.warning('cwebp not installed')
+        return candidates
+    cmd = [cwebp_path, '-mt', '-metadata', 'none']
+    if info.kind == webp_scan.LOSSLESS:
+        cmd += ['-lossless', '-exact', '-z', '9']
+    else:
+        cmd += ['-q', str(DEFAULT_WEBP_QUALITY), '-m', '6']
+
+    def _encode(out: str) -> bool:
+        return _run_command(
+            cmd + [abspath(filepath), '-o', out], quiet=quiet, debug=debug,
+        ) is not None
+
+    candidates.append(race.Candidate('cwebp', _encode))
+    return candidates
+
+
+def pack_webp(
+    filepath: str, debug: bool = False, quiet: bool = False,
+    keep_meta: bool = False, lossy: bool = False,
+    threads: Optional[int] = None, **commit: Any,
+) -> Optional[PackResult]:
+    info = webp_scan.inspect(filepath)
+    candidates = _webp_candidates(filepath, keep_meta, lossy, debug, quiet, info=info)
+    res = race.pack_race(
+        filepath, candidates, '.webp', 'webp', threads=threads, debug=debug, **commit,
+    )
+    if res is not None and info is not None:
+        res.tier = f'webp:{info.kind}'
+    return res
 
 
 def pack_svg(
     filepath: str, debug: bool = False, quiet: bool = False, **commit: Any,
 ) -> Optional[PackResult]:
-    from .markup import pack_xml, rewrite_data_uris
+    from .markup import pack_xml
 
     svgo_path = resolve_tool('svgo')
     scour_path = resolve_tool('scour') if svgo_path is None else None
@@ -746,8 +933,18 @@ def pack_svg(
     if result is None:
         _remove_quietly(tempfpath)
         return pack_xml(filepath, debug=debug, quiet=quiet, **commit)
+    _svg_data_uris(tempfpath, debug, quiet, **commit)
+    return _commit_output(
+        tempfpath, filepath, insize, verify='svg', **_commit_kwargs(**commit)
+    )
+
+
+def _svg_data_uris(path: str, debug: bool, quiet: bool, **commit: Any) -> None:
+    """Repack base64 images embedded in an optimized SVG, in place."""
+    from .markup import rewrite_data_uris
+
     try:
-        with open(tempfpath, 'r', encoding='utf-8') as fh:
+        with open(path, 'r', encoding='utf-8') as fh:
             text = fh.read()
         options = {
             'debug': debug, 'quiet': quiet, 'pack_images': True,
@@ -756,86 +953,140 @@ def pack_svg(
         }
         rewritten = rewrite_data_uris(text, options)
         if rewritten != text:
-            with open(tempfpath, 'w', encoding='utf-8') as fh:
+            with open(path, 'w', encoding='utf-8') as fh:
                 fh.write(rewritten)
     except (OSError, UnicodeError):
         pass
-    return _commit_output(
-        tempfpath, filepath, insize, verify='svg', **_commit_kwargs(**commit)
-    )
 
 
-def pack_tif(
-    filepath: str, debug: bool = False, quiet: bool = False, **commit: Any,
-) -> Optional[PackResult]:
+def _tif_candidates(
+    filepath: str, debug: bool, quiet: bool,
+) -> List[race.Candidate]:
     convert_path = resolve_tool('convert')
     tiffcp_path = resolve_tool('tiffcp')
-    if convert_path is None and tiffcp_path is None:
-        if debug:
-            logging.warning('Neither ImageMagick nor tiffcp is installed')
-        return None
-    insize = os.path.getsize(filepath)
     abs_in = abspath(filepath)
-    ck = _commit_kwargs(**commit)
-
+    candidates: List[race.Candidate] = []
     if convert_path:
-        tempfpath = _make_temp('.tif')
-        cmd = [
-            convert_path, abs_in, '-compress', 'lzw', '-strip', '-quiet',
-            tempfpath,
-        ]
-        result = _run_command(cmd, quiet=quiet, debug=debug)
-        if result is not None:
-            packed = _commit_output(
-                tempfpath, filepath, insize, verify='tif', **ck
-            )
-            if packed:
-                return packed
-        _remove_quietly(tempfpath)
+        def _convert(out: str) -> bool:
+            cmd = [convert_path, abs_in, '-compress', 'lzw', '-strip', '-quiet', out]
+            return _run_command(cmd, quiet=quiet, debug=debug) is not None
 
+        candidates.append(race.Candidate('convert', _convert))
     if tiffcp_path:
-        tempfpath = _make_temp('.tif')
-        cmd = [tiffcp_path, '-c', 'lzw', abs_in, tempfpath]
-        result = _run_command(cmd, quiet=quiet, debug=debug)
-        if result is None:
-            _remove_quietly(tempfpath)
-            return None
-        return _commit_output(tempfpath, filepath, insize, verify='tif', **ck)
-    return None
+        def _tiffcp(out: str) -> bool:
+            cmd = [tiffcp_path, '-c', 'lzw', abs_in, out]
+            return _run_command(cmd, quiet=quiet, debug=debug) is not None
+
+        candidates.append(race.Candidate('tiffcp', _tiffcp))
+    return candidates
+
+
+def pack_tif(
+    filepath: str, debug: bool = False, quiet: bool = False,
+    threads: Optional[int] = None, ultra: bool = False, **commit: Any,
+) -> Optional[PackResult]:
+    tiffcp_path = resolve_tool('tiffcp')
+    info = tiff.read_info(filepath) if tiffcp_path else None
+    if info is not None:
+        return tiff.pack_tiffcp(
+            filepath, tiffcp_path, info, tiff.trial_specs(info, ultra=bool(ultra)),
+            '.tif', 'tif', threads=threads, debug=debug, quiet=quiet, **commit,
+        )
+    candidates = _tif_candidates(filepath, debug, quiet)
+    if not candidates:
+        if debug:
+            logging.warning('Neither ImageMagick nor tiffcp is installed')
+        return None
+    return race.pack_race(
+        filepath, candidates, '.tif', 'tif', threads=threads, debug=debug, **commit,
+    )
 
 
 def _encode_video(
     ffmpeg_path: str, src: str, dest: str, lossless: bool,
     quiet: bool, debug: bool, container: str = 'mp4',
 ) -> bool:
-    if container == 'webm':
-        if lossless:
-            cmd = [
-                ffmpeg_path, '-i', abspath(src), '-c:v', 'libvpx-vp9',
-                '-lossless', '1', '-c:a', 'copy', '-y', dest,
-            ]
-        else:
-            cmd = [
-                ffmpeg_path, '-i', abspath(src), '-c:v', 'libvpx-vp9',
-                '-crf', '18', '-b:v', '0', '-c:a', 'copy', '-y', dest,
-            ]
-    else:
-        crf = '0' if lossless else '18'
-        preset = 'veryslow' if lossless else 'slow'
-        cmd = [
-            ffmpeg_path, '-i', abspath(src), '-c:v', 'libx264', '-crf', crf,
-            '-preset', preset, '-c:a', 'copy', '-y', dest,
-        ]
-        if container in ('mp4', 'mov', 'm4v'):
-            cmd[-2:-2] = ['-movflags', '+faststart']
+    cmd = [ffmpeg_path, '-progress', 'pipe:1', '-nostats', '-i', abspath(src)]
+    cmd += video.codec_args(lossless, container)
+    cmd += ['-c:a', 'copy']
+    if container in video.MP4_FAMILY:
+        cmd += ['-movflags', '+faststart']
+    cmd += ['-y', dest]
     result = _run_command(cmd, quiet=quiet, debug=debug)
     return result is not None and os.path.exists(dest) and os.path.getsize(dest) > 0
 
 
+def _video_dest(result: PackResult, filepath: str, dest: str) -> PackResult:
+    """After a container change, drop the source once replaced; else report the source."""
+    if dest != filepath:
+        if result.replaced:
+            _remove_quietly(filepath)
+        else:
+            result.filepath = filepath
+    return result
+
+
+def _remux_video(
+    ffmpeg_path: str, filepath: str, suffix: str, container: str, insize: int,
+    debug: bool, quiet: bool,
+) -> Optional[str]:
+    """Stream-copy remux into a temp file; None when it fails or does not shrink."""
+    tempfpath = _make_temp(suffix)
+    cmd = video.remux_cmd(ffmpeg_path, filepath, tempfpath, container)
+    if _run_command(cmd, quiet=quiet, debug=debug) is None or \
+            not os.path.exists(tempfpath) or not 0 < os.path.getsize(tempfpath) < insize:
+        _remove_quietly(tempfpath)
+        return None
+    return tempfpath
+
+
+def _commit_remux(
+    remuxed: str, filepath: str, dest: str, insize: int, verify: str, ck: Dict[str, Any],
+) -> Optional[PackResult]:
+    """Commit the stream-copy remux (tier video:remux)."""
+    result = _commit_output(remuxed, dest, insize, verify=verify, **ck)
+    if result is None:
+        return None
+    result.method, result.tier = 'ffmpeg remux', 'video:remux'
+    return _video_dest(result, filepath, dest)
+
+
+def _preflight_video(
+    ffmpeg_path: str, filepath: str, info: Optional[media.MediaInfo], lossless: bool,
+    container: str, insize: int, bound: Optional[int], max_encode_seconds: Optional[float],
+    threads: Optional[int], debug: bool, quiet: bool,
+) -> Tuple[Optional[video.Estimate], Optional[PackResult]]:
+    """Sample-encode estimate, plus a skip result when it misses the size or time budget."""
+    if bound is None and not max_encode_seconds:
+        return None, None
+    estimate = video.preflight(
+        ffmpeg_path, filepath, info, lossless, container, threads, debug, quiet,
+    )
+    if estimate is None:
+        return None, None
+    note = None
+    if bound is not None and estimate.size > bound:
+        note = video.SKIP_PREDICTED_SAVINGS
+    elif max_encode_seconds and estimate.seconds > max_encode_seconds:
+        note = video.SKIP_PREDICTED_TIME
+    if note is None:
+        return estimate, None
+    logging.info(
+        'video estimate for %s: predicted %d bytes in %.0fs, %s',
+        filepath, estimate.size, estimate.seconds, note,
+    )
+    return estimate, PackResult(
+        filepath, insize, insize, 0.0, replaced=False, method='skip', note=note,
+        tier='video:predicted', metrics=estimate.metrics(),
+    )
+
+
 def _pack_video(
     filepath: str, mode: str, lossless: bool = False,
     convert_container: bool = True, debug: bool = False, quiet: bool = False,
-    **commit: Any,
+    segments: Optional[int] = None, threads: Optional[int] = None,
+    on_progress: Optional[Callable[..., None]] = None,
+    max_encode_seconds: Optional[float] = None, **commit: Any,
 ) -> Optional[PackResult]:
     ffmpeg_path = resolve_tool('ffmpeg')
     if ffmpeg_path is None:
@@ -843,6 +1094,12 @@ def _pack_video(
             logging.warning('ffmpeg not installed')
         return None
     insize = os.path.getsize(filepath)
+    info = media.probe(filepath, debug=debug)
+    if info is not None and info.video is None:
+        return PackResult(
+            filepath, insize, insize, 0.0, replaced=False,
+            method='skip', tier='video:no-stream',
+        )
     keep_modes = {'mp4', 'mkv', 'webm', 'mov', 'm4v'}
     known = keep_modes | {'3gp', 'ts', 'mts', 'm2ts'}
     dest = filepath
@@ -858,30 +1115,97 @@ def _pack_video(
         verify = 'ts'
     else:
         verify = out_mode
+    ck = _commit_kwargs(**commit)
+    remuxed = None
+    if video.remux_compatible(info, out_mode):
+        remuxed = _remux_video(ffmpeg_path, filepath, suffix, out_mode, insize, debug, quiet)
+    bound = _grow_bound(insize, ck)
+    if remuxed is not None:
+        # The encode is only worth keeping when it beats the stream copy.
+        remux_bound = os.path.getsize(remuxed) - 1
+        bound = remux_bound if bound is None else min(bound, remux_bound)
+
+    def _keep_remux() -> Optional[PackResult]:
+        if remuxed is None:
+            return None
+        return _commit_remux(remuxed, filepath, dest, insize, verify, ck)
+
     tempfpath = _make_temp(suffix)
     try:
-        if not _encode_video(
-            ffmpeg_path, filepath, tempfpath, lossless, quiet, debug,
-            container=out_mode,
-        ):
-            return None
-        result = _commit_output(
-            tempfpath, dest, insize, verify=verify, **_commit_kwargs(**commit)
+        estimate, skipped = _preflight_video(
+            ffmpeg_path, filepath, info, lossless, out_mode, insize, bound,
+            max_encode_seconds, threads, debug, quiet,
         )
-        if result and result.replaced and dest != filepath:
-            _remove_quietly(filepath)
-            return PackResult(
-                dest, result.insize, result.outsize, result.savings_pct, True
+        if skipped is not None:
+            kept = _keep_remux()
+            return kept if kept is not None and kept.replaced else skipped
+        if remuxed is not None and estimate is None:
+            # Nothing predicts the encode beating the stream copy; do not spend it.
+            kept = _keep_remux()
+            if kept is not None:
+                return kept
+        parts = None
+        started = time.monotonic()
+        if segments:
+            segment_watch = video.SegmentWatch(bound, max_encode_seconds)
+            with _grow_watch(tempfpath, bound, insize) as grow:
+                parts = video.encode_segments(
+                    ffmpeg_path, resolve_tool('ffprobe'), filepath, tempfpath, info,
+                    lossless, out_mode, segments, threads=threads,
+                    on_progress=on_progress, debug=debug, quiet=quiet, watch=segment_watch,
+                )
+            if parts is None and _grew(grow):
+                return _keep_remux() or _aborted_result(filepath, insize)
+            if parts is None and segment_watch.reason is not None:
+                return _keep_remux() or _aborted_result(filepath, insize, segment_watch.reason)
+        if parts is None:
+            budget = max_encode_seconds
+            if budget and segments:
+                # The failed segment attempt already spent part of --max-encode-time.
+                budget -= time.monotonic() - started
+                if budget <= 0:
+                    return _keep_remux() or _aborted_result(
+                        filepath, insize, video.ABORTED_TIME_BUDGET,
+                    )
+            tracker = video.EncodeProgress(
+                info.duration if info is not None else 0.0, filepath, on_progress, budget,
             )
-        if result and dest != filepath:
-            return PackResult(
-                dest if result.replaced else filepath,
-                result.insize, result.outsize, result.savings_pct,
-                result.replaced,
+            with _encode_watch(tempfpath, bound, insize, tracker) as watch:
+                encoded = _encode_video(
+                    ffmpeg_path, filepath, tempfpath, lossless, quiet, debug,
+                    container=out_mode,
+                )
+            if not encoded:
+                kept = _keep_remux()
+                if kept is not None:
+                    return kept
+                if watch.reason in (race.ABORTED_WOULD_GROW, video.ABORTED_TIME_BUDGET):
+                    return _aborted_result(filepath, insize, watch.reason)
+                return None
+        elapsed = time.monotonic() - started
+        encoded_size = os.path.getsize(tempfpath)
+        if remuxed is not None and encoded_size >= os.path.getsize(remuxed):
+            return _keep_remux()
+        result = _commit_output(tempfpath, dest, insize, verify=verify, **ck)
+        if result is None:
+            return None
+        result.tier = 'video:encode'
+        if parts is not None:
+            result.method = 'ffmpeg segments'
+            result.metrics['segments'] = float(parts)
+        if estimate is not None:
+            result.metrics.update(estimate.metrics())
+            result.metrics['encoded_bytes'] = float(encoded_size)
+            result.metrics['encode_seconds'] = round(elapsed, 1)
+            logging.info(
+                'video estimate for %s: predicted %d bytes in %.0fs, actual %d bytes in %.0fs',
+                filepath, estimate.size, estimate.seconds, encoded_size, elapsed,
             )
-        return result
+        return _video_dest(result, filepath, dest)
     finally:
         _remove_quietly(tempfpath)
+        if remuxed is not None:
+            _remove_quietly(remuxed)
 
 
 def pack_wmv(
@@ -944,51 +1268,93 @@ def pack_webm(
     )
 
 
+def _jpg_candidates(
+    jpeg_quality: Optional[int], lossy: bool, keep_meta: bool,
+    debug: bool, quiet: bool, strip_only: bool = False,
+) -> List[race.Candidate]:
+    """jpegtran+jpegoptim chain vs jpegoptim alone (lossless); jpegoptim -m (lossy).
+
+    strip_only: entropy coding is already optimal, so jpegoptim alone is enough.
+    """
+    jpegoptim_path = resolve_tool('jpegoptim')
+    jpegtran_path = resolve_tool('jpegtran')
+    use_lossy = jpeg_quality is not None or lossy
+
+    def _jpegoptim(work: str) -> bool:
+        if jpegoptim_path is None:
+            return False
+        cmd = [jpegoptim_path, '-p', '-o']
+        if not keep_meta:
+            cmd.append('--strip-all')
+        if use_lossy:
+            quality = (
+                jpeg_quality if jpeg_quality is not None
+                else DEFAULT_JPEG_QUALITY
+            )
+            cmd.append(f'-m{quality}')
+        cmd.append(work)
+        return _run_command(cmd, quiet=quiet, debug=debug) is not None
+
+    if use_lossy or jpegtran_path is None or (strip_only and jpegoptim_path):
+        if jpegoptim_path is None:
+            return []
+        return [race.Candidate('jpegoptim', _jpegoptim, in_place=True)]
+
+    def _chain(work: str) -> bool:
+        ok1 = _jpegtran_inplace(
+            jpegtran_path, work, keep_meta=keep_meta, debug=debug, quiet=quiet,
+        )
+        ok2 = _jpegoptim(work)
+        return ok1 or ok2
+
+    if jpegoptim_path is None:
+        return [race.Candidate('jpegtran', _chain, in_place=True)]
+    return [
+        race.Candidate('jpegtran+jpegoptim', _chain, in_place=True),
+        race.Candidate('jpegoptim', _jpegoptim, in_place=True),
+    ]
+
+
 def pack_jpg(
     filepath: str, debug: bool = False, quiet: bool = False,
     jpeg_quality: Optional[int] = None, lossy: bool = False,
-    keep_meta: bool = False, **commit: Any,
+    keep_meta: bool = False, threads: Optional[int] = None, **commit: Any,
 ) -> Optional[PackResult]:
-    jpegoptim_path = resolve_tool('jpegoptim')
-    jpegtran_path = resolve_tool('jpegtran')
-    if jpegoptim_path is None and jpegtran_path is None:
+    cls = None
+    if jpeg_quality is None and not lossy:
+        cls = jpeg_scan.classify(jpeg_scan.scan(filepath), keep_meta)
+        if cls == jpeg_scan.OPTIMAL:
+            insize = os.path.getsize(filepath)
+            return PackResult(
+                filepath, insize, insize, 0.0, replaced=False,
+                method='skip', tier='jpeg:optimal',
+            )
+        if cls == jpeg_scan.METADATA:
+            res = strip.pack_strip(filepath, 'jpg', debug=debug, **commit)
+            if res is not None:
+                res.tier = 'jpeg:metadata'
+                return res
+    candidates = _jpg_candidates(
+        jpeg_quality, lossy, keep_meta, debug, quiet,
+        strip_only=cls == jpeg_scan.METADATA,
+    )
+    if not candidates:
         if debug:
             logging.warning('jpegoptim/jpegtran not installed')
         return None
-    insize = os.path.getsize(filepath)
-    work = _make_temp('.jpg')
-    copyfile(filepath, work)
-    ck = _commit_kwargs(**commit)
-    use_lossy = jpeg_quality is not None or lossy
-    try:
-        if jpegtran_path and not use_lossy:
-            _jpegtran_inplace(
-                jpegtran_path, work, keep_meta=keep_meta,
-                debug=debug, quiet=quiet,
-            )
-        if jpegoptim_path:
-            cmd = [jpegoptim_path, '-p', '-o']
-            if not keep_meta:
-                cmd.append('--strip-all')
-            if use_lossy:
-                quality = (
-                    jpeg_quality if jpeg_quality is not None
-                    else DEFAULT_JPEG_QUALITY
-                )
-                cmd.append(f'-m{quality}')
-            cmd.append(work)
-            result = _run_command(cmd, quiet=quiet, debug=debug)
-            if result is None and jpegtran_path is None:
-                return None
-        return _commit_output(work, filepath, insize, verify='jpg', **ck)
-    finally:
-        _remove_quietly(work)
+    res = race.pack_race(
+        filepath, candidates, '.jpg', 'jpg', threads=threads, debug=debug, **commit,
+    )
+    if res is not None and cls is not None:
+        res.tier = f'jpeg:{cls}'
+    return res
 
 
 def _jpegtran_inplace(
     jpegtran_path: str, work: str, keep_meta: bool,
     debug: bool, quiet: bool,
-) -> None:
+) -> bool:
+    """jpegtran -optimize -progressive over work, kept when smaller; False when it failed."""
     out = _make_temp('.jpg')
     copy_mode = 'all' if keep_meta else 'none'
     cmd = [
@@ -998,11 +1364,12 @@ def _jpegtran_inplace(
     result = _run_command(cmd, quiet=quiet, debug=debug)
     if result is None or not verify_output(out, 'jpg'):
         _remove_quietly(out)
-        return
+        return False
     if os.path.getsize(out) < os.path.getsize(work):
         os.replace(out, work)
     else:
         _remove_quietly(out)
+    return True
 
 
 def _pngquant_lossy(
@@ -1030,49 +1397,56 @@ def _pngquant_lossy(
 
 def _png_lossless_candidates(
     filepath: str, ultra: bool, keep_meta: bool, debug: bool, quiet: bool,
-) -> List[str]:
+    tier: Optional[png_effort.PngTier] = None,
+) -> List[race.Candidate]:
+    tier = tier or png_effort.choose_tier(filepath)
     oxipng_path = resolve_tool('oxipng')
     optipng_path = resolve_tool('optipng')
-    zopflipng_path = resolve_tool('zopflipng') if ultra else None
+    zopflipng_path = resolve_tool('zopflipng') if ultra and tier.zopfli else None
+    candidates: List[race.Candidate] = []
+    if not keep_meta:
+        candidates.append(race.Candidate(
+            'strip', lambda out: strip.strip_metadata(filepath, out, 'png'),
+        ))
     if oxipng_path is None and optipng_path is None and zopflipng_path is None:
         if debug:
             logging.warning('oxipng/optipng not installed for lossless PNG')
-        return []
+        return candidates
 
-    candidates: List[str] = []
     if oxipng_path or optipng_path:
-        tempfpath = _make_temp('.png')
-        copyfile(filepath, tempfpath)
-        if oxipng_path:
-            cmd = [oxipng_path, '-o', '4', '-q', tempfpath]
-            if not keep_meta:
-                cmd[3:3] = ['--strip', 'safe']
-        else:
-            cmd = [optipng_path or '', '-o7', '-quiet', tempfpath]
-        result = _run_command(cmd, quiet=quiet, debug=debug)
-        if result is not None and verify_output(tempfpath, 'png'):
-            candidates.append(tempfpath)
-        else:
-            _remove_quietly(tempfpath)
+        def _lossless(work: str) -> bool:
+            if oxipng_path:
+                cmd = [oxipng_path, '-o', tier.oxipng_level]
+                if not keep_meta:
+                    cmd += ['--strip', 'safe']
+                cmd += ['--timeout', str(tier.timeout), '-q', work]
+            else:
+                cmd = [optipng_path or '', f'-o{tier.optipng_level}', '-quiet', work]
+            return _run_command(cmd, quiet=quiet, debug=debug) is not None
+
+        name = 'oxipng' if oxipng_path else 'optipng'
+        candidates.append(race.Candidate(name, _lossless, in_place=True))
 
     if zopflipng_path:
-        z_out = _make_temp('.png')
-        cmd = [zopflipng_path, '-y']
-        if keep_meta:
-            cmd.append('--keepchunks=iCCP,sRGB,gAMA,pHYs,eXIf,tEXt,zTXt,iTXt')
-        cmd.extend([abspath(filepath), z_out])
-        result = _run_command(cmd, quiet=quiet, debug=debug)
-        if result is not None and verify_output(z_out, 'png'):
-            candidates.append(z_out)
-        else:
-            _remove_quietly(z_out)
+        def _zopflipng(out: str) -> bool:
+            cmd = [zopflipng_path, '-y']
+            if keep_meta:
+                cmd.append('--keepchunks=iCCP,sRGB,gAMA,pHYs,eXIf,tEXt,zTXt,iTXt')
+            cmd.extend([abspath(filepath), out])
+            return _run_command(cmd, quiet=quiet, debug=debug) is not None
+
+        candidates.append(race.Candidate(
+            'zopflipng', _zopflipng,
+            timeout=min(tier.timeout, RACE_SLOW_CANDIDATE_SECONDS),
+        ))
     return candidates
 
 
 def pack_png(
     filepath: str, debug: bool = False, quiet: bool = False,
     png_quality: Optional[str] = None, lossy: bool = False,
-    ultra: bool = False, keep_meta: bool = False, **commit: Any,
+    ultra: bool = False, keep_meta: bool = False,
+    threads: Optional[int] = None, **commit: Any,
 ) -> Optional[PackResult]:
     insize = os.path.getsize(filepath)
     ck = _commit_kwargs(**commit)
@@ -1082,16 +1456,17 @@ def pack_png(
             return None
         return _commit_output(tempfpath, filepath, insize, verify='png', **ck)
 
+    tier = png_effort.choose_tier(filepath)
     candidates = _png_lossless_candidates(
-        filepath, ultra, keep_meta, debug, quiet,
+        filepath, ultra, keep_meta, debug, quiet, tier=tier,
     )
-    if not candidates:
-        return None
-    best = min(candidates, key=os.path.getsize)
-    for path in candidates:
-        if path != best:
-            _remove_quietly(path)
-    return _commit_output(best, filepath, insize, verify='png', **ck)
+    res = race.pack_race(
+        filepath, candidates, '.png', 'png',
+        threads=tier.threads or threads, debug=debug, **commit,
+    )
+    if res is not None:
+        res.tier = f'png:{tier.name}'
+    return res
 
 
 @dataclass
@@ -1101,31 +1476,44 @@ class PackerSpec:
     extra: Dict[str, str] = field(default_factory=dict)
 
 
+_VIDEO_EXTRA = {
+    'wmv_lossless': 'lossless', 'video_segments': 'segments', 'threads': 'threads',
+    'max_encode_seconds': 'max_encode_seconds',
+}
+_VIDEO_CONVERT_EXTRA = {**_VIDEO_EXTRA, 'convert_container': 'convert_container'}
+
 _PACKERS: Dict[str, PackerSpec] = {
     'jpg': PackerSpec(pack_jpg, 'image', {
-        'jpeg_quality': 'jpeg_quality', 'keep_meta': 'keep_meta',
+        'jpeg_quality': 'jpeg_quality', 'keep_meta': 'keep_meta', 'threads': 'threads',
     }),
     'png': PackerSpec(pack_png, 'image', {
         'png_quality': 'png_quality', 'ultra': 'ultra', 'keep_meta': 'keep_meta',
+        'threads': 'threads',
     }),
     'gif': PackerSpec(pack_gif, 'image'),
-    'webp': PackerSpec(pack_webp, 'image'),
+    'webp': PackerSpec(pack_webp, 'image', {'keep_meta': 'keep_meta', 'threads': 'threads'}),
     'svg': PackerSpec(pack_svg, 'image', {'keep_meta': 'keep_meta'}),
-    'svgz': PackerSpec(extra_codecs.pack_svgz, 'image'),
-    'tif': PackerSpec(pack_tif, 'image'),
-    'tiff': PackerSpec(pack_tif, 'image'),
-    'jxl': PackerSpec(extra_codecs.pack_jxl, 'image'),
+    'svgz': PackerSpec(extra_codecs.pack_svgz, 'image', {
+        'ultra': 'ultra', 'threads': 'threads',
+    }),
+    'tif': PackerSpec(pack_tif, 'image', {'ultra': 'ultra', 'threads': 'threads'}),
+    'tiff': PackerSpec(pack_tif, 'image', {'ultra': 'ultra', 'threads': 'threads'}),
+    'jxl': PackerSpec(extra_codecs.pack_jxl, 'image', {'threads': 'threads'}),
     'jp2': PackerSpec(extra_codecs.pack_jp2, 'image'),
     'j2k': PackerSpec(extra_codecs.pack_jp2, 'image'),
     'jpf': PackerSpec(extra_codecs.pack_jp2, 'image'),
     'jpx': PackerSpec(extra_codecs.pack_jp2, 'image'),
-    'exr': PackerSpec(extra_codecs.pack_exr, 'image'),
-    'dng': PackerSpec(extra_codecs.pack_dng, 'image'),
+    'exr': PackerSpec(extra_codecs.pack_exr, 'image', {'threads': 'threads'}),
+    'dng': PackerSpec(extra_codecs.pack_dng, 'image', {'threads': 'threads'}),
     'dcm': PackerSpec(extra_codecs.pack_dcm, 'image'),
     'dicom': PackerSpec(extra_codecs.pack_dcm, 'image'),
     'dic': PackerSpec(extra_codecs.pack_dcm, 'image'),
-    'ico': PackerSpec(extra_codecs.pack_ico, 'image'),
-    'icns': PackerSpec(extra_codecs.pack_icns, 'image'),
+    'ico': PackerSpec(extra_codecs.pack_ico, 'image', {
+        'ultra': 'ultra', 'keep_meta': 'keep_meta', 'threads': 'threads',
+    }),
+    'icns': PackerSpec(extra_codecs.pack_icns, 'image', {
+        'ultra': 'ultra', 'keep_meta': 'keep_meta', 'threads': 'threads',
+    }),
     'bmp': PackerSpec(extra_codecs.pack_bmp, 'image'),
     'tga': PackerSpec(extra_codecs.pack_tga, 'image'),
     'pnm': PackerSpec(extra_codecs.pack_pnm, 'image'),
@@ -1150,7 +1538,7 @@ _PACKERS: Dict[str, PackerSpec] = {
     'hdf': PackerSpec(extra_codecs.pack_hdf5, 'data'),
     'nc': PackerSpec(extra_codecs.pack_netcdf, 'data'),
     'nc4': PackerSpec(extra_codecs.pack_netcdf, 'data'),
-    'gz': PackerSpec(pack_gzip, 'data'),
+    'gz': PackerSpec(pack_gzip, 'data', {'ultra': 'ultra', 'threads': 'threads'}),
     'xz': PackerSpec(pack_xz, 'data'),
     'bz2': PackerSpec(pack_bz2, 'data'),
     'zst': PackerSpec(pack_zstd, 'data'),
@@ -1165,11 +1553,13 @@ _PACKERS: Dict[str, PackerSpec] = {
         'jpeg_quality': 'jpeg_quality',
         'keep_meta': 'keep_meta',
         'ultra': 'ultra',
+        'threads': 'threads',
+        'max_memory_bytes': 'max_memory_bytes',
     }),
-    'avif': PackerSpec(pack_avif, 'image'),
-    'heic': PackerSpec(pack_heic, 'image'),
-    'heif': PackerSpec(pack_heic, 'image'),
-    'flac': PackerSpec(pack_flac, 'audio', {'keep_meta': 'keep_meta'}),
+    'avif': PackerSpec(pack_avif, 'image', {'threads': 'threads'}),
+    'heic': PackerSpec(pack_heic, 'image', {'threads': 'threads'}),
+    'heif': PackerSpec(pack_heic, 'image', {'threads': 'threads'}),
+    'flac': PackerSpec(pack_flac, 'audio', {'keep_meta': 'keep_meta', 'ultra': 'ultra'}),
     'm4a': PackerSpec(extra_codecs.pack_m4a, 'audio', {'keep_meta': 'keep_meta'}),
     'wv': PackerSpec(extra_codecs.pack_wv, 'audio'),
     'ape': PackerSpec(extra_codecs.pack_ape, 'audio', {'keep_meta': 'keep_meta'}),
@@ -1183,50 +1573,28 @@ _PACKERS: Dict[str, PackerSpec] = {
     'ai': PackerSpec(extra_codecs.pack_ai, 'document', {
         'pdf_profile': 'pdf_profile',
         'jpeg_quality': 'jpeg_quality',
+        'max_memory_bytes': 'max_memory_bytes',
     }),
     'woff': PackerSpec(extra_codecs.pack_woff, 'data'),
     'woff2': PackerSpec(extra_codecs.pack_woff2, 'data'),
-    'wmv': PackerSpec(pack_wmv, 'video', {
-        'wmv_lossless': 'lossless',
-        'convert_container': 'convert_container',
-    }),
-    'mp4': PackerSpec(pack_mp4, 'video', {
-        'wmv_lossless': 'lossless',
-        'convert_container': 'convert_container',
-    }),
-    'avi': PackerSpec(pack_avi, 'video', {
-        'wmv_lossless': 'lossless',
-        'convert_container': 'convert_container',
-    }),
-    'asf': PackerSpec(pack_asf, 'video', {
-        'wmv_lossless': 'lossless',
-        'convert_container': 'convert_container',
-    }),
-    'mkv': PackerSpec(pack_mkv, 'video', {'wmv_lossless': 'lossless'}),
-    'webm': PackerSpec(pack_webm, 'video', {'wmv_lossless': 'lossless'}),
-    'mov': PackerSpec(extra_codecs.pack_mov, 'video', {'wmv_lossless': 'lossless'}),
-    'm4v': PackerSpec(extra_codecs.pack_m4v, 'video', {'wmv_lossless': 'lossless'}),
-    '3gp': PackerSpec(extra_codecs.pack_3gp, 'video', {
-        'wmv_lossless': 'lossless',
-        'convert_container': 'convert_container',
-    }),
-    'ts': PackerSpec(extra_codecs.pack_ts, 'video', {
-        'wmv_lossless': 'lossless',
-        'convert_container': 'convert_container',
-    }),
-    'mts': PackerSpec(extra_codecs.pack_ts, 'video', {
-        'wmv_lossless': 'lossless',
-        'convert_container': 'convert_container',
-    }),
-    'm2ts': PackerSpec(extra_codecs.pack_ts, 'video', {
-        'wmv_lossless': 'lossless',
-        'convert_container': 'convert_container',
-    }),
+    'wmv': PackerSpec(pack_wmv, 'video', _VIDEO_CONVERT_EXTRA),
+    'mp4': PackerSpec(pack_mp4, 'video', _VIDEO_CONVERT_EXTRA),
+    'avi': PackerSpec(pack_avi, 'video', _VIDEO_CONVERT_EXTRA),
+    'asf': PackerSpec(pack_asf, 'video', _VIDEO_CONVERT_EXTRA),
+    'mkv': PackerSpec(pack_mkv, 'video', _VIDEO_EXTRA),
+    'webm': PackerSpec(pack_webm, 'video', _VIDEO_EXTRA),
+    'mov': PackerSpec(extra_codecs.pack_mov, 'video', _VIDEO_EXTRA),
+    'm4v': PackerSpec(extra_codecs.pack_m4v, 'video', _VIDEO_EXTRA),
+    '3gp': PackerSpec(extra_codecs.pack_3gp, 'video', _VIDEO_CONVERT_EXTRA),
+    'ts': PackerSpec(extra_codecs.pack_ts, 'video', _VIDEO_CONVERT_EXTRA),
+    'mts': PackerSpec(extra_codecs.pack_ts, 'video', _VIDEO_CONVERT_EXTRA),
+    'm2ts': PackerSpec(extra_codecs.pack_ts, 'video', _VIDEO_CONVERT_EXTRA),
 }
 
 
 def _dispatch_packer(
-    ext: str, fullname: str, options: Dict[str, Any]
+    ext: str, fullname: str, options: Dict[str, Any],
+    on_progress: Optional[Callable[..., None]] = None,
 ) -> Optional[PackResult]:
     spec = _PACKERS.get(ext)
     if spec is None:
@@ -1245,7 +1613,13 @@ def _dispatch_packer(
     }
     for opt_key, arg_name in spec.extra.items():
         kwargs[arg_name] = options.get(opt_key)
-    return spec.func(fullname, **kwargs)
+    if spec.category == 'video':
+        kwargs['on_progress'] = on_progress
+    started = time.monotonic()
+    res = spec.func(fullname, **kwargs)
+    if res is not None:
+        res.elapsed_seconds = time.monotonic() - started
+    return res
 
 
 def _normalize_options(def_options: Any) -> Dict[str, Any]:
@@ -1256,7 +1630,8 @@ def _normalize_options(def_options: Any) -> Dict[str, Any]:
         'keep_if_larger': True, 'lossy': False, 'convert_container': True,
         'min_savings': None, 'compression_level': 9,
         'pdf_profile': None, 'jpeg_quality': None,
-        'keep_meta': False,
+        'keep_meta': False, 'threads': None, 'max_memory_bytes': None,
+        'video_segments': None, 'max_encode_seconds': None,
     }
     if isinstance(def_options, RepackOptions):
         options.update(def_options.to_dict())
@@ -1278,10 +1653,29 @@ def _notify(
     current: int = 0,
     total: int = 0,
     name: str = "",
+    **extra: Any,
 ) -> None:
+    """Call hook; extra keywords (encode speed, eta) go only to hooks that accept them."""
     if hook is None:
         return
-    hook(event, current=current, total=total, name=name)
+    if extra:
+        accepted = _hook_keywords(hook)
+        if accepted is not None:
+            extra = {k: v for k, v in extra.items() if k in accepted}
+    hook(event, current=current, total=total, name=name, **extra)
+
+
+def _hook_keywords(hook: Callable[..., None]) -> Optional[frozenset]:
+    """Keyword names hook accepts; None when it takes **kwargs."""
+    try:
+        params = inspect.signature(hook).parameters.values()
+    except (TypeError, ValueError):
+        return frozenset()
+    if any(p.kind is p.VAR_KEYWORD for p in params):
+        return None
+    return frozenset(
+        p.name for p in params if p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY)
+    )
 
 
 def _extract_limits(options: Dict[str, Any]) -> Tuple[int, float]:
@@ -1401,13 +1795,16 @@ class FileRepacker:
 
         packer_key = kind.packer or kind.key
         _notify(on_progress, 'standalone', name=filename)
-        standalone = _dispatch_packer(packer_key, filename, options)
+        standalone = _dispatch_packer(
+            packer_key, filename, options, on_progress=on_progress,
+        )
         if standalone is not None or packer_key in _PACKERS:
             summary = RepackSummary(filepath=filename, total_insize=f_insize)
             if standalone is None:
                 summary.total_outsize = f_insize
                 return summary
             summary.total_outsize = standalone.outsize
+            summary.note = standalone.note
             summary.results.append(standalone)
             return summary
 
@@ -1542,9 +1939,33 @@ class FileRepacker:
                     continue
                 items.append((fullname, name, kind))
         _notify(on_progress, 'files', current=0, total=len(items))
-        for i, (fullname, name, kind) in enumerate(items, 1):
+        batches, _ = batch.plan_batches(
+            [(f, k.packer or k.key) for f, _, k in items if not k.is_archive], options,
+        )
+        done = 0
+        for group in batches:
+            for fullname, res in batch.pack_batch(group, options).items():
+                self._add_result(summary, res)
+                done += 1
+                _notify(
+                    on_progress, 'file', current=done, total=len(items),
+                    name=os.path.basename(fullname),
+                )
+        batched = {f for group in batches for f in group.paths}
+        for fullname, name, kind in items:
+            if fullname in batched:
+                continue
             self._process_walk_item(fullname, kind, options, summary)
-            _notify(on_progress, 'file', current=i, total=len(items), name=name)
+            done += 1
+            _notify(on_progress, 'file', current=done, total=len(items), name=name)
+
+    @staticmethod
+    def _add_result(summary: RepackSummary, res: Optional[PackResult]) -> None:
+        if res is not None:
+            summary.results.append(res)
+            summary.inner_count += 1
+            summary.inner_insize += res.insize
+            summary.inner_outsize += res.outsize
 
     def _process_walk_item(
         self, fullname: str, kind: Any, options: Dict[str, Any],
@@ -1561,12 +1982,9 @@ class FileRepacker:
                 summary.inner_insize += nested.total_insize
                 summary.inner_outsize += nested.total_outsize
             return
-        res = _dispatch_packer(kind.packer or kind.key, fullname, options)
-        if res is not None:
-            summary.results.append(res)
-            summary.inner_count += 1
-            summary.inner_insize += res.insize
-            summary.inner_outsize += res.outsize
+        self._add_result(
+            summary, _dispatch_packer(kind.packer or kind.key, fullname, options),
+        )
 
     def _write_archive(
         self, fpath: str, dest: str, options: Dict[str, Any],
@@ -1593,16 +2011,21 @@ class FileRepacker:
         if archive_type == 'tar':
             cmd = [szip, '-ttar', '-y', '-mx0', 'a', temp_out, '*']
         else:
-            cmd = [
-                szip, f'-t{archive_type}', '-y', f'-mx{level}', 'a', temp_out, '*',
-            ]
-        result = _run_command(
-            cmd, quiet=options.get('quiet', False),
-            debug=options.get('debug', False), cwd=fpath,
-        )
+            cmd = [szip, f'-t{archive_type}', '-y', f'-mx{level}']
+            if archive_type == 'zip' and options.get('ultra', False):
+                cmd += deflate.ZIP_ULTRA_FLAGS
+            cmd += ['a', temp_out, '*']
+        bound = _grow_bound(f_insize, _commit_kwargs(**options))
+        with _grow_watch(temp_out, bound, dir_total_size(fpath)) as watch:
+            result = _run_command(
+                cmd, quiet=options.get('quiet', False),
+                debug=options.get('debug', False), cwd=fpath,
+            )
         if result is None:
             _remove_quietly(temp_out)
             summary.total_outsize = f_insize
+            if _grew(watch):
+                summary.note = race.ABORTED_WOULD_GROW
             return
         verify = verify_map.get(archive_type, 'zip')
         packed = _commit_output(
@@ -1646,7 +2069,10 @@ class FileRepacker:
             'lz4': 'lz4', 'lz': 'lz', 'lzo': 'lzo', 'lzma': 'lzma', 'z': 'z',
         }.get(outer)
         out_temp = _make_temp(suffix)
-        ok = _compress_file(tar_temp, out_temp, outer, options.get('debug', False))
+        ok = _compress_file(
+            tar_temp, out_temp, outer, options.get('debug', False),
+            ultra=options.get('ultra', False), threads=options.get('threads'),
+        )
         _remove_quietly(tar_temp)
         if not ok:
             _remove_quietly(out_temp)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""Drop JPEG/PNG/WebP metadata by copying segments and chunks (no re-encode)."""
+
+import logging
+import os
+import struct
+import zlib
+from shutil import copyfileobj
+from typing import Any, BinaryIO, Callable, Dict, Optional
+
+from .jpeg import metadata_kind, read_marker
+from .models import PackResult
+
+_COPY_BUF = 1024 * 1024
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Text, EXIF and timestamp chunks; colour chunks (iCCP, sRGB, gAMA, cHRM) and pHYs stay.
+_PNG_DROP = frozenset({b'tEXt', b'zTXt', b'iTXt', b'eXIf', b'tIME'})
+_WEBP_DROP = frozenset({b'EXIF', b'XMP '})
+# VP8X flag bits for EXIF and XMP presence.
+_VP8X_META_FLAGS = 0x08 | 0x04
+
+
+def _r() -> Any:
+    from . import repack as r
+    return r
+
+
+def _strip_jpeg(fin: BinaryIO, fout: BinaryIO) -> bool:
+    """Copy everything but APPn/COM metadata up to SOS, then the scans verbatim."""
+    if fin.read(2) != b'\xff\xd8':
+        return False
+    fout.write(b'\xff\xd8')
+    dropped = False
+    while True:
+        marker = read_marker(fin)
+        if marker is None or marker == 0xD9:
+            return False
+        if marker == 0xDA:
+            fout.write(b'\xff\xda')
+            copyfileobj(fin, fout, _COPY_BUF)
+            return dropped
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            fout.write(bytes([0xFF, marker]))
+            continue
+        raw = fin.read(2)
+        if len(raw) < 2:
+            return False
+        size = struct.unpack('>H', raw)[0] - 2
+        if size < 0:
+            return False
+        payload = fin.read(size)
+        if len(payload) < size:
+            return False
+        if metadata_kind(marker, payload[:32]) is not None:
+            dropped = True
+            continue
+        fout.write(bytes([0xFF, marker]) + raw + payload)
+
+
+def _copy_png_chunk(fin: BinaryIO, fout: BinaryIO, head: bytes, length: int) -> bool:
+    """Stream one chunk through, checking its CRC on the way."""
+    fout.write(head)
+    crc = zlib.crc32(head[4:8])
+    remaining = length
+    while remaining:
+        piece = fin.read(min(remaining, _COPY_BUF))
+        if not piece:
+            return False
+        crc = zlib.crc32(piece, crc)
+        fout.write(piece)
+        remaining -= len(piece)
+    stored = fin.read(4)
+    if len(stored) < 4 or struct.unpack('>I', stored)[0] != crc & 0xFFFFFFFF:
+        return False
+    fout.write(stored)
+    return True
+
+
+def _strip_png(fin: BinaryIO, fout: BinaryIO) -> bool:
+    if fin.read(8) != _PNG_SIGNATURE:
+        return False
+    fout.write(_PNG_SIGNATURE)
+    dropped = False
+    while True:
+        head = fin.read(8)
+        if len(head) < 8:
+            return False
+        length, ctype = struct.unpack('>I4s', head)
+        if ctype in _PNG_DROP:
+            fin.seek(length + 4, 1)
+            dropped = True
+            continue
+        if not _copy_png_chunk(fin, fout, head, length):
+            return False
+        if ctype == b'IEND':
+            return dropped
+
+
+def _strip_webp(fin: BinaryIO, fout: BinaryIO) -> bool:
+    """Drop EXIF/XMP chunks, clear their VP8X flags and fix the RIFF size."""
+    head = fin.read(12)
+    if len(head) < 12 or head[:4] != b'RIFF' or head[8:12] != b'WEBP':
+        return False
+    fout.write(head)
+    dropped = False
+    while True:
+        chunk = fin.read(8)
+        if not chunk:
+            break
+        if len(chunk) < 8:
+            return False
+        fourcc = chunk[:4]
+        size = struct.unpack('<I', chunk[4:])[0]
+        padded = size + (size & 1)
+        if fourcc in _WEBP_DROP:
+            fin.seek(padded, 1)
+            dropped = True
+            continue
+        fout.write(chunk)
+        if fourcc == b'VP8X':
+            payload = bytearray(fin.read(padded))
+            if len(payload) < 10:
+                return False
+            payload[0] &= ~_VP8X_META_FLAGS & 0xFF
+            fout.write(payload)
+            continue
+        remaining = padded
+        while remaining:
+            piece = fin.read(min(remaining, _COPY_BUF))
+            if not piece:
+                return False
+            fout.write(piece)
+            remaining -= len(piece)
+    if not dropped:
+        return False
+    total = fout.tell()
+    fout.seek(4)
+    fout.write(struct.pack('<I', total - 8))
+    return True
+
+
+_STRIPPERS: Dict[str, Callable[[BinaryIO, BinaryIO], bool]] = {
+    'jpg': _strip_jpeg,
+    'png': _strip_png,
+    'webp': _strip_webp,
+}
+
+
+def strip_metadata(src: str, dest: str, kind: str) -> bool:
+    """Write src to dest without metadata. False when nothing was dropped or src is malformed."""
+    try:
+        with open(src, 'rb') as fin, open(dest, 'wb') as fout:
+            return _STRIPPERS[kind](fin, fout)
+    except (OSError, struct.error):
+        return False
+
+
+def pack_strip(
+    filepath: str, kind: str, debug: bool = False, **commit: Any,
+) -> Optional[PackResult]:
+    """Fast tier: strip metadata in-process and commit. None = nothing to strip."""
+    r = _r()
+    insize = os.path.getsize(filepath)
+    out_temp = r._make_temp(f'.{kind}')
+    try:
+        if not strip_metadata(filepath, out_temp, kind):
+            if debug:
+                logging.info('no metadata stripped from %s', filepath)
+            return None
+        res = r._commit_output(
+            out_temp, filepath, insize, verify=kind, **r._commit_kwargs(**commit)
+        )
+        if res is not None:
+            res.method = 'strip'
+        return res
+    finally:
+        r._remove_quietly(out_temp)
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+
+"""TIFF IFD inspection and tiffcp codec/predictor trials on a sample strip."""
+
+import os
+import struct
+from dataclasses import dataclass, field
+from os.path import abspath
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from . import race
+from .consts import TIFF_SAMPLE_BYTES, TIFF_STRIP_BYTES
+from .models import PackResult
+
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+_UINT_FORMATS = {1: 'B', 3: 'H', 4: 'I', 13: 'I'}
+# Tags read from the first IFD; 256..339 are copied into the sample.
+_WANTED = {256, 257, 258, 259, 262, 273, 277, 278, 279, 284, 320, 322, 338, 339}
+_SAMPLE_TAGS = (256, 258, 262, 277, 320, 338, 339)
+_MAX_TAG_BYTES = 64 * 1024 ** 2
+_MAX_PAGES = 65536
+_COPY_CHUNK = 1024 ** 2
+
+
+@dataclass(frozen=True)
+class TiffInfo:
+    """First-IFD layout of a classic (non-Big) TIFF; strips are (offset, bytecount)."""
+
+    order: str
+    width: int
+    height: int
+    bits: int
+    samples: int
+    sample_format: int
+    photometric: int
+    compression: int
+    planar: int
+    tiled: bool
+    pages: int
+    strips: Tuple[Tuple[int, int], ...] = ()
+    tags: Dict[int, Tuple[int, int, bytes]] = field(default_factory=dict, compare=False)
+
+    @property
+    def row_bytes(self) -> int:
+        samples = self.samples if self.planar == 1 else 1
+        return (self.width * self.bits * samples + 7) // 8
+
+
+def _read_ifd(
+    fh: Any, order: str, offset: int,
+) -> Optional[Tuple[Dict[int, Tuple[int, int, bytes]], int]]:
+    fh.seek(offset)
+    head = fh.read(2)
+    if len(head) < 2:
+        return None
+    count = struct.unpack(order + 'H', head)[0]
+    table = fh.read(12 * count + 4)
+    if len(table) < 12 * count + 4:
+        return None
+    tags = {}
+    for i in range(count):
+        tag, typ, num, value = struct.unpack(order + 'HHI4s', table[12 * i:12 * i + 12])
+        if tag not in _WANTED:
+            continue
+        size = _TYPE_SIZES.get(typ, 0) * num
+        if size <= 4:
+            tags[tag] = (typ, num, value[:size])
+            continue
+        if size > _MAX_TAG_BYTES:
+            return None
+        fh.seek(struct.unpack(order + 'I', value)[0])
+        raw = fh.read(size)
+        if len(raw) < size:
+            return None
+        tags[tag] = (typ, num, raw)
+    return tags, struct.unpack(order + 'I', table[-4:])[0]
+
+
+def _count_pages(fh: Any, order: str, offset: int) -> int:
+    seen = set()
+    while offset and offset not in seen and len(seen) < _MAX_PAGES:
+        seen.add(offset)
+        fh.seek(offset)
+        head = fh.read(2)
+        if len(head) < 2:
+            break
+        fh.seek(offset + 2 + 12 * struct.unpack(order + 'H', head)[0])
+        tail = fh.read(4)
+        if len(tail) < 4:
+            break
+        offset = struct.unpack(order + 'I', tail)[0]
+    return len(seen)
+
+
+def _values(order: str, entry: Optional[Tuple[int, int, bytes]]) -> Tuple[int, ...]:
+    if entry is None or entry[0] not in _UINT_FORMATS:
+        return ()
+    typ, num, raw = entry
+    return struct.unpack(f'{order}{num}{_UINT_FORMATS[typ]}', raw)
+
+
+def read_info(filepath: str) -> Optional[TiffInfo]:
+    """Parse the first IFD and count pages. None for BigTIFF or malformed files."""
+    try:
+        with open(filepath, 'rb') as fh:
+            head = fh.read(8)
+            if len(head) < 8 or head[:2] not in (b'II', b'MM'):
+                return None
+            order = '<' if head[:2] == b'II' else '>'
+            magic, offset = struct.unpack(order + 'HI', head[2:])
+            if magic != 42:
+                return None
+            parsed = _read_ifd(fh, order, offset)
+            if parsed is None:
+                return None
+            tags = parsed[0]
+            pages = _count_pages(fh, order, offset)
+    except (OSError, struct.error):
+        return None
+
+    def first(tag: int, default: int) -> int:
+        values = _values(order, tags.get(tag))
+        return values[0] if values else default
+
+    width, height = first(256, 0), first(257, 0)
+    if not width or not height:
+        return None
+    return TiffInfo(
+        order=order, width=width, height=height, bits=first(258, 1),
+        samples=first(277, 1), sample_format=first(339, 1), photometric=first(262, 1),
+        compression=first(259, 1), planar=first(284, 1), tiled=322 in tags, pages=pages,
+        strips=tuple(zip(_values(order, tags.get(273)), _values(order, tags.get(279)))),
+        tags=tags,
+    )
+
+
+def predictor(info: TiffInfo) -> int:
+    """3 (floating point), 2 (horizontal differencing) or 1 (none) for this layout."""
+    if info.sample_format == 3 and info.bits in (16, 24, 32, 64):
+        return 3
+    if info.sample_format in (1, 2) and info.bits in (8, 16, 32) and info.photometric != 3:
+        return 2
+    return 1
+
+
+def trial_specs(info: TiffInfo, zip_only: bool = False, ultra: bool = False) -> List[str]:
+    """tiffcp -c arguments worth trying; zstd (not baseline TIFF) only under ultra."""
+    pred = predictor(info)
+    specs = ['zip:p9']
+    if pred > 1:
+        specs.append(f'zip:{pred}:p9')
+    if zip_only:
+        return specs
+    specs.append('lzw')
+    if pred > 1:
+        specs.append(f'lzw:{pred}')
+    if info.bits == 1 and info.samples == 1:
+        specs.append('g4')
+    if ultra:
+        specs.append(f'zip:{pred}:p12' if pred > 1 else 'zip:p12')
+        specs.append(f'zstd:{pred}:p19' if pred > 1 else 'zstd:p19')
+    return specs
+
+
+def strip_rows(info: TiffInfo) -> int:
+    return max(1, TIFF_STRIP_BYTES // max(1, info.row_bytes))
+
+
+def tiffcp_command(
+    tiffcp_path: str, spec: str, info: TiffInfo, src: str, out: str, restrip: bool = True,
+) -> List[str]:
+    """tiffcp streams strip by strip; -r sets strip height unless the source is tiled."""
+    cmd = [tiffcp_path, '-c', spec]
+    if restrip and not info.tiled:
+        cmd += ['-r', str(strip_rows(info))]
+    return cmd + [src, out]
+
+
+def sampleable(info: TiffInfo) -> bool:
+    """Uncompressed, stripped, chunky: rows can be copied out without decoding."""
+    return (
+        info.compression == 1 and not info.tiled and bool(info.strips)
+        and (info.planar == 1 or info.samples == 1)
+    )
+
+
+def _pack_entry(order: str, typ: int, value: int) -> Tuple[int, int, bytes]:
+    return typ, 1, struct.pack(order + _UINT_FORMATS[typ], value)
+
+
+def write_sample(
+    filepath: str, info: TiffInfo, dest: str, max_bytes: int = TIFF_SAMPLE_BYTES,
+) -> bool:
+    """Copy the first rows (up to max_bytes) of a sampleable TIFF into a one-strip TIFF."""
+    if not sampleable(info):
+        return False
+    order = info.order
+    rows = max(1, min(info.height, max_bytes // max(1, info.row_bytes)))
+    need = rows * info.row_bytes
+    entries = {tag: info.tags[tag] for tag in _SAMPLE_TAGS if tag in info.tags}
+    entries[257] = _pack_entry(order, 4, rows)
+    entries[259] = _pack_entry(order, 3, 1)
+    entries[278] = _pack_entry(order, 4, rows)
+    entries[279] = _pack_entry(order, 4, need)
+    entries[284] = _pack_entry(order, 3, 1)
+    entries[273] = _pack_entry(order, 4, 0)
+    extra_at = 8 + 2 + 12 * len(entries) + 4
+    data_at = extra_at + sum(len(raw) + (len(raw) & 1) for _t, _n, raw in entries.values()
+                             if len(raw) > 4)
+    entries[273] = _pack_entry(order, 4, data_at)
+    table, extra = [], []
+    for tag in sorted(entries):
+        typ, num, raw = entries[tag]
+        if len(raw) > 4:
+            value = struct.pack(order + 'I', extra_at + sum(len(b) for b in extra))
+            extra.append(raw + b'\x00' * (len(raw) & 1))
+        else:
+            value = raw.ljust(4, b'\x00')
+        table.append(struct.pack(order + 'HHI', tag, typ, num) + value)
+    header = (b'II' if order == '<' else b'MM') + struct.pack(order + 'HI', 42, 8)
+    try:
+        with open(filepath, 'rb') as src, open(dest, 'wb') as out:
+            out.write(header + struct.pack(order + 'H', len(table)) + b''.join(table))
+            out.write(struct.pack(order + 'I', 0) + b''.join(extra))
+            left = need
+            for offset, count in info.strips:
+                src.seek(offset)
+                take = min(count, left)
+                while take > 0:
+                    chunk = src.read(min(take, _COPY_CHUNK))
+                    if not chunk:
+                        return False
+                    out.write(chunk)
+                    take -= len(chunk)
+                    left -= len(chunk)
+                if left <= 0:
+                    break
+    except OSError:
+        return False
+    return left <= 0
+
+
+def _r() -> Any:
+    from . import repack as r
+    return r
+
+
+def candidates(
+    tiffcp_path: str, filepath: str, info: TiffInfo, specs: Sequence[str],
+    debug: bool, quiet: bool, restrip: bool = True,
+) -> List[race.Candidate]:
+    """One race candidate per tiffcp -c spec; the candidate name is 'tiffcp <spec>'."""
+    src = abspath(filepath)
+
+    def make(spec: str) -> race.Candidate:
+        def run(out: str) -> bool:
+            cmd = tiffcp_command(tiffcp_path, spec, info, src, out, restrip)
+            return _r()._run_command(cmd, quiet=quiet, debug=debug) is not None
+
+        return race.Candidate(f'tiffcp {spec}', run)
+
+    return [make(spec) for spec in specs]
+
+
+def pick_spec(
+    filepath: str, tiffcp_path: str, info: TiffInfo, specs: Sequence[str],
+    threads: Optional[int] = None, debug: bool = False, quiet: bool = False,
+) -> Optional[str]:
+    """Race specs on a sample of the first page; compressed sources are decoded first."""
+    r = _r()
+    sample = r._make_temp('.tif')
+    decoded = None
+    try:
+        source, source_info = filepath, info
+        if not sampleable(info):
+            decoded = r._make_temp('.tif')
+            cmd = [
+                tiffcp_path, '-c', 'none', '-s', '-p', 'contig', '-r', str(strip_rows(info)),
+                f'{abspath(filepath)},0', decoded,
+            ]
+            if r._run_command(cmd, quiet=quiet, debug=debug) is None:
+                return None
+            source_info = read_info(decoded)
+            source = decoded
+            if source_info is None:
+                return None
+        if not write_sample(source, source_info, sample):
+            return None
+        won = race.run_race(
+            sample, candidates(tiffcp_path, sample, source_info, specs, debug, quiet),
+            '.tif', 'tif', threads=threads, debug=debug,
+        )
+    finally:
+        r._remove_quietly(sample)
+        r._remove_quietly(decoded)
+    if won is None:
+        return None
+    r._remove_quietly(won[0])
+    return won[1].split(' ', 1)[1]
+
+
+def pack_tiffcp(
+    filepath: str, tiffcp_path: str, info: TiffInfo, specs: Sequence[str],
+    suffix: str, verify: str, threads: Optional[int] = None, debug: bool = False,
+    quiet: bool = False, sample: bool = True, restrip: bool = True, **commit: Any,
+) -> Optional[PackResult]:
+    """Large files: pick a spec on a sample, then one full rewrite. Else race all specs.
+
+    sample=False always races full rewrites; tier is '<verify>:sampled' or '<verify>:full'.
+    """
+    chosen = list(specs)
+    tier = f'{verify}:full'
+    if sample and len(chosen) > 1 and os.path.getsize(filepath) > TIFF_SAMPLE_BYTES:
+        picked = pick_spec(filepath, tiffcp_path, info, chosen, threads, debug, quiet)
+        if picked is not None:
+            chosen, tier = [picked], f'{verify}:sampled'
+    res = race.pack_race(
+        filepath, candidates(tiffcp_path, filepath, info, chosen, debug, quiet, restrip),
+        suffix, verify, threads=threads, debug=debug, **commit,
+    )
+    if res is not None:
+        res.tier = tier
+    return res
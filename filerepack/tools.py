@@ -50,10 +50,14 @@ TOOL_SPECS: Tuple[ToolSpec, ...] = (
         'TIFF/HEIC/AVIF/BMP/TGA/PNM/PCX',
     ),
     ToolSpec('tiffcp', ('tiffcp',), 'FILEREPACK_TIFFCP', False, 'TIFF fallback'),
+    ToolSpec('oiiotool', ('oiiotool',), 'FILEREPACK_OIIOTOOL', False, 'OpenEXR'),
     ToolSpec('gs', ('gs', 'gswin64c', 'gswin32c'), 'FILEREPACK_GS', False, 'lossy PDF'),
     ToolSpec('qpdf', ('qpdf',), 'FILEREPACK_QPDF', False, 'lossless PDF'),
     ToolSpec('ffmpeg', ('ffmpeg',), 'FILEREPACK_FFMPEG', False, 'video'),
+    ToolSpec('ffprobe', ('ffprobe',), 'FILEREPACK_FFPROBE', False, 'media probe'),
     ToolSpec('pigz', ('pigz',), 'FILEREPACK_PIGZ', False, 'parallel gzip'),
+    ToolSpec('zopfli', ('zopfli',), 'FILEREPACK_ZOPFLI', False, 'gzip (ultra)'),
+    ToolSpec('ect', ('ect',), 'FILEREPACK_ECT', False, 'gzip (ultra)'),
     ToolSpec('xz', ('xz',), 'FILEREPACK_XZ', False, 'XZ'),
     ToolSpec('bzip2', ('bzip2',), 'FILEREPACK_BZIP2', False, 'BZ2'),
     ToolSpec('zstd', ('zstd',), 'FILEREPACK_ZSTD', False, 'Zstandard'),
@@ -47,6 +47,20 @@ def parse_size(size_str: Optional[str]) -> int:
     return int(number * multipliers.get(unit, 1))
 
 
+def parse_duration(duration_str: Optional[str]) -> float:
+    """
+    Parse a duration string to seconds.
+    Examples: '90', '90s', '15m', '1.5h'
+    """
+    if not duration_str:
+        return 0.0
+    match = re.match(r'^(\d+(?:\.\d+)?)\s*([SMH]?)$', duration_str.strip().upper())
+    if not match:
+        raise ValueError(f"Invalid duration format: {duration_str}")
+    multipliers = {'': 1, 'S': 1, 'M': 60, 'H': 3600}
+    return float(match.group(1)) * multipliers[match.group(2)]
+
+
 def format_size(size: int) -> str:
     """Format bytes to human-readable size string."""
     value = float(size)
@@ -413,6 +427,13 @@ def parse_jobs(jobs_value: str) -> int:
         raise ValueError(f"Invalid --jobs value: {jobs_value}")
 
 
+def cpu_budget(threads: Optional[int] = None, jobs: int = 1) -> int:
+    """Threads one file may use: --threads if set, else cores split across jobs."""
+    if threads:
+        return max(1, int(threads))
+    return max(1, (os.cpu_count() or 1) // max(1, jobs))
+
+
 def dir_total_size(path: str) -> int:
     """Sum file sizes under path. Missing files are skipped."""
     total = 0
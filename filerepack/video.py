@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+
+"""Video helpers: remux, codec arguments, pre-flight, segments, encoder progress."""
+
+import glob
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from . import race
+from .consts import (
+    GROW_WATCH_MARGIN, GROW_WATCH_MIN_FRACTION, VIDEO_PREFLIGHT_MIN_SECONDS,
+    VIDEO_PREFLIGHT_SAMPLES, VIDEO_SAMPLE_SECONDS, VIDEO_SEGMENT_MIN_SECONDS,
+)
+from .media import MediaInfo
+from .utils import cpu_budget
+
+MP4_FAMILY = ('mp4', 'mov', 'm4v')
+SKIP_PREDICTED_SAVINGS = 'skipped: predicted savings too small'
+SKIP_PREDICTED_TIME = 'skipped: predicted encode time over budget'
+ABORTED_TIME_BUDGET = 'aborted: over time budget'
+# Streams copied as-is by the remux tier. MPEG-4 Part 2, WMV, and other older
+# codecs are left to the transcode, which usually shrinks them.
+_REMUX_CODECS = {
+    'mp4': ({'h264', 'hevc', 'av1', 'vp9'}, {'aac', 'mp3', 'alac', 'ac3', 'eac3', 'opus', 'flac'}),
+    'webm': ({'vp8', 'vp9', 'av1'}, {'vorbis', 'opus'}),
+}
+
+
+def _r() -> Any:
+    from . import repack as r
+    return r
+
+
+class EncodeProgress:
+    """Parse ffmpeg ``-progress pipe:1`` blocks into position, speed, size, and ETA.
+
+    Each completed block is sent to on_progress as an 'encode' event (current/total
+    in seconds of media, plus fraction, speed, and eta). fraction() feeds the grow
+    watch projection and over_budget() the --max-encode-time check.
+    """
+
+    def __init__(
+        self, duration: float, name: str = '',
+        on_progress: Optional[Callable[..., None]] = None,
+        budget: Optional[float] = None,
+    ):
+        self.duration = duration
+        self.name = name
+        self.on_progress = on_progress
+        self.budget = budget
+        self.started = time.monotonic()
+        self.out_seconds = 0.0
+        self.speed = 0.0
+        self.total_size = 0
+        self._block: Dict[str, str] = {}
+
+    def feed(self, line: str) -> None:
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            return
+        if key != 'progress':
+            self._block[key] = value
+            return
+        block, self._block = self._block, {}
+        micros = block.get('out_time_us') or block.get('out_time_ms')
+        try:
+            self.out_seconds = max(self.out_seconds, int(micros or '') / 1e6)
+        except ValueError:
+            pass
+        try:
+            self.speed = float(block.get('speed', '').rstrip('x'))
+        except ValueError:
+            pass
+        try:
+            self.total_size = int(block.get('total_size', ''))
+        except ValueError:
+            pass
+        _r()._notify(
+            self.on_progress, 'encode', current=int(self.out_seconds),
+            total=int(self.duration), name=self.name,
+            fraction=self.fraction(), speed=self.speed, eta=self.eta(),
+        )
+
+    def fraction(self) -> Optional[float]:
+        if self.duration <= 0 or self.out_seconds <= 0:
+            return None
+        return min(1.0, self.out_seconds / self.duration)
+
+    def eta(self) -> Optional[float]:
+        fraction = self.fraction()
+        if not fraction:
+            return None
+        elapsed = time.monotonic() - self.started
+        return elapsed * (1.0 - fraction) / fraction
+
+    def over_budget(self) -> Optional[str]:
+        """ABORTED_TIME_BUDGET once the budget is spent or clearly will be."""
+        if not self.budget:
+            return None
+        elapsed = time.monotonic() - self.started
+        fraction = self.fraction()
+        if elapsed > self.budget:
+            return ABORTED_TIME_BUDGET
+        if fraction is None or fraction < GROW_WATCH_MIN_FRACTION:
+            return None
+        if elapsed / fraction > self.budget * GROW_WATCH_MARGIN:
+            return ABORTED_TIME_BUDGET
+        return None
+
+
+def remux_compatible(info: Optional[MediaInfo], container: str) -> bool:
+    """True when every stream can be stream-copied into container unchanged.
+
+    MKV takes any stream. MP4/MOV/M4V and WebM need modern video and audio codecs
+    and no subtitle, data, or cover-art streams; other containers are never remuxed.
+    """
+    if info is None or info.video is None:
+        return False
+    if container == 'mkv':
+        return True
+    family = 'mp4' if container in MP4_FAMILY else container
+    if family not in _REMUX_CODECS:
+        return False
+    video_ok, audio_ok = _REMUX_CODECS[family]
+    for stream in info.streams:
+        if stream.kind == 'video' and not stream.attached_pic and stream.codec in video_ok:
+            continue
+        if stream.kind == 'audio' and stream.codec in audio_ok:
+            continue
+        return False
+    return True
+
+
+def remux_cmd(ffmpeg: str, src: str, dest: str, container: str) -> List[str]:
+    """Copy every stream into a fresh container (moov up front for MP4; no junk atoms)."""
+    cmd = [ffmpeg, '-v', 'error', '-i', os.path.abspath(src), '-map', '0', '-c', 'copy']
+    if container in MP4_FAMILY:
+        cmd += ['-movflags', '+faststart']
+    return cmd + ['-y', dest]
+
+
+def codec_args(lossless: bool, container: str) -> List[str]:
+    """Video encoder arguments: VP9 for WebM, else libx264 (CRF 18 slow, or CRF 0)."""
+    if container == 'webm':
+        if lossless:
+            return ['-c:v', 'libvpx-vp9', '-lossless', '1']
+        return ['-c:v', 'libvpx-vp9', '-crf', '18', '-b:v', '0']
+    if lossless:
+        return ['-c:v', 'libx264', '-crf', '0', '-preset', 'veryslow']
+    return ['-c:v', 'libx264', '-crf', '18', '-preset', 'slow']
+
+
+@dataclass(frozen=True)
+class Estimate:
+    """Predicted output bytes and encode wall time, from sample encodes."""
+
+    size: int
+    seconds: float
+    samples: int
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            'predicted_bytes': float(self.size),
+            'predicted_seconds': round(self.seconds, 1),
+            'preflight_samples': float(self.samples),
+        }
+
+
+def preflight(
+    ffmpeg: str, src: str, info: Optional[MediaInfo], lossless: bool, container: str,
+    threads: Optional[int] = None, debug: bool = False, quiet: bool = False,
+) -> Optional[Estimate]:
+    """Encode short samples across the timeline and extrapolate size and time.
+
+    Video bytes scale from the samples' bytes per second; copied audio is added from
+    the probed audio bitrates. None for short files or when a sample fails.
+    """
+    if info is None or info.video is None or info.duration < VIDEO_PREFLIGHT_MIN_SECONDS:
+        return None
+    r = _r()
+    src = os.path.abspath(src)
+    count = VIDEO_PREFLIGHT_SAMPLES
+    total_bytes, total_elapsed = 0, 0.0
+    for i in range(count):
+        start = info.duration * (i + 1) / (count + 1)
+        out = r._make_temp('.mkv')
+        try:
+            cmd = [
+                ffmpeg, '-v', 'error', '-ss', f'{start:.3f}', '-i', src,
+                '-t', str(VIDEO_SAMPLE_SECONDS), '-map', '0:v:0',
+            ]
+            cmd += codec_args(lossless, container)
+            cmd += ['-threads', str(cpu_budget(threads)), '-an', '-f', 'matroska', '-y', out]
+            started = time.monotonic()
+            if r._run_command(cmd, quiet=quiet, debug=debug) is None:
+                return None
+            total_elapsed += time.monotonic() - started
+            total_bytes += os.path.getsize(out)
+        finally:
+            r._remove_quietly(out)
+    if total_bytes == 0:
+        return None
+    sampled = float(count * VIDEO_SAMPLE_SECONDS)
+    audio_bps = sum(s.bit_rate for s in info.streams if s.kind == 'audio')
+    size = total_bytes / sampled * info.duration + audio_bps / 8 * info.duration
+    estimate = Estimate(int(size), total_elapsed / sampled * info.duration, count)
+    if debug:
+        logging.info(
+            'video pre-flight for %s: %d bytes in %.0fs predicted',
+            src, estimate.size, estimate.seconds,
+        )
+    return estimate
+
+
+def keyframes(
+    ffprobe: str, src: str, debug: bool = False, quiet: bool = False,
+) -> List[float]:
+    """Keyframe timestamps of the first video stream, from packet flags (no decode)."""
+    cmd = [
+        ffprobe, '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', src,
+    ]
+    result = _r()._run_command(cmd, quiet=quiet, debug=debug)
+    times = []
+    for line in (result.stdout if result is not None else '').splitlines():
+        pts, _sep, flags = line.partition(',')
+        if 'K' not in flags:
+            continue
+        try:
+            times.append(float(pts))
+        except ValueError:
+            continue
+    return sorted(times)
+
+
+def cut_points(frames: List[float], duration: float, parts: int) -> List[float]:
+    """The keyframe nearest each even split of duration; increasing, never at 0."""
+    cuts: List[float] = []
+    for i in range(1, parts):
+        target = duration * i / parts
+        best = min(frames, key=lambda t: abs(t - target))
+        if best > (cuts[-1] if cuts else 0.0):
+            cuts.append(best)
+    return cuts
+
+
+def _concat_list(paths: List[str], list_path: str) -> None:
+    with open(list_path, 'w', encoding='utf-8') as fh:
+        for path in paths:
+            quoted = os.path.abspath(path).replace("'", "'\\''")
+            fh.write(f"file '{quoted}'\n")
+
+
+class SegmentWatch:
+    """Shared kill check for parallel segment encodes (each worker has its own scope).
+
+    Kills every running segment once the combined output passes bound, is projected
+    past it from the finished share of the input, or the time budget is spent or
+    clearly will be. reason records the first check that tripped.
+    """
+
+    def __init__(self, bound: Optional[int], budget: Optional[float] = None):
+        self.bound = bound
+        self.budget = budget
+        self.started = time.monotonic()
+        self.reason: Optional[str] = None
+        self._total_in = 0
+        self._done_in = 0
+        self._done_out = 0
+        self._running: List[str] = []
+        self._lock = threading.Lock()
+
+    def begin(self, total_in: int) -> None:
+        self._total_in = total_in
+
+    def running(self, out: str) -> None:
+        with self._lock:
+            self._running.append(out)
+
+    def finished(self, out: str, piece_bytes: int) -> None:
+        with self._lock:
+            self._running.remove(out)
+            self._done_in += piece_bytes
+            self._done_out += os.path.getsize(out)
+
+    def _size(self) -> int:
+        with self._lock:
+            size, outs = self._done_out, list(self._running)
+        for out in outs:
+            try:
+                size += os.path.getsize(out)
+            except OSError:
+                pass
+        return size
+
+    def check(self) -> Optional[str]:
+        if self.reason is None:
+            self.reason = self._check()
+        return self.reason
+
+    def _check(self) -> Optional[str]:
+        fraction = self._done_in / self._total_in if self._total_in else 0.0
+        if self.bound is not None:
+            if self._size() > self.bound:
+                return race.ABORTED_WOULD_GROW
+            if fraction >= GROW_WATCH_MIN_FRACTION and \
+                    self._done_out / fraction > self.bound * GROW_WATCH_MARGIN:
+                return race.ABORTED_WOULD_GROW
+        if self.budget:
+            elapsed = time.monotonic() - self.started
+            if elapsed > self.budget:
+                return ABORTED_TIME_BUDGET
+            if fraction >= GROW_WATCH_MIN_FRACTION and \
+                    elapsed / fraction > self.budget * GROW_WATCH_MARGIN:
+                return ABORTED_TIME_BUDGET
+        return None
+
+
+def encode_segments(
+    ffmpeg: str, ffprobe: Optional[str], src: str, dest: str, info: Optional[MediaInfo],
+    lossless: bool, container: str, segments: int, threads: Optional[int] = None,
+    on_progress: Optional[Callable[..., None]] = None,
+    debug: bool = False, quiet: bool = False, watch: Optional[SegmentWatch] = None,
+) -> Optional[int]:
+    """Split video at keyframes (stream copy), encode parts in parallel, concat losslessly.
+
+    Audio, subtitles and other non-video streams are copied once from the source, as
+    the single encode keeps them. Returns the number of segments, or None when
+    the file is too short, has too few keyframes, or any step fails; the caller then
+    runs one encode over the whole file unless watch killed the segments.
+    """
+    if ffprobe is None or info is None or info.video is None or segments < 2:
+        return None
+    parts = min(segments, int(info.duration // VIDEO_SEGMENT_MIN_SECONDS))
+    if parts < 2:
+        return None
+    r = _r()
+    src = os.path.abspath(src)
+    cuts = cut_points(keyframes(ffprobe, src, debug, quiet) or [0.0], info.duration, parts)
+    if not cuts:
+        return None
+    workdir = tempfile.mkdtemp(prefix='filerepack-video-', dir=r.TEMP_PATH)
+    try:
+        cmd = [
+            ffmpeg, '-v', 'error', '-i', src, '-map', '0:v:0', '-c', 'copy',
+            '-f', 'segment', '-segment_times', ','.join(f'{t:.6f}' for t in cuts),
+            '-reset_timestamps', '1', '-y', os.path.join(workdir, 'in%04d.mkv'),
+        ]
+        if r._run_command(cmd, quiet=quiet, debug=debug) is None:
+            return None
+        pieces = sorted(glob.glob(os.path.join(workdir, 'in*.mkv')))
+        if len(pieces) < 2:
+            return None
+        if watch is not None:
+            watch.begin(sum(os.path.getsize(piece) for piece in pieces))
+        budget = cpu_budget(threads)
+        workers = min(len(pieces), budget)
+        inner = str(max(1, budget // workers))
+
+        def one(piece: str) -> Optional[str]:
+            out = os.path.join(workdir, 'out' + os.path.basename(piece)[2:])
+            cmd = [ffmpeg, '-v', 'error', '-i', piece, '-map', '0:v:0']
+            cmd += codec_args(lossless, container) + ['-threads', inner, '-an', '-y', out]
+            if watch is None:
+                result = r._run_command(cmd, quiet=quiet, debug=debug)
+            else:
+                watch.running(out)
+                with race.scoped(race.KillScope(abort=watch.check)):
+                    result = r._run_command(cmd, quiet=quiet, debug=debug)
+            if result is None or not os.path.exists(out) or os.path.getsize(out) == 0:
+                return None
+            if watch is not None:
+                watch.finished(out, os.path.getsize(piece))
+            return out
+
+        r._notify(on_progress, 'segment', current=0, total=len(pieces), name=src)
+        done = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(one, piece) for piece in pieces]
+            for future in as_completed(futures):
+                if future.result() is None:
+                    for other in futures:
+                        other.cancel()
+                    if debug:
+                        logging.warning('segment encode failed; running one encode')
+                    return None
+                done += 1
+                r._notify(on_progress, 'segment', current=done, total=len(pieces), name=src)
+        outs = [future.result() for future in futures]
+        listing = os.path.join(workdir, 'concat.txt')
+        _concat_list(outs, listing)
+        cmd = [
+            ffmpeg, '-v', 'error', '-f', 'concat', '-safe', '0', '-i', listing,
+            '-i', src, '-map', '0:v:0', '-map', '1', '-map', '-1:v', '-c', 'copy',
+        ]
+        if container in MP4_FAMILY:
+            cmd += ['-movflags', '+faststart']
+        cmd += ['-y', dest]
+        if r._run_command(cmd, quiet=quiet, debug=debug) is None:
+            return None
+        if not os.path.exists(dest) or os.path.getsize(dest) == 0:
+            return None
+        return len(pieces)
+    finally:
+        r._remove_quietly(workdir)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+"""WebP RIFF chunk inspection: lossy (VP8), lossless (VP8L) or animated."""
+
+import struct
+from dataclasses import dataclass
+from typing import Optional
+
+LOSSY = 'lossy'
+LOSSLESS = 'lossless'
+ANIMATED = 'animated'
+
+
+@dataclass(frozen=True)
+class WebpInfo:
+    """kind is LOSSY, LOSSLESS or ANIMATED; metadata is set when EXIF/XMP/ICCP chunks exist."""
+
+    kind: str
+    metadata: bool = False
+
+
+def inspect(filepath: str) -> Optional[WebpInfo]:
+    """Walk the RIFF chunk list without reading image data. None when not a WebP."""
+    seen = set()
+    try:
+        with open(filepath, 'rb') as fh:
+            head = fh.read(12)
+            if len(head) < 12 or head[:4] != b'RIFF' or head[8:12] != b'WEBP':
+                return None
+            while True:
+                chunk = fh.read(8)
+                if len(chunk) < 8:
+                    break
+                fourcc = chunk[:4]
+                size = struct.unpack('<I', chunk[4:])[0]
+                seen.add(fourcc)
+                fh.seek(size + (size & 1), 1)
+    except OSError:
+        return None
+    metadata = bool(seen & {b'EXIF', b'XMP ', b'ICCP'})
+    if seen & {b'ANIM', b'ANMF'}:
+        return WebpInfo(ANIMATED, metadata)
+    if b'VP8L' in seen:
+        return WebpInfo(LOSSLESS, metadata)
+    if b'VP8 ' in seen:
+        return WebpInfo(LOSSY, metadata)
+    return None
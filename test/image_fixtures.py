@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+"""Helpers to build tiny PNG and WebP files for tests."""
+
+import struct
+import zlib
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def png_chunk(ctype: bytes, data: bytes) -> bytes:
+    crc = zlib.crc32(ctype + data) & 0xFFFFFFFF
+    return struct.pack('>I', len(data)) + ctype + data + struct.pack('>I', crc)
+
+
+def png_file(*extra: bytes) -> bytes:
+    """1x1 grayscale PNG with the extra chunks between IHDR and IDAT."""
+    ihdr = png_chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 0, 0, 0, 0))
+    idat = png_chunk(b'IDAT', zlib.compress(b'\x00\x00'))
+    return PNG_SIGNATURE + ihdr + b''.join(extra) + idat + png_chunk(b'IEND', b'')
+
+
+def riff_chunk(fourcc: bytes, data: bytes) -> bytes:
+    return fourcc + struct.pack('<I', len(data)) + data + b'\x00' * (len(data) & 1)
+
+
+def vp8x(flags: int = 0) -> bytes:
+    return riff_chunk(b'VP8X', bytes([flags]) + b'\x00' * 9)
+
+
+def webp_file(*chunks: bytes) -> bytes:
+    body = b'WEBP' + b''.join(chunks)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+import os
+from unittest.mock import MagicMock, patch
+
+from filerepack import batch
+from filerepack.__main__ import _bulk_tasks
+from filerepack.jobs import process_batch_job, process_file_job
+from filerepack.models import PackResult
+from filerepack.repack import FileRepacker, _dispatch_packer, _normalize_options
+
+_JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 200
+
+
+def _jpegs(folder, names, data=_JPEG):
+    paths = []
+    for name in names:
+        path = folder / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        paths.append(str(path))
+    return paths
+
+
+def _fake_jpegoptim(calls):
+    """Write a shorter JPEG for every input into the -d directory (shortest progressive)."""
+    def run(cmd, quiet=False, debug=False, cwd=None):
+        calls.append(cmd)
+        dest = cmd[cmd.index('-d') + 1]
+        for src in cmd[cmd.index('-d') + 2:]:
+            if src.startswith('-'):
+                continue
+            with open(os.path.join(dest, os.path.basename(src)), 'wb') as fh:
+                fh.write(_JPEG[:100 if '--all-progressive' in cmd else 120])
+        return MagicMock(returncode=0)
+    return run
+
+
+class TestPlan:
+    def test_small_same_packer_files_share_a_batch(self, tmp_path):
+        small = _jpegs(tmp_path, ['a.jpg', 'b.jpg', 'c.jpg'])
+        big = tmp_path / 'big.jpg'
+        big.write_bytes(_JPEG + b'\x00' * batch.BATCH_MAX_FILE_BYTES)
+        pairs = [(p, 'jpg') for p in small] + [(str(big), 'jpg'), ('x.pdf', 'pdf')]
+        with patch('filerepack.batch.resolve_tool', return_value='/bin/tool'):
+            batches, rest = batch.plan_batches(pairs, {})
+        assert [b.paths for b in batches] == [small]
+        assert rest == [str(big), 'x.pdf']
+
+    def test_duplicate_basenames_and_size_cap_split_batches(self, tmp_path):
+        paths = _jpegs(tmp_path, ['a.jpg', 'b.jpg', 'sub/a.jpg', 'c.jpg', 'd.jpg'])
+        with patch('filerepack.batch.resolve_tool', return_value='/bin/tool'):
+            with patch('filerepack.batch.BATCH_MAX_FILES', 2):
+                batches, rest = batch.plan_batches([(p, 'jpg') for p in paths], {})
+        assert [b.paths for b in batches] == [paths[:2], paths[2:4]]
+        assert rest == [paths[4]]
+
+    def test_lossy_png_and_missing_tool_are_not_batched(self, tmp_path):
+        pngs = [str(tmp_path / n) for n in ('a.png', 'b.png')]
+        for p in pngs:
+            with open(p, 'wb') as fh:
+                fh.write(b'\x89PNG\r\n\x1a\n' + b'\x00' * 40)
+        with patch('filerepack.batch.resolve_tool', return_value='/bin/oxipng'):
+            assert batch.plan_batches([(p, 'png') for p in pngs], {'lossy': True})[0] == []
+            batches, _ = batch.plan_batches([(p, 'png') for p in pngs], {})
+        assert batches[0].key == 'png:tiny'
+        with patch('filerepack.batch.resolve_tool', return_value=None):
+            assert batch.plan_batches([(p, 'png') for p in pngs], {})[0] == []
+
+
+class TestPackBatch:
+    def test_one_call_per_batch_with_per_file_commit(self, tmp_path):
+        paths = _jpegs(tmp_path, ['a.jpg', 'b.jpg', 'c.jpg'])
+        calls = []
+        with patch('filerepack.batch.resolve_tool', return_value='/bin/jpegoptim'):
+            with patch('filerepack.repack._run_command', side_effect=_fake_jpegoptim(calls)):
+                results = batch.pack_batch(
+                    batch.Batch('jpg', 'jpg', paths), _normalize_options({}),
+                )
+        assert len(calls) == 2
+        assert calls[0][-3:] == calls[1][-3:] == paths
+        assert '--all-progressive' in calls[0] and '--all-progressive' not in calls[1]
+        assert all('--strip-all' in c for c in calls)
+        for path in paths:
+            assert results[path].replaced
+            assert results[path].method == 'jpegoptim batch'
+            assert os.path.getsize(path) == 100
+
+    def test_missing_output_packs_file_alone(self, tmp_path):
+        paths = _jpegs(tmp_path, ['a.jpg', 'b.jpg'])
+        alone = PackResult(paths[1], 204, 150, 26.5)
+        with patch('filerepack.batch._jpegoptim', return_value={paths[0]: paths[0] + '.x'}):
+            with patch('filerepack.repack._dispatch_packer', return_value=alone) as single:
+                results = batch.pack_batch(
+                    batch.Batch('jpg', 'jpg', paths), _normalize_options({}),
+                )
+        assert single.call_count == 2
+        assert results[paths[1]] is alone
+
+    def test_flac_batch_covers_match_single_file_options(self, tmp_path):
+        paths = _jpegs(tmp_path, ['a.flac', 'b.flac'], data=b'fLaC' + b'\x00' * 60)
+        options = _normalize_options({'ultra': True, 'keep_meta': True})
+        with patch('filerepack.covers.optimize_embedded_covers') as covers:
+            with patch('filerepack.batch.resolve_tool', return_value='/bin/flac'):
+                with patch('filerepack.repack._run_command'):
+                    batch._flac(batch.Batch('flac', 'flac', paths), str(tmp_path), options)
+            with patch('filerepack.repack.resolve_tool', return_value=None):
+                _dispatch_packer('flac', paths[0], options)
+        batched, single = covers.call_args_list[0][0][1], covers.call_args_list[-1][0][1]
+        assert batched == single
+        assert batched['ultra'] and batched['keep_meta'] and batched['pack_images']
+
+    def test_gifsicle_batch_rewrites_scratch_copies(self, tmp_path):
+        paths = []
+        for name in ('a.gif', 'b.gif'):
+            path = tmp_path / name
+            path.write_bytes(b'GIF89a' + b'\x00' * 100)
+            paths.append(str(path))
+        calls = []
+
+        def fake_run(cmd, quiet=False, debug=False, cwd=None):
+            calls.append(cmd)
+            for work in cmd[4:]:
+                with open(work, 'wb') as fh:
+                    fh.write(b'GIF89a' + b'\x00' * 10)
+            return MagicMock(returncode=0)
+
+        with patch('filerepack.batch.resolve_tool', return_value='/bin/gifsicle'):
+            with patch('filerepack.repack._run_command', side_effect=fake_run):
+                results = batch.pack_batch(
+                    batch.Batch('gif', 'gif', paths), _normalize_options({}),
+                )
+        assert calls[0][:2] == ['/bin/gifsicle', '--batch']
+        assert all(not c.startswith(str(tmp_path)) for c in calls[0][4:])
+        assert all(results[p].outsize == 16 for p in paths)
+
+    def test_svgo_folder_mode_one_launch_for_same_named_icons(self, tmp_path):
+        svg = b'<svg xmlns="http://www.w3.org/2000/svg">  <!-- c -->  <g/></svg>'
+        paths = []
+        for folder in ('home', 'star', 'user'):
+            path = tmp_path / folder / '24px.svg'
+            path.parent.mkdir()
+            path.write_bytes(svg)
+            paths.append(str(path))
+        calls = []
+
+        def fake_svgo(cmd, quiet=False, debug=False, cwd=None):
+            calls.append(cmd)
+            src, dest = cmd[cmd.index('-f') + 1], cmd[cmd.index('-o') + 1]
+            for name in os.listdir(src)[1:]:
+                with open(os.path.join(dest, name), 'wb') as fh:
+                    fh.write(b'<svg xmlns="http://www.w3.org/2000/svg"/>')
+            return None
+
+        with patch('filerepack.batch.resolve_tool', return_value='/bin/svgo'):
+            batches, rest = batch.plan_batches([(p, 'svg') for p in paths], {})
+            assert [b.paths for b in batches] == [paths] and rest == []
+            with patch('filerepack.repack._run_command', side_effect=fake_svgo):
+                with patch('filerepack.repack.resolve_tool', return_value=None):
+                    results = batch.pack_batch(batches[0], _normalize_options({}))
+        assert len(calls) == 1 and calls[0][:3] == ['/bin/svgo', '--quiet', '-f']
+        batched = [p for p in paths if results[p].method == 'svgo batch']
+        # The file svgo skipped is packed alone (XML minify without svgo/scour).
+        assert len(batched) == 2 and len(results) == 3
+        assert all(os.path.getsize(p) == 41 for p in batched)
+
+
+class TestWiring:
+    def test_deep_walk_batches_small_files(self, tmp_path):
+        paths = _jpegs(tmp_path, ['a.jpg', 'b.jpg'])
+        calls = []
+        with patch('filerepack.batch.resolve_tool', return_value='/bin/jpegoptim'):
+            with patch('filerepack.repack._run_command', side_effect=_fake_jpegoptim(calls)):
+                with patch('filerepack.repack._dispatch_packer') as single:
+                    summary = MagicMock(results=[], inner_count=0,
+                                        inner_insize=0, inner_outsize=0)
+                    FileRepacker()._deep_walk(str(tmp_path), _normalize_options({}), summary)
+        single.assert_not_called()
+        assert len(calls) == 2
+        assert summary.inner_count == 2
+        assert sorted(r.filepath for r in summary.results) == sorted(paths)
+
+    def test_bulk_tasks_group_batches_in_file_order(self, tmp_path):
+        paths = _jpegs(tmp_path, ['a.jpg', 'b.jpg'])
+        doc = tmp_path / 'x.pdf'
+        doc.write_bytes(b'%PDF-1.4\n' + b'\x00' * 100)
+        with patch('filerepack.batch.resolve_tool', return_value='/bin/jpegoptim'):
+            tasks = _bulk_tasks([paths[0], str(doc), paths[1]], {})
+        assert [t[0] for t in tasks] == [process_batch_job, process_file_job]
+        assert tasks[0][1]['filepaths'] == paths
+        assert tasks[1][2] == [str(doc)]
+
+    def test_batch_job_reports_every_file(self, tmp_path):
+        paths = _jpegs(tmp_path, ['a.jpg', 'b.jpg', 'c.jpg'])
+        with open(paths[2], 'wb') as fh:
+            fh.write(_JPEG * 10)
+        calls = []
+        job = {
+            'filepaths': paths, 'packer': 'jpg', 'batch_key': 'jpg',
+            'max_size_bytes': 1000,
+        }
+        with patch('filerepack.batch.resolve_tool', return_value='/bin/jpegoptim'):
+            with patch('filerepack.repack._run_command', side_effect=_fake_jpegoptim(calls)):
+                out = process_batch_job(job)
+        assert [r['status'] for r in out] == ['processed', 'processed', 'skipped']
+        assert out[0]['original_size'] == 204 and out[0]['final_size'] == 100
+        assert calls[0][-2:] == paths[:2]
@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
 
 import os
+import threading
 from unittest.mock import patch
 
 from filerepack.containers import (
-    MemberResult, pack_members, shrunken_paths, staging_dir,
+    MemberResult, pack_bytes, pack_members, pipe_command, scratch_dir,
+    shrunken_paths, staging_dir,
 )
 
+_PNG = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR' + b'\x00\x00\x00\x10' * 2 + b'\x00' * 40
+
 
 class TestStagingDir:
     def test_creates_and_cleans(self):
@@ -60,3 +64,56 @@ class TestPackMembers:
     def test_member_result_shrank(self):
         assert MemberResult('a', '/a', 10, 8, True).shrank is True
         assert MemberResult('a', '/a', 10, 10, True).shrank is False
+
+
+class TestPackBytes:
+    def test_png_goes_through_oxipng_stdin(self):
+        with patch('filerepack.containers.resolve_tool', return_value='/bin/oxipng'):
+            with patch('filerepack.repack._run_pipe', return_value=_PNG[:30]) as pipe:
+                with patch('filerepack.repack._dispatch_packer') as single:
+                    assert pack_bytes(_PNG, '.png') == _PNG[:30]
+        single.assert_not_called()
+        cmd = pipe.call_args[0][0]
+        assert cmd[-2:] == ['--stdout', '-'] and pipe.call_args[0][1] == _PNG
+
+    def test_pipe_output_not_smaller_is_none(self):
+        with patch('filerepack.containers.resolve_tool', return_value='/bin/jpegtran'):
+            with patch('filerepack.repack._run_pipe', return_value=b'\xff\xd8\xff' * 40):
+                assert pack_bytes(b'\xff\xd8\xff' + b'\x00' * 20, '.jpg') is None
+
+    def test_lossy_and_gif_use_scratch_file(self):
+        seen = []
+
+        def fake_dispatch(packer, path, options):
+            seen.append(path)
+            with open(path, 'wb') as fh:
+                fh.write(b'GIF89a')
+
+        with patch('filerepack.containers.resolve_tool', return_value='/bin/tool'):
+            with patch('filerepack.repack._run_pipe') as pipe:
+                with patch('filerepack.repack._dispatch_packer', side_effect=fake_dispatch):
+                    assert pack_bytes(b'GIF89a' + b'\x00' * 30, '.gif') == b'GIF89a'
+                    pack_bytes(_PNG, '.png', {'lossy': True})
+        pipe.assert_not_called()
+        assert [os.path.dirname(p) for p in seen] == [scratch_dir()] * 2
+        assert not os.listdir(scratch_dir())
+
+    def test_scratch_dir_is_per_thread(self):
+        other = []
+        worker = threading.Thread(target=lambda: other.append(scratch_dir()))
+        worker.start()
+        worker.join()
+        assert scratch_dir() == scratch_dir() != other[0]
+
+    def test_webp_pipe_only_for_plain_lossless(self):
+        with patch('filerepack.containers.resolve_tool', return_value='/bin/cwebp'):
+            assert pipe_command(b'RIFF\x00\x00\x00\x00WEBPVP8L', '.webp', {})[-3:] == \
+                ['-', '--', '-']
+            assert pipe_command(b'RIFF\x00\x00\x00\x00WEBPVP8X', '.webp', {}) is None
+            assert pipe_command(b'not a jpeg', '.jpg', {}) is None
+
+    def test_png_quality_uses_the_full_packer(self):
+        png = b'\x89PNG\r\n\x1a\n' + b'\x00' * 16
+        with patch('filerepack.containers.resolve_tool', return_value='/bin/oxipng'):
+            assert pipe_command(png, '.png', {})[0] == '/bin/oxipng'
+            assert pipe_command(png, '.png', {'png_quality': '60-80'}) is None
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import os
+import zlib
+from unittest.mock import patch
+
+from filerepack import deflate
+from filerepack.repack import _PACKERS, _compress_file, pack_gzip
+
+
+def _fake_gzip(cmd, out_path, debug=False):
+    """Stand-in for a zopfli-style CLI: gzip the last argv path to out_path."""
+    with open(cmd[-1], 'rb') as fh:
+        data = fh.read()
+    with open(out_path, 'wb') as fh:
+        fh.write(gzip.compress(data, compresslevel=9))
+    return True
+
+
+def _only(*keys):
+    return lambda key: f'/usr/bin/{key}' if key in keys else None
+
+
+class TestRedeflate:
+    def test_level_one_stream_shrinks_losslessly(self):
+        data = b'BT /F1 12 Tf (hello) Tj ET\n' * 500
+        out = deflate.redeflate(zlib.compress(data, 1))
+        assert out is not None and zlib.decompress(out) == data
+
+    def test_best_trailing_and_broken_streams_kept(self):
+        data = b'q 1 0 0 1 0 0 cm Q\n' * 500
+        assert deflate.redeflate(zlib.compress(data, 9)) is None
+        assert deflate.redeflate(zlib.compress(data, 1) + b'\n') is None
+        assert deflate.redeflate(b'not zlib') is None
+
+    def test_inflation_capped(self):
+        bomb = zlib.compress(b'\x00' * (4 * 1024 ** 2), 1)
+        assert deflate.redeflate(bomb, max_raw=1024 ** 2) is None
+        assert deflate.redeflate(bomb, max_raw=8 * 1024 ** 2) is not None
+
+
+class TestIterationBudget:
+    def test_budget_shrinks_with_size(self):
+        small = deflate.zopfli_iterations(10 * 1024)
+        medium = deflate.zopfli_iterations(2 * 1024 ** 2)
+        large = deflate.zopfli_iterations(500 * 1024 ** 2)
+        assert small > medium > large >= 1
+
+
+class TestGzipUltra:
+    def test_prefers_pigz_11_single_stream(self, tmp_path):
+        src = tmp_path / 'payload'
+        src.write_bytes(b'abc' * 1000)
+        calls = []
+
+        def fake(cmd, out_path, debug=False):
+            calls.append(cmd)
+            return _fake_gzip(cmd, out_path, debug)
+
+        with patch('filerepack.deflate.resolve_tool', side_effect=_only('pigz', 'zopfli')):
+            with patch('filerepack.repack._run_to_file', side_effect=fake):
+                assert deflate.gzip_ultra(str(src), str(tmp_path / 'out.gz'), threads=4)
+        assert len(calls) == 1
+        cmd = calls[0]
+        assert cmd[:2] == ['/usr/bin/pigz', '-11']
+        assert cmd[cmd.index('-I') + 1] == str(deflate.zopfli_iterations(3000))
+        assert cmd[cmd.index('-p') + 1] == '4'
+        assert '-n' in cmd
+
+    def test_zopfli_members_round_trip(self, tmp_path):
+        src = tmp_path / 'payload'
+        payload = os.urandom(64) * 4096
+        src.write_bytes(payload)
+        out = tmp_path / 'out.gz'
+        with patch('filerepack.deflate.ULTRA_DEFLATE_CHUNK', 50000):
+            with patch('filerepack.deflate.resolve_tool', side_effect=_only('zopfli')):
+                with patch('filerepack.repack._run_to_file', side_effect=_fake_gzip) as run:
+                    assert deflate.gzip_ultra(
+                        str(src), str(out), members=True, threads=4,
+                    )
+        assert run.call_count > 1
+        assert gzip.decompress(out.read_bytes()) == payload
+
+    def test_single_member_without_members_flag(self, tmp_path):
+        src = tmp_path / 'payload'
+        src.write_bytes(b'x' * 200000)
+        with patch('filerepack.deflate.ULTRA_DEFLATE_CHUNK', 50000):
+            with patch('filerepack.deflate.resolve_tool', side_effect=_only('zopfli')):
+                with patch('filerepack.repack._run_to_file', side_effect=_fake_gzip) as run:
+                    assert deflate.gzip_ultra(str(src), str(tmp_path / 'o.gz'), threads=4)
+        assert run.call_count == 1
+        assert run.call_args[0][0][:2] == ['/usr/bin/zopfli', '--i100']
+
+    def test_no_engine_returns_false(self, tmp_path):
+        src = tmp_path / 'payload'
+        src.write_bytes(b'x' * 100)
+        with patch('filerepack.deflate.resolve_tool', return_value=None):
+            with patch('filerepack.deflate._gzip_binding', return_value=False):
+                assert deflate.gzip_ultra(str(src), str(tmp_path / 'o.gz')) is False
+
+
+class TestUltraWiring:
+    def test_pack_gzip_ultra_keeps_valid_gzip(self, tmp_path):
+        path = tmp_path / 'a.json.gz'
+        payload = b'{"k": "value"}\n' * 2000
+        path.write_bytes(gzip.compress(payload, compresslevel=1))
+        with patch('filerepack.deflate.resolve_tool', side_effect=_only('pigz')):
+            with patch('filerepack.repack._run_to_file', side_effect=_fake_gzip) as run:
+                res = pack_gzip(str(path), ultra=True, keep_if_larger=True)
+        assert run.call_args[0][0][1] == '-11'
+        assert res is not None and res.replaced
+        assert gzip.decompress(path.read_bytes()) == payload
+
+    def test_pack_gzip_falls_back_to_level_9(self, tmp_path):
+        path = tmp_path / 'a.gz'
+        payload = b'hello world ' * 500
+        path.write_bytes(gzip.compress(payload, compresslevel=1))
+        with patch('filerepack.deflate.gzip_ultra', return_value=False):
+            with patch('filerepack.repack.resolve_tool', return_value=None):
+                res = pack_gzip(str(path), ultra=True)
+        assert res is not None
+        assert gzip.decompress(path.read_bytes()) == payload
+
+    def test_tar_bundle_gzip_uses_members(self, tmp_path):
+        src = tmp_path / 'bundle.tar'
+        src.write_bytes(b'\x00' * 1024)
+        with patch('filerepack.deflate.gzip_ultra', return_value=True) as ultra:
+            assert _compress_file(str(src), str(tmp_path / 'o.gz'), 'gz', ultra=True)
+        assert ultra.call_args.kwargs['members'] is True
+
+    def test_specs_pass_ultra(self):
+        assert _PACKERS['gz'].extra['ultra'] == 'ultra'
+        assert _PACKERS['svgz'].extra['ultra'] == 'ultra'
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import zlib
+from unittest.mock import MagicMock, patch
+
+from filerepack import effort
+from filerepack.codecs import pack_jxl
+from filerepack.repack import _PACKERS, pack_avif, pack_heic
+
+_JXL_SIG = b'\x00\x00\x00\x0cJXL \r\n\x87\n'
+
+
+def _box(btype, payload):
+    return struct.pack('>I', len(payload) + 8) + btype + payload
+
+
+def _ispe(width, height):
+    return _box(b'ispe', b'\x00' * 4 + struct.pack('>II', width, height))
+
+
+def _png(width, height):
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    crc = struct.pack('>I', zlib.crc32(b'IHDR' + ihdr) & 0xFFFFFFFF)
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + ihdr + crc
+
+
+def _recorder(calls, outputs):
+    """Record commands; write outputs[tool] to the path argument that tool produces."""
+    def run(cmd, quiet=False, debug=False, cwd=None):
+        calls.append(cmd)
+        tool = cmd[0].rsplit('/', 1)[-1]
+        data, index = outputs[tool]
+        with open(cmd[index], 'wb') as fh:
+            fh.write(data)
+        return MagicMock(returncode=0)
+    return run
+
+
+class TestPresets:
+    def test_effort_drops_with_pixels(self):
+        small = effort.choose_effort((800, 600))
+        huge = effort.choose_effort((10000, 8000))
+        assert small.avif_speed < huge.avif_speed
+        assert small.jxl_effort > huge.jxl_effort
+        assert effort.choose_effort(None).name == 'medium'
+
+    def test_largest_ispe_wins(self, tmp_path):
+        path = tmp_path / 'a.heic'
+        path.write_bytes(_box(b'ftyp', b'heic') + _ispe(512, 512) + _ispe(4032, 3024))
+        assert effort.isobmff_dimensions(str(path)) == (4032, 3024)
+
+    def test_jbrd_box_detected(self, tmp_path):
+        path = tmp_path / 'a.jxl'
+        path.write_bytes(_JXL_SIG + _box(b'ftyp', b'jxl \x00\x00\x00\x00jxl ')
+                         + _box(b'jbrd', b'\x00' * 10) + _box(b'jxlc', b'\xff\x0a'))
+        assert effort.jxl_has_jpeg_reconstruction(str(path))
+        path.write_bytes(b'\xff\x0a' + b'\x00' * 20)
+        assert not effort.jxl_has_jpeg_reconstruction(str(path))
+
+
+class TestEncoders:
+    def test_avifenc_speed_and_jobs(self, tmp_path):
+        path = tmp_path / 'a.avif'
+        path.write_bytes(_box(b'ftyp', b'avif') + b'\x00' * 4000)
+        calls = []
+        run = _recorder(calls, {
+            'avifdec': (_png(10000, 8000), -1),
+            'avifenc': (_box(b'ftyp', b'avif'), -1),
+        })
+        with patch('filerepack.repack.resolve_tool', side_effect=lambda k: f'/bin/{k}'):
+            with patch('filerepack.repack._run_command', side_effect=run):
+                with patch('filerepack.repack.verify_output', return_value=True):
+                    res = pack_avif(str(path), threads=3)
+        enc = calls[1]
+        assert enc[enc.index('--speed') + 1] == '9'
+        assert enc[enc.index('--jobs') + 1] == '3'
+        assert '--lossless' in enc
+        assert res.tier == 'avif:huge'
+
+    def test_jxl_with_jbrd_recompresses_reconstructed_jpeg(self, tmp_path):
+        path = tmp_path / 'a.jxl'
+        path.write_bytes(_JXL_SIG + _box(b'jbrd', b'\x00' * 10) + _box(b'jxlc', b'\x00' * 4000))
+        calls = []
+        run = _recorder(calls, {
+            'djxl': (b'\xff\xd8\xff\xd9', -1),
+            'cjxl': (_JXL_SIG, 2),
+        })
+        with patch('filerepack.codecs.resolve_tool', side_effect=lambda k: f'/bin/{k}'):
+            with patch('filerepack.repack._run_command', side_effect=run):
+                with patch('filerepack.repack.verify_output', return_value=True):
+                    res = pack_jxl(str(path), threads=2)
+        assert calls[0][-1].endswith('.jpg')
+        enc = calls[1]
+        assert '--lossless_jpeg=1' in enc and '-d' not in enc
+        assert enc[enc.index('--num_threads') + 1] == '2'
+        assert res.method == 'cjxl jpeg'
+
+    def test_heic_speed_define_from_ispe(self, tmp_path):
+        path = tmp_path / 'a.heic'
+        path.write_bytes(_box(b'ftyp', b'heic') + _ispe(640, 480) + b'\x00' * 4000)
+        calls = []
+        run = _recorder(calls, {'convert': (b'\x00' * 10, -1)})
+        with patch('filerepack.repack.resolve_tool', side_effect=lambda k: f'/bin/{k}'):
+            with patch('filerepack.repack._run_command', side_effect=run):
+                with patch('filerepack.repack.verify_output', return_value=True):
+                    res = pack_heic(str(path), threads=4)
+        cmd = calls[0]
+        assert cmd[1:4] == ['-limit', 'thread', '4']
+        assert 'heic:speed=2' in cmd
+        assert res.tier == 'heic:small'
+
+    def test_specs_pass_threads(self):
+        for key in ('avif', 'heic', 'heif', 'jxl'):
+            assert _PACKERS[key].extra['threads'] == 'threads'
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import struct
+from unittest.mock import MagicMock, patch
+
+from filerepack import exr
+from filerepack.codecs import pack_exr
+from filerepack.repack import _PACKERS
+
+_SIZES = {'zip': 700, 'zips': 800, 'piz': 300, 'rle': 900, 'pxr24': 650, 'b44': 950}
+
+
+def _attr(name, typ, value):
+    return name + b'\x00' + typ + b'\x00' + struct.pack('<i', len(value)) + value
+
+
+def _header(width, height, types=(exr.HALF,), compression=3, extra=b''):
+    chlist = b''.join(
+        bytes([ord('R') + i]) + b'\x00' + struct.pack('<iB3xii', t, 0, 1, 1)
+        for i, t in enumerate(types)
+    ) + b'\x00'
+    return (
+        _attr(b'channels', b'chlist', chlist)
+        + _attr(b'compression', b'compression', bytes([compression]))
+        + _attr(b'dataWindow', b'box2i', struct.pack('<4i', 0, 0, width - 1, height - 1))
+        + extra + b'\x00'
+    )
+
+
+def _exr(*headers, flags=0):
+    body = b''.join(headers) + (b'\x00' if flags & 0x1000 else b'')
+    return exr.EXR_MAGIC + struct.pack('<I', 2 | flags) + body + b'\x00' * 64
+
+
+def _pack(path, calls, tool='/bin/oiiotool'):
+    def run(cmd, quiet=False, debug=False, cwd=None):
+        calls.append(cmd)
+        codec = cmd[cmd.index('--compression') + 1]
+        with open(cmd[-1], 'wb') as fh:
+            fh.write(exr.EXR_MAGIC + b'\x00' * _SIZES.get(codec, 10))
+        return MagicMock(returncode=0)
+
+    with patch('filerepack.codecs.resolve_tool', side_effect=lambda k: tool and f'/bin/{k}'):
+        with patch('filerepack.repack._run_command', side_effect=run):
+            with patch('filerepack.repack.verify_output', return_value=True):
+                return pack_exr(str(path), dryrun=True, threads=2)
+
+
+class TestHeader:
+    def test_single_and_multi_part(self, tmp_path):
+        path = tmp_path / 'a.exr'
+        path.write_bytes(_exr(_header(64, 32, (exr.HALF, exr.FLOAT), compression=4)))
+        info = exr.read_header(str(path))
+        part, = info.parts
+        assert (part.width, part.height, part.compression) == (64, 32, 'piz')
+        assert part.channel_types == (exr.HALF, exr.FLOAT)
+        path.write_bytes(_exr(_header(8, 8), _header(4, 4), flags=0x1000))
+        assert exr.read_header(str(path)).pixels == 80
+
+    def test_deep_and_garbage_rejected(self, tmp_path):
+        path = tmp_path / 'a.exr'
+        path.write_bytes(_exr(_header(8, 8, extra=_attr(b'type', b'string', b'deepscanline'))))
+        assert exr.read_header(str(path)) is None
+        path.write_bytes(exr.EXR_MAGIC + b'\x02\x00\x00\x00' + b'\xff' * 300)
+        assert exr.read_header(str(path)) is None
+
+    def test_codecs_stay_lossless(self, tmp_path):
+        path = tmp_path / 'a.exr'
+        path.write_bytes(_exr(_header(8, 8, (exr.HALF, exr.FLOAT))))
+        assert exr.trial_codecs(exr.read_header(str(path))) == ['zip', 'zips', 'piz', 'rle']
+        path.write_bytes(_exr(_header(8, 8, (exr.FLOAT,))))
+        assert 'b44' in exr.trial_codecs(exr.read_header(str(path)))
+        assert 'pxr24' not in exr.trial_codecs(exr.read_header(str(path)))
+
+
+class TestPack:
+    def test_small_image_races_every_codec(self, tmp_path):
+        path = tmp_path / 'a.exr'
+        path.write_bytes(_exr(_header(64, 32)) + b'\x00' * 2000)
+        calls = []
+        res = _pack(path, calls)
+        assert sorted(c[c.index('--compression') + 1] for c in calls) == \
+            ['piz', 'pxr24', 'rle', 'zip', 'zips']
+        assert all('-a' in c for c in calls)
+        assert res.method == 'oiiotool piz' and res.tier == 'exr:full'
+        assert res.metrics['megapixels'] == 0.002 and 'seconds_per_megapixel' in res.metrics
+
+    def test_large_image_cuts_a_sample_then_rewrites_once(self, tmp_path):
+        path = tmp_path / 'a.exr'
+        path.write_bytes(_exr(_header(4000, 3000)) + b'\x00' * 2000)
+        calls = []
+        res = _pack(path, calls)
+        assert calls[0][calls[0].index('--cut') + 1] == '4000x224+0+0'
+        final = calls[-1]
+        assert len(calls) == 7 and final[final.index('--compression') + 1] == 'piz'
+        assert final[1:3] == ['--threads', '2'] and final[-5].endswith('a.exr')
+        assert res.tier == 'exr:sampled'
+
+    def test_without_oiiotool_uses_imagemagick(self, tmp_path):
+        path = tmp_path / 'a.exr'
+        path.write_bytes(_exr(_header(8, 8)))
+        with patch('filerepack.codecs.resolve_tool',
+                   side_effect=lambda k: '/bin/convert' if k == 'convert' else None):
+            with patch('filerepack.repack._run_command', return_value=None) as run:
+                pack_exr(str(path), dryrun=True)
+        calls = [c[0][0] for c in run.call_args_list]
+        assert calls[0][0] == '/bin/convert' and 'Zip' in calls[0]
+
+    def test_spec_passes_threads(self):
+        assert _PACKERS['exr'].extra['threads'] == 'threads'
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import struct
+from unittest.mock import MagicMock, patch
+
+from filerepack import icons
+from filerepack.codecs import pack_icns, pack_ico
+from filerepack.repack import _PACKERS
+from test.image_fixtures import png_chunk, png_file
+
+
+_TEXT = png_chunk(b'tEXt', b'Software\x00' + b'x' * 60)
+_BMP = struct.pack('<IiiHH', 40, 16, 32, 1, 32) + b'\x11' * 100
+
+
+def _ico(*payloads, kind=1):
+    offset = 6 + 16 * len(payloads)
+    table = b''
+    for payload in payloads:
+        table += bytes([16, 16, 0, 0]) + struct.pack('<HHII', 1, 32, len(payload), offset)
+        offset += len(payload)
+    return struct.pack('<HHH', 0, kind, len(payloads)) + table + b''.join(payloads)
+
+
+def _icns(*entries):
+    body = b''.join(struct.pack('>4sI', t, len(p) + 8) + p for t, p in entries)
+    return b'icns' + struct.pack('>I', len(body) + 8) + body
+
+
+def _no_tools():
+    return patch('filerepack.repack.resolve_tool', return_value=None)
+
+
+class TestIco:
+    def test_png_entry_repacked_bmp_entry_untouched(self, tmp_path):
+        path = tmp_path / 'a.ico'
+        path.write_bytes(_ico(_BMP, png_file(_TEXT)))
+        with _no_tools(), patch('filerepack.codecs.resolve_tool', return_value=None):
+            res = pack_ico(str(path), threads=2)
+        assert res.replaced and res.method == 'icon png'
+        assert path.read_bytes() == _ico(_BMP, png_file())
+        _header, entries = icons.read_ico(path.read_bytes())
+        assert [p for _e, p in entries] == [_BMP, png_file()]
+
+    def test_cursor_keeps_type(self, tmp_path):
+        path = tmp_path / 'a.cur'
+        path.write_bytes(_ico(png_file(_TEXT), kind=2))
+        with _no_tools():
+            res = pack_ico(str(path))
+        assert res.replaced and path.read_bytes()[2:4] == b'\x02\x00'
+
+    def test_no_png_entries_skips_imagemagick(self, tmp_path):
+        path = tmp_path / 'a.ico'
+        path.write_bytes(_ico(_BMP))
+        with patch('filerepack.codecs.resolve_tool', return_value='/bin/convert'):
+            with patch('filerepack.repack._run_command') as run:
+                res = pack_ico(str(path))
+        run.assert_not_called()
+        assert res.method == 'skip' and not res.replaced
+
+    def test_unparsable_directory_falls_back_to_imagemagick(self, tmp_path):
+        path = tmp_path / 'a.ico'
+        path.write_bytes(struct.pack('<HHH', 0, 1, 1) + b'\x00' * 8 + struct.pack('<II', 99, 22))
+        with patch('filerepack.codecs.resolve_tool', return_value='/bin/convert'):
+            with patch('filerepack.repack._run_command', return_value=MagicMock()) as run:
+                pack_ico(str(path), dryrun=True)
+        assert run.call_args[0][0][0] == '/bin/convert'
+
+
+class TestIcns:
+    def test_toc_sizes_rewritten(self, tmp_path):
+        path = tmp_path / 'a.icns'
+        big, other = png_file(_TEXT), b'\x00' * 40
+        toc = struct.pack('>4sI4sI', b'ic10', len(big) + 8, b'is32', len(other) + 8)
+        path.write_bytes(_icns((b'TOC ', toc), (b'ic10', big), (b'is32', other)))
+        with _no_tools():
+            res = pack_icns(str(path))
+        assert res.replaced
+        small = png_file()
+        new_toc = struct.pack('>4sI4sI', b'ic10', len(small) + 8, b'is32', len(other) + 8)
+        assert path.read_bytes() == _icns((b'TOC ', new_toc), (b'ic10', small), (b'is32', other))
+
+    def test_bad_length_rejected(self):
+        assert icons.read_icns(b'icns' + struct.pack('>I', 20) + b'ic10' + struct.pack('>I', 4)
+                               + b'\x00' * 4) is None
+
+    def test_specs_pass_options(self):
+        for key in ('ico', 'icns'):
+            assert _PACKERS[key].extra == {
+                'ultra': 'ultra', 'keep_meta': 'keep_meta', 'threads': 'threads',
+            }
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import struct
+from unittest.mock import MagicMock, patch
+
+from filerepack import jpeg
+from filerepack.repack import pack_jpg
+
+_STD_AC = bytes([0, 2, 1, 3, 3, 2, 4, 3, 5, 5, 4, 4, 0, 0, 1, 0x7D])
+_OPT_AC = bytes([0, 1, 2, 3, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0])
+
+
+def _segment(marker, payload):
+    return bytes([0xFF, marker]) + struct.pack('>H', len(payload) + 2) + payload
+
+
+def _jpeg(sof=0xC2, ac_bits=_OPT_AC, exif=False, comment=False):
+    data = b'\xff\xd8' + _segment(0xE0, b'JFIF\x00\x01\x01' + b'\x00' * 7)
+    if exif:
+        data += _segment(0xE1, b'Exif\x00\x00' + b'\x00' * 100)
+    if comment:
+        data += _segment(0xFE, b'made by camera')
+    data += _segment(0xDB, b'\x00' + b'\x01' * 64)
+    data += _segment(sof, b'\x08\x00\x10\x00\x10\x01\x01\x11\x00')
+    data += _segment(0xC4, b'\x10' + ac_bits + bytes(range(sum(ac_bits))))
+    data += _segment(0xDA, b'\x01\x01\x00\x00\x3f\x00') + b'\x12\x34' * 50
+    return data + b'\xff\xd9'
+
+
+class TestScan:
+    def test_collects_sof_tables_and_metadata(self, tmp_path):
+        path = tmp_path / 'a.jpg'
+        path.write_bytes(_jpeg(sof=0xC0, ac_bits=_STD_AC, exif=True, comment=True))
+        info = jpeg.scan(str(path))
+        assert info.sof == 0xC0 and not info.progressive
+        assert info.standard_tables
+        assert info.metadata == {'exif': 110, 'comment': 18}
+
+    def test_jfif_and_adobe_are_not_metadata(self):
+        assert jpeg.metadata_kind(0xE0, b'JFIF\x00') is None
+        assert jpeg.metadata_kind(0xEE, b'Adobe\x00') is None
+        assert jpeg.metadata_kind(0xE2, b'ICC_PROFILE\x00') == 'icc'
+        assert jpeg.metadata_kind(0xE1, b'http://ns.adobe.com/xap/1.0/\x00') == 'xmp'
+
+    def test_tables_between_progressive_scans(self, tmp_path):
+        scan = _segment(0xDA, b'\x01\x01\x00\x00\x00\x00') + b'\x12\xff\x00\x34\xff\xd0\x56'
+        data = _jpeg()[:-2]
+        data += _segment(0xC4, b'\x10' + _STD_AC + bytes(range(sum(_STD_AC)))) + scan
+        path = tmp_path / 'a.jpg'
+        path.write_bytes(data + b'\xff\xd9')
+        info = jpeg.scan(str(path))
+        assert info.progressive and info.standard_tables
+        assert jpeg.classify(info) == jpeg.REOPTIMIZE
+
+    def test_truncated_header_is_none(self, tmp_path):
+        path = tmp_path / 'a.jpg'
+        path.write_bytes(_jpeg()[:30])
+        assert jpeg.scan(str(path)) is None
+
+
+class TestClassify:
+    def test_classes(self, tmp_path):
+        cases = {
+            'optimal.jpg': (_jpeg(), jpeg.OPTIMAL),
+            'meta.jpg': (_jpeg(exif=True), jpeg.METADATA),
+            'baseline.jpg': (_jpeg(sof=0xC0), jpeg.REOPTIMIZE),
+            'standard.jpg': (_jpeg(ac_bits=_STD_AC), jpeg.REOPTIMIZE),
+        }
+        for name, (data, expected) in cases.items():
+            path = tmp_path / name
+            path.write_bytes(data)
+            assert jpeg.classify(jpeg.scan(str(path))) == expected, name
+
+    def test_keep_meta_makes_metadata_optimal(self, tmp_path):
+        path = tmp_path / 'a.jpg'
+        path.write_bytes(_jpeg(exif=True))
+        assert jpeg.classify(jpeg.scan(str(path)), keep_meta=True) == jpeg.OPTIMAL
+
+
+class TestPackJpg:
+    def test_optimal_file_is_skipped_without_tools(self, tmp_path):
+        path = tmp_path / 'a.jpg'
+        path.write_bytes(_jpeg())
+        with patch('filerepack.repack._run_command') as run:
+            res = pack_jpg(str(path))
+        run.assert_not_called()
+        assert res.tier == 'jpeg:optimal' and res.replaced is False
+        assert res.outsize == res.insize
+
+    def test_metadata_only_is_stripped_in_process(self, tmp_path):
+        path = tmp_path / 'a.jpg'
+        path.write_bytes(_jpeg(exif=True))
+        with patch('filerepack.repack._run_command') as run:
+            res = pack_jpg(str(path))
+        run.assert_not_called()
+        assert res.method == 'strip' and res.tier == 'jpeg:metadata'
+        assert path.read_bytes() == _jpeg()
+
+    def test_metadata_only_falls_back_to_jpegoptim_alone(self, tmp_path):
+        path = tmp_path / 'a.jpg'
+        path.write_bytes(_jpeg(exif=True))
+        calls = []
+
+        def fake_run(cmd, quiet=False, debug=False, cwd=None):
+            calls.append(cmd)
+            return MagicMock(returncode=0)
+
+        with patch('filerepack.strip.pack_strip', return_value=None):
+            with patch('filerepack.repack.resolve_tool', side_effect=lambda k: f'/bin/{k}'):
+                with patch('filerepack.repack._run_command', side_effect=fake_run):
+                    with patch('filerepack.repack.verify_output', return_value=True):
+                        res = pack_jpg(str(path), dryrun=True)
+        assert [c[0] for c in calls] == ['/bin/jpegoptim']
+        assert res.tier == 'jpeg:metadata'
+
+    def test_lossy_skips_classification(self, tmp_path):
+        path = tmp_path / 'a.jpg'
+        path.write_bytes(_jpeg())
+        with patch('filerepack.repack.resolve_tool', return_value=None):
+            assert pack_jpg(str(path), jpeg_quality=80) is None
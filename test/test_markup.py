@@ -103,17 +103,18 @@ class TestDataUris:
         smaller = b'\x89PNG\r\n\x1a\n'
 
         def fake_members(members, options=None):
-            path = members['img']
+            key, path = next(iter(members.items()))
             with open(path, 'wb') as fh:
                 fh.write(smaller)
             from filerepack.containers import MemberResult
             return {
-                'img': MemberResult(
-                    'img', path, len(raw), len(smaller), True,
+                key: MemberResult(
+                    key, path, len(raw), len(smaller), True,
                 )
             }
 
-        with patch('filerepack.markup.pack_members', side_effect=fake_members):
-            out = rewrite_data_uris(text)
+        with patch('filerepack.containers.resolve_tool', return_value=None):
+            with patch('filerepack.containers.pack_members', side_effect=fake_members):
+                out = rewrite_data_uris(text)
         assert 'data:image/png;base64,' in out
         assert b64 not in out
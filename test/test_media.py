@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+from unittest.mock import MagicMock, patch
+
+from filerepack import media
+from filerepack.codecs import _probe_audio_codec
+from filerepack.repack import _pack_video
+
+
+def _ffprobe_json(*streams, fmt='mov,mp4,m4a,3gp,3g2,mj2'):
+    return json.dumps({
+        'streams': list(streams),
+        'format': {
+            'format_name': fmt, 'duration': '12.480000', 'bit_rate': '2400000',
+            'tags': {'encoder': 'Lavf60.3.100'},
+        },
+    })
+
+
+_H264 = {
+    'codec_type': 'video', 'codec_name': 'h264', 'width': 1920, 'height': 1080,
+    'bit_rate': '2200000', 'pix_fmt': 'yuv420p', 'disposition': {'attached_pic': 0},
+}
+_AAC = {'codec_type': 'audio', 'codec_name': 'aac', 'bit_rate': '192000'}
+_COVER = {'codec_type': 'video', 'codec_name': 'mjpeg', 'disposition': {'attached_pic': 1}}
+
+
+def _probe(path, stdout, returncode=0):
+    proc = MagicMock(returncode=returncode, stdout=stdout, stderr='')
+    with patch('filerepack.media.resolve_tool', return_value='/bin/ffprobe'):
+        with patch('filerepack.media.subprocess.run', return_value=proc) as run:
+            return media.probe(str(path)), run
+
+
+class TestProbe:
+    def test_structured_fields(self, tmp_path):
+        path = tmp_path / 'a.mp4'
+        path.write_bytes(b'\x00' * 64)
+        info, run = _probe(path, _ffprobe_json(_H264, _AAC))
+        assert run.call_args[0][0][:2] == ['/bin/ffprobe', '-v']
+        assert info.duration == 12.48 and info.bit_rate == 2400000
+        assert info.encoder == 'Lavf60.3.100'
+        assert (info.video.codec, info.video.width, info.video.height) == ('h264', 1920, 1080)
+        assert info.audio_codec == 'aac' and info.audio.bit_rate == 192000
+
+    def test_cover_art_is_not_video(self, tmp_path):
+        path = tmp_path / 'a.m4a'
+        path.write_bytes(b'\x00' * 64)
+        info, _run = _probe(path, _ffprobe_json(_AAC, _COVER))
+        assert info.video is None and info.audio_codec == 'aac'
+
+    def test_cached_until_file_changes(self, tmp_path):
+        path = tmp_path / 'b.mp4'
+        path.write_bytes(b'\x00' * 64)
+        _probe(path, _ffprobe_json(_H264))
+        info, run = _probe(path, 'not json')
+        run.assert_not_called()
+        assert info.video.codec == 'h264'
+        path.write_bytes(b'\x00' * 65)
+        info, run = _probe(path, 'not json')
+        assert run.call_count == 1 and info is None
+
+    def test_missing_ffprobe(self, tmp_path):
+        path = tmp_path / 'c.mp4'
+        path.write_bytes(b'\x00' * 64)
+        with patch('filerepack.media.resolve_tool', return_value=None):
+            assert media.probe(str(path)) is None
+        assert (str(path), 64, os.stat(path).st_mtime_ns) not in media._CACHE
+
+
+class TestPackers:
+    def test_audio_codec_from_probe(self, tmp_path):
+        path = tmp_path / 'a.oga'
+        path.write_bytes(b'OggS' + b'\x00' * 60)
+        _probe(path, _ffprobe_json({'codec_type': 'audio', 'codec_name': 'flac'}, fmt='ogg'))
+        assert _probe_audio_codec(str(path), False) == 'flac'
+
+    def test_audio_codec_from_ffmpeg_without_ffprobe(self, tmp_path):
+        path = tmp_path / 'b.m4a'
+        path.write_bytes(b'\x00' * 64)
+        banner = MagicMock(stderr='  Stream #0:0(und): Audio: aac (LC), 44100 Hz', stdout='')
+        with patch('filerepack.media.resolve_tool', return_value=None):
+            with patch('filerepack.codecs.resolve_tool', return_value='/bin/ffmpeg'):
+                with patch('subprocess.run', return_value=banner) as run:
+                    assert _probe_audio_codec(str(path), False) == 'aac'
+        assert run.call_args[0][0][:2] == ['/bin/ffmpeg', '-i']
+
+    def test_video_without_video_stream_skips_encode(self, tmp_path):
+        path = tmp_path / 'a.mp4'
+        path.write_bytes(b'\x00' * 64)
+        _probe(path, _ffprobe_json(_AAC, _COVER))
+        with patch('filerepack.repack.resolve_tool', return_value='/bin/ffmpeg'):
+            with patch('filerepack.repack._run_command') as run:
+                res = _pack_video(str(path), 'mp4')
+        run.assert_not_called()
+        assert res.method == 'skip' and res.tier == 'video:no-stream' and not res.replaced
@@ -1,14 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import os
+
 import pytest
-from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
 
 from filerepack.repack import (
     _PACKERS, _dispatch_packer, build_gs_pdf_cmd, jpeg_quality_to_qfactor,
     normalize_pdf_profile, pack_pdf,
 )
 from filerepack.codecs import pack_ai
-from filerepack.consts import DEFAULT_LOSSY_PDF_PROFILE, PDF_PROFILES
+from filerepack.models import PackResult, RepackSummary
+from filerepack.consts import (
+    DEFAULT_LOSSY_PDF_PROFILE, PDF_PROFILES, PDF_REDEFLATE_MAX_BYTES,
+)
 
 
 def _tools(gs='/usr/bin/gs', qpdf='/usr/bin/qpdf'):
@@ -203,3 +209,360 @@ class TestPdfDispatch:
         assert kwargs['pdf_profile'] == 'screen'
         assert kwargs['jpeg_quality'] == 70
         assert kwargs['lossy'] is True
+
+
+def _image_pdf(path, pages=3, copies=1):
+    """pages pages drawing one shared JPEG XObject; copies extra objects with equal bytes."""
+    pikepdf = pytest.importorskip('pikepdf')
+    pdf = pikepdf.new()
+    raw = b'\xff\xd8' + b'\x00' * 300 + b'\xff\xd9'
+    images = [
+        pdf.make_stream(raw, Type=pikepdf.Name.XObject, Subtype=pikepdf.Name.Image,
+                        Width=1, Height=1, ColorSpace=pikepdf.Name.DeviceGray,
+                        BitsPerComponent=8, Filter=pikepdf.Name.DCTDecode)
+        for _ in range(1 + copies)
+    ]
+    for i in range(pages):
+        page = pdf.add_blank_page()
+        page.Resources = pikepdf.Dictionary(
+            XObject=pikepdf.Dictionary(Im0=images[min(i, len(images) - 1)]),
+        )
+    pdf.save(path)
+
+
+class TestPdfImageWalk:
+    def test_shared_and_identical_streams_packed_and_written_once(self, tmp_path):
+        from filerepack.pdf_streams import rebuild_pdf_images
+        src, dest = str(tmp_path / 'a.pdf'), str(tmp_path / 'b.pdf')
+        _image_pdf(src, pages=4, copies=1)
+        calls = []
+
+        def fake_pack(data, ext, options):
+            calls.append(options['threads'])
+            return b'\xff\xd8\xff\xd9'
+
+        with patch('filerepack.pdf_streams._pack_stream_bytes', side_effect=fake_pack):
+            assert rebuild_pdf_images(src, dest, {'threads': 2})
+        assert len(calls) == 1
+        import pikepdf
+        with pikepdf.open(dest) as pdf:
+            streams = {tuple(im.objgen): im.read_raw_bytes()
+                       for page in pdf.pages for im in page.images.values()}
+        assert len(streams) == 1 and set(streams.values()) == {b'\xff\xd8\xff\xd9'}
+
+    def test_batches_drop_packed_bytes_and_alias_later_duplicates(self, tmp_path):
+        pikepdf = pytest.importorskip('pikepdf')
+        from filerepack.pdf_streams import _replace_images
+        src = str(tmp_path / 'a.pdf')
+        pdf = pikepdf.new()
+        for i in range(6):
+            raw = b'\xff\xd8' + bytes([i % 3]) * 300 + b'\xff\xd9'
+            image = pdf.make_stream(
+                raw, Type=pikepdf.Name.XObject, Subtype=pikepdf.Name.Image, Width=1,
+                Height=1, ColorSpace=pikepdf.Name.DeviceGray, BitsPerComponent=8,
+                Filter=pikepdf.Name.DCTDecode,
+            )
+            pdf.add_blank_page().Resources = pikepdf.Dictionary(
+                XObject=pikepdf.Dictionary(Im0=image),
+            )
+        pdf.save(src)
+        live = []
+
+        class Packed(bytes):
+            def __del__(self):
+                live.remove(id(self))
+
+        held = []
+
+        def fake_pack_all(contents, options):
+            held.append(len(live))
+            out = {digest: Packed(b'\xff\xd8' + raw[2:3] + b'\xff\xd9')
+                   for digest, (raw, _ext) in contents.items()}
+            live.extend(id(v) for v in out.values())
+            return out
+
+        with pikepdf.open(src) as doc:
+            with patch('filerepack.pdf_streams._pack_all', side_effect=fake_pack_all):
+                assert _replace_images(doc, {}, batch_bytes=600)
+            assert held == [0, 0] and live == []
+            images = [tuple(page.images['/Im0'].objgen) for page in doc.pages]
+            assert images[3:] == images[:3] and len(set(images)) == 3
+
+    def test_nothing_packed_leaves_no_output(self, tmp_path):
+        from filerepack.pdf_streams import rebuild_pdf_images
+        src, dest = str(tmp_path / 'a.pdf'), str(tmp_path / 'b.pdf')
+        _image_pdf(src)
+        with patch('filerepack.pdf_streams._pack_stream_bytes', return_value=None):
+            assert rebuild_pdf_images(src, dest, {}) is False
+
+    def test_lossless_is_one_pikepdf_save(self, tmp_path):
+        pikepdf = pytest.importorskip('pikepdf')
+        path = str(tmp_path / 'a.pdf')
+        _image_pdf(path, pages=40, copies=0)
+        with patch('filerepack.repack.resolve_tool', side_effect=_tools()):
+            with patch('filerepack.repack._run_command') as run:
+                with patch('filerepack.pdf_streams._pack_stream_bytes', return_value=None):
+                    res = pack_pdf(path, keep_if_larger=False)
+        run.assert_not_called()
+        assert res.replaced and res.method == 'pikepdf'
+        with pikepdf.open(path) as pdf:
+            assert pdf.is_linearized
+
+    def test_packer_passes_threads(self):
+        assert _PACKERS['pdf'].extra['threads'] == 'threads'
+
+
+def _fake_qpdf(calls, abort_first=False):
+    from filerepack import memory, race
+
+    def run(cmd, **kwargs):
+        calls.append(list(cmd))
+        if abort_first and len(calls) == 1:
+            race.current_scope().reason = memory.ABORTED_MEMORY
+            return None
+        with open(cmd[-1], 'wb') as fh:
+            fh.write(b'%PDF-1.5\n')
+        return MagicMock(returncode=0)
+    return run
+
+
+class TestPdfMemoryCeiling:
+    def _pack(self, tmp_path, calls, **kwargs):
+        path = tmp_path / 'a.pdf'
+        path.write_bytes(b'%PDF-1.4\n' + b'0' * 1000)
+        with patch('filerepack.pdf_streams.save_pdf', return_value=False):
+            with patch('filerepack.repack.resolve_tool', side_effect=_tools()):
+                with patch('filerepack.repack._run_command', side_effect=calls):
+                    with patch('filerepack.repack.verify_output', return_value=True):
+                        return pack_pdf(str(path), dryrun=True, **kwargs)
+
+    def test_ceiling_below_estimate_skips_linearize(self, tmp_path):
+        calls = []
+        res = self._pack(tmp_path, _fake_qpdf(calls), max_memory_bytes=1500)
+        assert '--linearize' not in calls[0]
+        assert res.note == 'memory ceiling: not linearized'
+        assert res.metrics['peak_rss_mb'] > 0
+
+    def test_qpdf_killed_at_ceiling_retries_without_linearize(self, tmp_path):
+        calls = []
+        res = self._pack(tmp_path, _fake_qpdf(calls, abort_first=True),
+                         max_memory_bytes=10 * 1024 ** 3)
+        assert [('--linearize' in c) for c in calls] == [True, False]
+        assert res.outsize == 9 and res.note == 'memory ceiling: not linearized'
+
+    def test_no_ceiling_still_records_peak(self, tmp_path):
+        calls = []
+        res = self._pack(tmp_path, _fake_qpdf(calls))
+        assert '--linearize' in calls[0] and res.note is None
+        summary = RepackSummary(results=[res, PackResult('b.jpg', 1, 1, 0.0)])
+        assert summary.peak_rss_mb == res.metrics['peak_rss_mb']
+
+    def test_pikepdf_drops_linearization_over_ceiling(self, tmp_path):
+        pikepdf = pytest.importorskip('pikepdf')
+        from filerepack.memory import MemoryWatch
+        from filerepack.pdf_streams import save_pdf
+        src, dest = str(tmp_path / 'a.pdf'), str(tmp_path / 'b.pdf')
+        _image_pdf(src, pages=20, copies=0)
+        watch = MemoryWatch(ceiling=1)
+        with watch, patch('filerepack.pdf_streams._pack_stream_bytes', return_value=None):
+            assert save_pdf(src, dest, {}, watch=watch)
+        assert watch.exceeded and watch.degraded
+        with pikepdf.open(dest) as pdf:
+            assert not pdf.is_linearized
+
+    def test_specs_pass_max_memory(self):
+        for key in ('pdf', 'ai'):
+            assert _PACKERS[key].extra['max_memory_bytes'] == 'max_memory_bytes'
+
+
+class TestGsPageRanges:
+    def test_page_ranges_cover_every_page(self):
+        from filerepack.pdf_pages import page_ranges
+        assert page_ranges(100, 3) == [(1, 34), (35, 67), (68, 100)]
+        assert page_ranges(2, 8) == [(1, 1), (2, 2)]
+
+    def test_ranges_run_in_parallel_then_merge(self, tmp_path):
+        path = tmp_path / 'book.pdf'
+        path.write_bytes(b'%PDF-1.4\n' + b'0' * 5000)
+        calls = []
+
+        def fake_run(cmd, **kwargs):
+            calls.append(list(cmd))
+            if '--show-npages' in cmd:
+                return MagicMock(stdout='100\n')
+            out = cmd[-1]
+            if cmd[0] == '/usr/bin/gs':
+                out = next(a for a in cmd if a.startswith('-sOutputFile=')).split('=', 1)[1]
+            with open(out, 'wb') as fh:
+                fh.write(b'%PDF-1.4\n' + b'1' * 100)
+            return MagicMock(returncode=0)
+
+        def fake_graft(src, parts, dest):
+            grafts.append((src, list(parts)))
+            return fake_run([dest]) is not None
+
+        grafts = []
+        with patch('filerepack.pdf_pages.PDF_GS_RANGE_MIN_BYTES', 0):
+            with patch('filerepack.pdf_pages.pikepdf_available', return_value=True), \
+                    patch('filerepack.pdf_pages.graft_pages', side_effect=fake_graft), \
+                    patch('filerepack.pdf_pages.dedupe_resources', return_value=False):
+                with patch('filerepack.repack.resolve_tool', side_effect=_tools()):
+                    with patch('filerepack.repack._run_command', side_effect=fake_run):
+                        res = pack_pdf(str(path), lossy=True, threads=4)
+        splits = sorted(c[4] for c in calls if c[0] == '/usr/bin/qpdf' and c[2] == '--pages'
+                        and c[3] == str(path))
+        assert splits == ['1-34', '35-67', '68-100']
+        assert sum(c[0] == '/usr/bin/gs' for c in calls) == 3
+        assert len(grafts) == 1 and grafts[0][0] == str(path) and len(grafts[0][1]) == 3
+        assert res.replaced and res.method == 'gs ranges' and res.metrics['ranges'] == 3
+
+    def test_failed_range_falls_back_to_one_process(self, tmp_path):
+        path = tmp_path / 'book.pdf'
+        path.write_bytes(b'%PDF-1.4\n' + b'0' * 5000)
+        calls = []
+
+        def fake_run(cmd, **kwargs):
+            calls.append(list(cmd))
+            return MagicMock(stdout='80') if '--show-npages' in cmd else None
+
+        with patch('filerepack.pdf_pages.PDF_GS_RANGE_MIN_BYTES', 0):
+            with patch('filerepack.pdf_pages.pikepdf_available', return_value=True):
+                with patch('filerepack.repack.resolve_tool', side_effect=_tools()):
+                    with patch('filerepack.repack._run_command', side_effect=fake_run):
+                        pack_pdf(str(path), lossy=True, threads=2)
+        whole = [c for c in calls if c[0] == '/usr/bin/gs' and c[-1] == str(path)]
+        assert len(whole) == 1
+
+    def test_merge_keeps_outlines_and_destinations_on_new_pages(self, tmp_path):
+        pikepdf = pytest.importorskip('pikepdf')
+        from filerepack.pdf_pages import pack_gs_ranges
+        path = tmp_path / 'book.pdf'
+        pdf = pikepdf.new()
+        for _ in range(4):
+            page = pdf.add_blank_page()
+            page.Resources = pikepdf.Dictionary(XObject=pikepdf.Dictionary(
+                Im0=pdf.make_stream(os.urandom(50000), Type=pikepdf.Name.XObject,
+                                    Subtype=pikepdf.Name.Image),
+            ))
+        pdf.docinfo['/Title'] = 'Book'
+        with pdf.open_outline() as outline:
+            outline.root.append(pikepdf.OutlineItem('Chapter', 2))
+        pdf.Root.Names = pikepdf.Dictionary(Dests=pikepdf.Dictionary(Names=pikepdf.Array([
+            pikepdf.String('end'), pikepdf.Array([pdf.pages[3].obj, pikepdf.Name.Fit]),
+        ])))
+        pdf.pages[0].Annots = pdf.make_indirect(pikepdf.Array([pikepdf.Dictionary(
+            Type=pikepdf.Name.Annot, Subtype=pikepdf.Name.Link, Rect=[0, 0, 10, 10],
+            Dest=pikepdf.Array([pdf.pages[1].obj, pikepdf.Name.Fit]),
+        )]))
+        pdf.save(path)
+
+        def fake_run(cmd, **kwargs):
+            if '--show-npages' in cmd:
+                return MagicMock(stdout='4\n')
+            if cmd[0] == '/usr/bin/gs':
+                out = next(a for a in cmd if a.startswith('-sOutputFile=')).split('=', 1)[1]
+                with pikepdf.open(cmd[-1]) as part:
+                    for page in part.pages:
+                        page.Resources = pikepdf.Dictionary()
+                    part.save(out)
+                return MagicMock(returncode=0)
+            pikepdf.Job(['qpdf'] + cmd[1:]).run()
+            return MagicMock(returncode=0)
+
+        with patch('filerepack.pdf_pages.PDF_GS_RANGE_MIN_BYTES', 0):
+            with patch('filerepack.pdf_pages.PDF_GS_RANGE_MIN_PAGES', 1):
+                with patch('filerepack.repack._run_command', side_effect=fake_run):
+                    res = pack_gs_ranges(
+                        str(path), '/usr/bin/gs', '/usr/bin/qpdf', 'ebook', threads=2,
+                        keep_if_larger=False,
+                    )
+        assert res.replaced and res.metrics['ranges'] == 2
+        assert os.path.getsize(path) < 10000
+        with pikepdf.open(path) as out:
+            pages = [tuple(p.obj.objgen) for p in out.pages]
+            assert len(pages) == 4 and str(out.docinfo['/Title']) == 'Book'
+            assert all('/XObject' not in p.Resources for p in out.pages)
+            with out.open_outline() as outline:
+                assert [item.title for item in outline.root] == ['Chapter']
+                assert tuple(outline.root[0].destination[0].objgen) == pages[2]
+            named = out.Root.Names.Dests.Names[1]
+            assert tuple(named[0].objgen) == pages[3]
+            link = out.pages[0].Annots[0].Dest
+            assert tuple(link[0].objgen) == pages[1]
+
+    def test_dedupe_merges_identical_fonts(self, tmp_path):
+        pikepdf = pytest.importorskip('pikepdf')
+        from filerepack.pdf_pages import dedupe_resources
+        src, dest = str(tmp_path / 'a.pdf'), str(tmp_path / 'b.pdf')
+        pdf = pikepdf.new()
+        for _ in range(2):
+            font_file = pdf.make_stream(b'font program' * 50, Length1=600)
+            descriptor = pdf.make_indirect(pikepdf.Dictionary(
+                Type=pikepdf.Name.FontDescriptor, FontName=pikepdf.Name.Foo,
+                FontFile2=font_file,
+            ))
+            font = pdf.make_indirect(pikepdf.Dictionary(
+                Type=pikepdf.Name.Font, Subtype=pikepdf.Name.TrueType,
+                BaseFont=pikepdf.Name.Foo, FontDescriptor=descriptor,
+            ))
+            page = pdf.add_blank_page()
+            page.Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font))
+        pdf.save(src)
+        assert dedupe_resources(src, dest)
+        with pikepdf.open(dest) as out:
+            fonts = {tuple(p.Resources.Font.F1.objgen) for p in out.pages}
+            streams = [o for o in out.objects if isinstance(o, pikepdf.Stream)
+                       and '/Length1' in o]
+        assert len(fonts) == 1 and len(streams) == 1
+
+
+class TestPdfFlateStreams:
+    def test_flate_streams_redeflated_and_predictor_kept(self, tmp_path):
+        pikepdf = pytest.importorskip('pikepdf')
+        import zlib
+        from filerepack.pdf_streams import save_pdf
+        data = b'0 0 m 100 100 l S\n' * 2000
+        src, dest = str(tmp_path / 'a.pdf'), str(tmp_path / 'b.pdf')
+        pdf = pikepdf.new()
+        page = pdf.add_blank_page()
+        page.Contents = pdf.make_stream(zlib.compress(data, 1), Filter=pikepdf.Name.FlateDecode)
+        page.Resources = pikepdf.Dictionary(Icc=pdf.make_stream(
+            zlib.compress(data, 1), Filter=pikepdf.Name.FlateDecode,
+            DecodeParms=pikepdf.Dictionary(Predictor=12, Columns=4),
+        ))
+        pdf.save(src, compress_streams=False)
+        assert save_pdf(src, dest, {'threads': 2})
+        with pikepdf.open(dest) as out:
+            page = out.pages[0]
+            contents, icc = page.Contents, page.Resources.Icc
+            assert len(contents.read_raw_bytes()) < len(zlib.compress(data, 1))
+            assert contents.read_bytes() == data
+            assert icc.DecodeParms.Predictor == 12
+            assert zlib.decompress(icc.read_raw_bytes()) == data
+
+    def test_memory_ceiling_caps_inflation_and_pool(self, tmp_path):
+        pikepdf = pytest.importorskip('pikepdf')
+        import zlib
+        from filerepack.memory import MemoryWatch
+        from filerepack.pdf_streams import _redeflate_streams
+        pdf = pikepdf.new()
+        pdf.add_blank_page().Contents = pdf.make_stream(
+            zlib.compress(b'0 0 m\n' * 100, 1), Filter=pikepdf.Name.FlateDecode,
+        )
+        caps, pools = [], []
+        real_pool = ThreadPoolExecutor
+
+        def pool(max_workers):
+            pools.append(max_workers)
+            return real_pool(max_workers=max_workers)
+
+        def fake_redeflate(blob, ultra=False, max_raw=None):
+            caps.append(max_raw)
+            return None
+
+        with patch('filerepack.pdf_streams.ThreadPoolExecutor', side_effect=pool):
+            with patch('filerepack.pdf_streams.redeflate', side_effect=fake_redeflate):
+                for ceiling in (1000, 4 * PDF_REDEFLATE_MAX_BYTES, None):
+                    _redeflate_streams(pdf, {'threads': 8}, watch=MemoryWatch(ceiling))
+        assert caps == [500, PDF_REDEFLATE_MAX_BYTES, PDF_REDEFLATE_MAX_BYTES]
+        assert pools == [1, 2, 8]
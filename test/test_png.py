@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import zlib
+from unittest.mock import MagicMock, patch
+
+from filerepack.__main__ import _BulkAcc
+from filerepack.models import PackResult, RepackSummary
+from filerepack.png import PNG_TIERS, TINY, choose_tier, png_dimensions
+from filerepack.repack import _dispatch_packer, pack_png
+
+
+def _png_header(width, height, pad=0):
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    chunk = struct.pack('>I', len(ihdr)) + b'IHDR' + ihdr
+    chunk += struct.pack('>I', zlib.crc32(b'IHDR' + ihdr) & 0xffffffff)
+    return b'\x89PNG\r\n\x1a\n' + chunk + b'\x00' * pad
+
+
+def _resolve(mapping):
+    return lambda key: mapping.get(key)
+
+
+class TestTiers:
+    def test_dimensions_from_ihdr(self, tmp_path):
+        path = tmp_path / 'a.png'
+        path.write_bytes(_png_header(640, 480))
+        assert png_dimensions(str(path)) == (640, 480)
+
+    def test_not_png_has_no_dimensions(self, tmp_path):
+        path = tmp_path / 'a.png'
+        path.write_bytes(b'GIF89a' + b'\x00' * 40)
+        assert png_dimensions(str(path)) is None
+
+    def test_tier_by_size_and_pixels(self, tmp_path):
+        tiny = tmp_path / 'icon.png'
+        tiny.write_bytes(_png_header(16, 16))
+        assert choose_tier(str(tiny)) is TINY
+        photo = tmp_path / 'photo.png'
+        photo.write_bytes(_png_header(1000, 1000, pad=20000))
+        assert choose_tier(str(photo)).name == 'standard'
+        scan = tmp_path / 'scan.png'
+        scan.write_bytes(_png_header(10000, 8000, pad=20000))
+        assert choose_tier(str(scan)) is PNG_TIERS[-1]
+
+
+class TestTieredPackPng:
+    def test_oxipng_level_and_timeout_follow_tier(self, tmp_path):
+        path = tmp_path / 'scan.png'
+        path.write_bytes(_png_header(10000, 8000, pad=20000))
+        calls = []
+
+        def fake_run(cmd, quiet=False, debug=False, cwd=None):
+            calls.append(cmd)
+            return MagicMock(returncode=0)
+
+        resolve = _resolve({'oxipng': '/bin/oxipng', 'zopflipng': '/bin/zopflipng'})
+        with patch('filerepack.repack.resolve_tool', side_effect=resolve):
+            with patch('filerepack.repack._run_command', side_effect=fake_run):
+                with patch('filerepack.repack.verify_output', return_value=True):
+                    res = pack_png(
+                        str(path), ultra=True, dryrun=True, keep_if_larger=False,
+                    )
+        huge = PNG_TIERS[-1]
+        oxipng = [c for c in calls if c[0] == '/bin/oxipng'][0]
+        assert oxipng[oxipng.index('-o') + 1] == huge.oxipng_level
+        assert oxipng[oxipng.index('--timeout') + 1] == str(huge.timeout)
+        assert all(c[0] != '/bin/zopflipng' for c in calls)
+        assert res.tier == 'png:huge'
+
+    def test_dispatch_stamps_elapsed_seconds(self, tmp_path):
+        path = tmp_path / 'a.png'
+        path.write_bytes(_png_header(16, 16))
+        result = PackResult(str(path), 100, 90, 10.0, tier='png:tiny')
+        with patch('filerepack.repack._PACKERS') as packers:
+            packers.get.return_value = MagicMock(
+                func=MagicMock(return_value=result), category='image',
+                extra={},
+            )
+            res = _dispatch_packer('png', str(path), {})
+        assert res.elapsed_seconds >= 0.0
+        assert res is result
+
+
+class TestTierReporting:
+    def test_summary_totals_per_tier(self):
+        summary = RepackSummary(results=[
+            PackResult('a', 100, 80, 20.0, tier='png:tiny', elapsed_seconds=0.5),
+            PackResult('b', 100, 50, 50.0, tier='png:tiny', elapsed_seconds=1.5),
+            PackResult('c', 100, 100, 0.0),
+        ])
+        assert summary.tier_totals() == {
+            'png:tiny': {'files': 2, 'seconds': 2.0, 'saved': 70},
+        }
+
+    def test_bulk_accumulates_tiers(self):
+        acc = _BulkAcc(dryrun=True, continue_on_error=True)
+        for saved in (10, 30):
+            acc.consume({
+                'status': 'processed', 'file': 'x', 'original_size': 100,
+                'final_size': 100 - saved, 'savings_percent': float(saved),
+                'tiers': {'png:large': {'files': 1, 'seconds': 2.0, 'saved': saved}},
+            }, 'x')
+        assert acc.tiers == {'png:large': {'files': 2, 'seconds': 4.0, 'saved': 40}}
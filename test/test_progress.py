@@ -83,6 +83,20 @@ class TestProgressReporter:
         assert messages == ["Repacking clip.mp4..."]
         bar.close()
 
+    def test_encode_hook_every_ten_percent(self, monkeypatch):
+        messages = []
+        monkeypatch.setattr(ProgressReporter, "_start_rich", lambda self: None)
+        bar = ProgressReporter(True, echo=messages.append)
+        for current in (10, 15, 20):
+            bar.hook("encode", current=current, total=100, name="/tmp/clip.mp4",
+                     fraction=current / 100, speed=2.0, eta=45.0)
+        assert messages == [
+            "Encoding clip.mp4...",
+            "Encoding clip.mp4: 10% 2.00\u00d7 ETA 0:45",
+            "Encoding clip.mp4: 20% 2.00\u00d7 ETA 0:45",
+        ]
+        bar.close()
+
 
 class TestRepackProgressCallback:
     def test_standalone_gzip_emits_standalone(self, tmp_path):
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+from unittest.mock import MagicMock, patch
+
+from filerepack import race
+from filerepack.repack import (
+    _PACKERS, _dispatch_packer, _grow_bound, _jpg_candidates, _run_command, pack_mp4,
+    pack_png,
+)
+from filerepack.utils import cpu_budget
+
+_SLEEP = [sys.executable, '-c', 'import time; time.sleep(30)']
+
+
+def _writer(data):
+    def run(out):
+        with open(out, 'wb') as fh:
+            fh.write(data)
+        return True
+    return run
+
+
+class TestCpuBudget:
+    def test_explicit_threads_win(self):
+        assert cpu_budget(3, jobs=8) == 3
+
+    def test_cores_split_across_jobs(self):
+        with patch('filerepack.utils.os.cpu_count', return_value=8):
+            assert cpu_budget(None, jobs=4) == 2
+            assert cpu_budget(None, jobs=16) == 1
+
+
+class TestKillScope:
+    def test_deadline_kills_command(self):
+        scope = race.KillScope(deadline=time.monotonic())
+        started = time.monotonic()
+        with race.scoped(scope):
+            assert _run_command(_SLEEP) is None
+        assert scope.reason == 'deadline'
+        assert time.monotonic() - started < 10
+
+    def test_output_past_limit_kills_command(self, tmp_path):
+        out = tmp_path / 'out.bin'
+        out.write_bytes(b'x' * 100)
+        scope = race.KillScope(output=str(out), limit=lambda: 50)
+        with race.scoped(scope):
+            assert _run_command(_SLEEP) is None
+        assert scope.reason == 'output exceeds best'
+
+    def test_scoped_success_returns_output(self):
+        with race.scoped(race.KillScope()):
+            res = _run_command([sys.executable, '-c', 'print("ok")'])
+        assert res is not None and res.stdout.strip() == 'ok'
+        assert race.current_scope() is None
+
+    def test_on_stdout_streams_lines(self):
+        lines = []
+        scope = race.KillScope(on_stdout=lines.append)
+        with race.scoped(scope):
+            res = _run_command([sys.executable, '-c', 'print("a=1"); print("progress=end")'])
+        assert res is not None and res.returncode == 0
+        assert [line.strip() for line in lines] == ['a=1', 'progress=end']
+
+    def test_failing_stdout_callback_keeps_draining(self):
+        lines = []
+
+        def on_line(line):
+            lines.append(line)
+            raise ValueError('hook bug')
+
+        scope = race.KillScope(on_stdout=on_line, deadline=time.monotonic() + 30)
+        with race.scoped(scope):
+            res = _run_command([sys.executable, '-c', 'print("a\\n" * 100000)'])
+        assert res is not None and res.returncode == 0
+        assert len(lines) > 100000
+
+    def test_abort_hook_kills_command(self):
+        scope = race.KillScope(abort=lambda: 'stop')
+        with race.scoped(scope):
+            assert _run_command(_SLEEP) is None
+        assert scope.reason == 'stop'
+
+
+class TestRace:
+    def test_smallest_verified_output_wins(self, tmp_path):
+        src = tmp_path / 'a.png'
+        src.write_bytes(b'\x89PNG\r\n\x1a\n' + b'\x00' * 100)
+        cands = [
+            race.Candidate('big', _writer(b'\x89PNG\r\n\x1a\n' + b'\x00' * 50)),
+            race.Candidate('small', _writer(b'\x89PNG\r\n\x1a\n' + b'\x00' * 10)),
+        ]
+        with patch('filerepack.repack.verify_output', return_value=True):
+            res = race.pack_race(str(src), cands, '.png', 'png', threads=2)
+        assert res.method == 'small'
+        assert res.outsize == 18
+        assert os.path.getsize(src) == 18
+
+    def test_in_place_candidate_starts_from_copy(self, tmp_path):
+        src = tmp_path / 'a.bin'
+        src.write_bytes(b'abcdef')
+        seen = []
+
+        def run(out):
+            with open(out, 'rb') as fh:
+                seen.append(fh.read())
+            return True
+
+        with patch('filerepack.repack.verify_output', return_value=True):
+            won = race.run_race(
+                str(src), [race.Candidate('copy', run, in_place=True)], '.bin', 'bin',
+            )
+        assert seen == [b'abcdef']
+        os.remove(won[0])
+
+    def test_slow_candidate_dropped_on_deadline(self, tmp_path):
+        src = tmp_path / 'a.bin'
+        src.write_bytes(b'x' * 100)
+
+        def slow(out):
+            return _run_command(_SLEEP) is not None
+
+        cands = [
+            race.Candidate('fast', _writer(b'x' * 10)),
+            race.Candidate('slow', slow, timeout=0.1),
+        ]
+        started = time.monotonic()
+        with patch('filerepack.repack.verify_output', return_value=True):
+            won = race.run_race(str(src), cands, '.bin', 'bin', threads=2)
+        assert won[1] == 'fast'
+        assert time.monotonic() - started < 10
+        os.remove(won[0])
+
+    def test_failed_verification_is_discarded(self, tmp_path):
+        src = tmp_path / 'a.bin'
+        src.write_bytes(b'x' * 100)
+        with patch('filerepack.repack.verify_output', return_value=False):
+            won = race.run_race(
+                str(src), [race.Candidate('bad', _writer(b'x'))], '.bin', 'bin',
+            )
+        assert won is None
+
+
+class TestPackerCandidates:
+    def test_png_records_winning_candidate(self, tmp_path):
+        path = tmp_path / 'a.png'
+        path.write_bytes(b'\x89PNG\r\n\x1a\n' + b'\x00' * 32)
+
+        def fake_run(cmd, quiet=False, debug=False, cwd=None):
+            if 'zopflipng' in cmd[0]:
+                with open(cmd[-1], 'wb') as fh:
+                    fh.write(b'\x89PNG\r\n\x1a\n')
+            return MagicMock(returncode=0)
+
+        def resolve(key):
+            return {'oxipng': '/bin/oxipng', 'zopflipng': '/bin/zopflipng'}.get(key)
+
+        with patch('filerepack.repack.resolve_tool', side_effect=resolve):
+            with patch('filerepack.repack._run_command', side_effect=fake_run):
+                with patch('filerepack.repack.verify_output', return_value=True):
+                    res = pack_png(str(path), ultra=True, dryrun=True, threads=2)
+        assert res.method == 'zopflipng'
+
+    def test_jpeg_chain_fails_when_both_tools_fail(self, tmp_path):
+        work = tmp_path / 'a.jpg'
+        work.write_bytes(b'\xff\xd8\xff' + b'\x00' * 32)
+
+        def resolve(key):
+            return {'jpegtran': '/bin/jpegtran', 'jpegoptim': '/bin/jpegoptim'}.get(key)
+
+        with patch('filerepack.repack.resolve_tool', side_effect=resolve):
+            chain, alone = _jpg_candidates(None, False, False, False, True)
+            with patch('filerepack.repack._run_command', return_value=None):
+                assert chain.name == 'jpegtran+jpegoptim' and not chain.run(str(work))
+                assert not alone.run(str(work))
+            with patch('filerepack.repack._run_command', return_value=MagicMock()):
+                with patch('filerepack.repack.verify_output', return_value=False):
+                    assert chain.run(str(work))
+
+    def test_dispatch_passes_threads_to_racing_specs(self, tmp_path):
+        path = tmp_path / 'a.jpg'
+        path.write_bytes(b'\xff\xd8\xff' + b'\x00' * 32)
+        func = MagicMock(return_value=None)
+        spec = _PACKERS['jpg']
+        with patch.object(spec, 'func', func):
+            _dispatch_packer('jpg', str(path), {'threads': 3})
+        assert func.call_args.kwargs['threads'] == 3
+        assert all(_PACKERS[k].extra['threads'] == 'threads' for k in ('png', 'webp', 'tif'))
+
+
+class TestGrowWatch:
+    def test_bound_follows_commit_rules(self):
+        assert _grow_bound(1000, {'keep_if_larger': True}) == 999
+        assert _grow_bound(1000, {'keep_if_larger': False}) is None
+        assert _grow_bound(1000, {'keep_if_larger': False, 'min_savings': 10.0}) == 900
+
+    def test_projection_kills_before_output_reaches_bound(self, tmp_path):
+        out = tmp_path / 'out.bin'
+        out.write_bytes(b'x' * 60)
+        scope = race.grow_guard(str(out), 100, read_total=1000)
+        scope.pid = 1
+        with patch('filerepack.race._bytes_read', return_value=400):
+            assert scope.check() == race.ABORTED_WOULD_GROW
+        with patch('filerepack.race._bytes_read', return_value=100):
+            assert scope.check() is None
+
+    def test_video_encode_aborted_when_output_would_grow(self, tmp_path):
+        path = tmp_path / 'a.mp4'
+        path.write_bytes(b'\x00' * 100)
+
+        def fake_encode(ffmpeg, src, dest, lossless, quiet, debug, container='mp4'):
+            with open(dest, 'wb') as fh:
+                fh.write(b'\x00' * 200)
+            return _run_command(_SLEEP) is not None
+
+        started = time.monotonic()
+        with patch('filerepack.repack.resolve_tool', return_value='/bin/ffmpeg'):
+            with patch('filerepack.repack._encode_video', side_effect=fake_encode):
+                res = pack_mp4(str(path))
+        assert time.monotonic() - started < 10
+        assert res.note == race.ABORTED_WOULD_GROW
+        assert res.replaced is False
+        assert path.read_bytes() == b'\x00' * 100
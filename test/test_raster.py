@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import struct
+from io import BytesIO
+from unittest.mock import patch
+
+import pytest
+
+from filerepack.codecs import pack_bmp, pack_pnm, pack_tga
+from filerepack.models import PackResult
+from filerepack.raster import pnm_ascii_to_binary
+
+
+class TestPlainPnm:
+    def test_p1_packs_rows_to_bits(self):
+        data = b'P1\n# comment\n10 2\n1010101010\n0000000001\n'
+        assert pnm_ascii_to_binary(data) == (
+            b'P4\n10 2\n' + bytes([0b10101010, 0b10000000, 0, 0b01000000])
+        )
+
+    def test_p1_bits_without_separators(self):
+        assert pnm_ascii_to_binary(b'P1 3 1 101') == b'P4\n3 1\n\xa0'
+
+    def test_p3_to_raw_rgb(self):
+        data = b'P3\n2 1\n255\n255 0 0  0 128 255\n'
+        assert pnm_ascii_to_binary(data) == b'P6\n2 1\n255\n' + bytes([255, 0, 0, 0, 128, 255])
+
+    def test_p2_sixteen_bit_is_big_endian(self):
+        data = b'P2 2 1 65535 1 65535'
+        assert pnm_ascii_to_binary(data) == b'P5\n2 1\n65535\n' + struct.pack('>HH', 1, 65535)
+
+    def test_rejects_binary_and_out_of_range(self):
+        assert pnm_ascii_to_binary(b'P6\n1 1\n255\n\x00\x00\x00') is None
+        assert pnm_ascii_to_binary(b'P2 1 1 15 16') is None
+        assert pnm_ascii_to_binary(b'P3 2 1 255 1 2 3') is None
+
+    def test_pack_pnm_without_pillow_or_magick(self, tmp_path):
+        path = tmp_path / 'a.pgm'
+        path.write_bytes(b'P2\n4 4\n255\n' + b'200 100 50 25\n' * 4)
+        with patch('filerepack.raster._encode_pillow', return_value=None):
+            with patch('filerepack.codecs.resolve_tool', return_value=None):
+                res = pack_pnm(str(path))
+        assert res is not None and res.replaced
+        assert res.method == 'pnm-binary'
+        assert path.read_bytes() == b'P5\n4 4\n255\n' + bytes([200, 100, 50, 25]) * 4
+
+
+class TestFallback:
+    def test_magick_used_when_in_process_unavailable(self, tmp_path):
+        path = tmp_path / 'a.bmp'
+        path.write_bytes(b'BM' + b'\x00' * 64)
+        result = PackResult(str(path), 66, 60, 9.1)
+        with patch('filerepack.raster.pack_raster', return_value=None):
+            with patch('filerepack.codecs._pack_magick', return_value=result) as magick:
+                assert pack_bmp(str(path)) is result
+        assert magick.call_args[0][1:] == ('.bmp', 'bmp')
+
+    def test_in_process_result_skips_magick(self, tmp_path):
+        path = tmp_path / 'a.tga'
+        path.write_bytes(b'\x00' * 64)
+        result = PackResult(str(path), 64, 40, 37.5)
+        with patch('filerepack.raster.pack_raster', return_value=result):
+            with patch('filerepack.codecs._pack_magick') as magick:
+                assert pack_tga(str(path)) is result
+        magick.assert_not_called()
+
+
+class TestPillow:
+    def test_bmp_few_colours_becomes_palette(self, tmp_path):
+        Image = pytest.importorskip('PIL.Image')
+        image = Image.new('RGB', (64, 64), (10, 20, 30))
+        image.paste((200, 100, 0), (0, 0, 32, 64))
+        path = tmp_path / 'a.bmp'
+        image.save(str(path))
+        with patch('filerepack.codecs.resolve_tool', return_value=None):
+            res = pack_bmp(str(path))
+        assert res is not None and res.method == 'pillow-palette'
+        with Image.open(str(path)) as packed:
+            assert packed.mode == 'P'
+            assert packed.convert('RGB').tobytes() == image.tobytes()
+
+    def test_tga_rle_is_pixel_identical(self, tmp_path):
+        Image = pytest.importorskip('PIL.Image')
+        image = Image.new('RGBA', (50, 50), (1, 2, 3, 4))
+        buf = BytesIO()
+        image.save(buf, format='TGA')
+        path = tmp_path / 'a.tga'
+        path.write_bytes(buf.getvalue())
+        with patch('filerepack.codecs.resolve_tool', return_value=None):
+            res = pack_tga(str(path))
+        assert res is not None and res.replaced
+        with Image.open(str(path)) as packed:
+            assert packed.convert('RGBA').tobytes() == image.tobytes()
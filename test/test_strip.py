@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import zlib
+from unittest.mock import patch
+
+from filerepack.repack import _png_lossless_candidates, pack_png, pack_webp
+from filerepack.strip import strip_metadata
+from test.image_fixtures import png_chunk, png_file, riff_chunk, vp8x, webp_file
+
+
+class TestPng:
+    def test_text_and_time_dropped_colour_kept(self, tmp_path):
+        src, dest = tmp_path / 'a.png', tmp_path / 'b.png'
+        gama = png_chunk(b'gAMA', struct.pack('>I', 45455))
+        text, time = png_chunk(b'tEXt', b'Author\x00me'), png_chunk(b'tIME', b'\x00' * 7)
+        src.write_bytes(png_file(text, gama, time))
+        assert strip_metadata(str(src), str(dest), 'png')
+        assert dest.read_bytes() == png_file(gama)
+
+    def test_bad_crc_and_nothing_to_drop(self, tmp_path):
+        src, dest = tmp_path / 'a.png', tmp_path / 'b.png'
+        src.write_bytes(png_file())
+        assert strip_metadata(str(src), str(dest), 'png') is False
+        broken = bytearray(png_file(png_chunk(b'tEXt', b'k\x00v')))
+        broken[30] ^= 0xFF
+        src.write_bytes(bytes(broken))
+        assert strip_metadata(str(src), str(dest), 'png') is False
+
+    def test_pack_png_strips_without_optimizers(self, tmp_path):
+        path = tmp_path / 'a.png'
+        path.write_bytes(png_file(png_chunk(b'zTXt', b'k\x00\x00' + zlib.compress(b'v' * 100))))
+        with patch('filerepack.repack.resolve_tool', return_value=None):
+            res = pack_png(str(path))
+        assert res.method == 'strip' and res.replaced
+        assert path.read_bytes() == png_file()
+
+    def test_keep_meta_has_no_strip_candidate(self, tmp_path):
+        path = tmp_path / 'a.png'
+        path.write_bytes(png_file())
+        with patch('filerepack.repack.resolve_tool', return_value=None):
+            assert _png_lossless_candidates(str(path), False, True, False, False) == []
+
+
+class TestWebp:
+    def test_exif_xmp_dropped_flags_and_size_fixed(self, tmp_path):
+        src, dest = tmp_path / 'a.webp', tmp_path / 'b.webp'
+        image = riff_chunk(b'VP8L', b'\x2f' + b'\x00' * 20)
+        src.write_bytes(webp_file(vp8x(0x08 | 0x04 | 0x10), image,
+                                  riff_chunk(b'EXIF', b'II*\x00x'), riff_chunk(b'XMP ', b'<x/>')))
+        assert strip_metadata(str(src), str(dest), 'webp')
+        assert dest.read_bytes() == webp_file(vp8x(0x10), image)
+
+    def test_pack_webp_keep_meta_leaves_file(self, tmp_path):
+        path = tmp_path / 'a.webp'
+        data = webp_file(vp8x(0x08), riff_chunk(b'VP8L', b'\x2f' + b'\x00' * 20),
+                         riff_chunk(b'EXIF', b'x' * 40))
+        path.write_bytes(data)
+        with patch('filerepack.repack.resolve_tool', return_value=None):
+            assert pack_webp(str(path), keep_meta=True) is None
+            res = pack_webp(str(path))
+        assert res.method == 'strip'
+        assert len(path.read_bytes()) == len(data) - 48
+
+
+class TestJpeg:
+    def test_app_segments_dropped_jfif_kept(self, tmp_path):
+        jfif = b'\xff\xe0\x00\x10JFIF\x00\x01\x01' + b'\x00' * 7
+        exif = b'\xff\xe1\x00\x0aExif\x00\x00ab'
+        com = b'\xff\xfe\x00\x04hi'
+        scan = b'\xff\xda\x00\x08\x01\x01\x00\x00\x3f\x00' + b'\x12\xff\x00\x34' + b'\xff\xd9'
+        src, dest = tmp_path / 'a.jpg', tmp_path / 'b.jpg'
+        src.write_bytes(b'\xff\xd8' + jfif + exif + com + scan)
+        assert strip_metadata(str(src), str(dest), 'jpg')
+        assert dest.read_bytes() == b'\xff\xd8' + jfif + scan
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import struct
+from unittest.mock import MagicMock, patch
+
+from filerepack import tiff
+from filerepack.codecs import pack_dng
+from filerepack.repack import _PACKERS, pack_tif
+
+_SIZES = {
+    'zip:p9': 900, 'zip:2:p9': 300, 'lzw': 950, 'lzw:2': 400,
+    'zip:3:p9': 200, 'none': 0,
+}
+
+
+def _tiff(width=8, height=4, bits=8, samples=1, fmt=1, pages=1, compression=1,
+          order='<', rows_per_strip=2):
+    """Uncompressed chunky TIFF; pixel byte i is i % 251. Extra pages repeat page 0."""
+    row = (width * bits * samples + 7) // 8
+    pixels = bytes(i % 251 for i in range(row * height))
+    out = bytearray((b'II' if order == '<' else b'MM') + struct.pack(order + 'HI', 42, 0))
+    data_at = len(out)
+    out += pixels
+    strips = [(data_at + y * row, row * min(rows_per_strip, height - y))
+              for y in range(0, height, rows_per_strip)]
+    offsets_at = len(out)
+    out += b''.join(struct.pack(order + 'I', off) for off, _c in strips)
+    counts_at = len(out)
+    out += b''.join(struct.pack(order + 'I', cnt) for _o, cnt in strips)
+    ifds = []
+    for _ in range(pages):
+        entries = [
+            (256, 4, 1, width), (257, 4, 1, height), (258, 3, 1, bits),
+            (259, 3, 1, compression), (262, 3, 1, 2 if samples == 3 else 1),
+            (273, 4, len(strips), offsets_at if len(strips) > 1 else strips[0][0]),
+            (277, 3, 1, samples), (278, 4, 1, rows_per_strip),
+            (279, 4, len(strips), counts_at if len(strips) > 1 else strips[0][1]),
+            (339, 3, 1, fmt),
+        ]
+        ifds.append(len(out))
+        out += struct.pack(order + 'H', len(entries))
+        for tag, typ, num, value in entries:
+            packed = struct.pack(order + ('H' if typ == 3 else 'I'), value).ljust(4, b'\x00')
+            out += struct.pack(order + 'HHI', tag, typ, num) + packed
+        out += b'\x00\x00\x00\x00'
+    for here, nxt in zip(ifds, ifds[1:]):
+        out[here + 2 + 12 * 10:here + 2 + 12 * 10 + 4] = struct.pack(order + 'I', nxt)
+    out[4:8] = struct.pack(order + 'I', ifds[0])
+    return bytes(out)
+
+
+def _fake_tiffcp(calls):
+    def run(cmd, quiet=False, debug=False, cwd=None):
+        calls.append(cmd)
+        spec = cmd[cmd.index('-c') + 1]
+        with open(cmd[-1], 'wb') as fh:
+            fh.write(b'II*\x00' + b'\x00' * _SIZES.get(spec, 500))
+        return MagicMock(returncode=0)
+    return run
+
+
+def _pack(func, path, calls, **kwargs):
+    with patch('filerepack.repack.resolve_tool', side_effect=lambda k: f'/bin/{k}'):
+        with patch('filerepack.codecs.resolve_tool', side_effect=lambda k: f'/bin/{k}'):
+            with patch('filerepack.repack._run_command', side_effect=_fake_tiffcp(calls)):
+                with patch('filerepack.repack.verify_output', return_value=True):
+                    return func(str(path), dryrun=True, **kwargs)
+
+
+class TestReadInfo:
+    def test_layout_and_pages(self, tmp_path):
+        path = tmp_path / 'a.tif'
+        path.write_bytes(_tiff(width=5, height=7, bits=16, samples=3, pages=3, order='>'))
+        info = tiff.read_info(str(path))
+        assert (info.width, info.height, info.bits, info.samples) == (5, 7, 16, 3)
+        assert info.pages == 3 and info.order == '>' and not info.tiled
+        assert len(info.strips) == 4 and info.row_bytes == 30
+
+    def test_bigtiff_and_garbage(self, tmp_path):
+        path = tmp_path / 'a.tif'
+        path.write_bytes(b'II+\x00\x08\x00\x00\x00' + b'\x00' * 16)
+        assert tiff.read_info(str(path)) is None
+        path.write_bytes(b'II*\x00\xff\xff\x00\x00')
+        assert tiff.read_info(str(path)) is None
+
+
+class TestSpecs:
+    def test_predictor_follows_sample_format(self, tmp_path):
+        path = tmp_path / 'a.tif'
+        path.write_bytes(_tiff(bits=32, fmt=3))
+        specs = tiff.trial_specs(tiff.read_info(str(path)))
+        assert 'zip:3:p9' in specs and 'lzw:3' in specs
+        path.write_bytes(_tiff(bits=1))
+        specs = tiff.trial_specs(tiff.read_info(str(path)))
+        assert 'g4' in specs and not any(s.startswith('zip:2') for s in specs)
+
+    def test_zstd_only_under_ultra_and_dng_zip_only(self, tmp_path):
+        path = tmp_path / 'a.tif'
+        path.write_bytes(_tiff())
+        info = tiff.read_info(str(path))
+        assert not any('zstd' in s for s in tiff.trial_specs(info))
+        assert 'zstd:2:p19' in tiff.trial_specs(info, ultra=True)
+        assert tiff.trial_specs(info, zip_only=True) == ['zip:p9', 'zip:2:p9']
+
+
+class TestSample:
+    def test_first_rows_copied_into_one_strip(self, tmp_path):
+        src, dest = tmp_path / 'a.tif', tmp_path / 'b.tif'
+        data = _tiff(width=10, height=50, samples=3, order='>', rows_per_strip=3)
+        src.write_bytes(data)
+        assert tiff.write_sample(str(src), tiff.read_info(str(src)), str(dest), max_bytes=200)
+        sample = tiff.read_info(str(dest))
+        assert (sample.width, sample.height, sample.samples, sample.order) == (10, 6, 3, '>')
+        (offset, count), = sample.strips
+        assert dest.read_bytes()[offset:offset + count] == bytes(i % 251 for i in range(180))
+
+    def test_compressed_source_not_sampleable(self, tmp_path):
+        path = tmp_path / 'a.tif'
+        path.write_bytes(_tiff(compression=5))
+        assert not tiff.write_sample(str(path), tiff.read_info(str(path)), str(tmp_path / 'b'))
+
+
+class TestPack:
+    def test_large_file_trials_on_sample_then_rewrites_once(self, tmp_path):
+        path = tmp_path / 'a.tif'
+        path.write_bytes(_tiff(width=64, height=64, pages=2))
+        calls = []
+        with patch('filerepack.tiff.TIFF_SAMPLE_BYTES', 512):
+            res = _pack(pack_tif, path, calls)
+        assert len(calls) == 5
+        # A trial dropped on the race deadline may still log its call after the rewrite.
+        final, = [c for c in calls if c[-2].endswith('a.tif')]
+        assert final[1:3] == ['-c', 'zip:2:p9']
+        assert final[final.index('-r') + 1] == str(tiff.TIFF_STRIP_BYTES // 64)
+        assert res.method == 'tiffcp zip:2:p9' and res.tier == 'tif:sampled'
+
+    def test_compressed_source_decodes_first_page(self, tmp_path):
+        path = tmp_path / 'a.tif'
+        path.write_bytes(_tiff(width=64, height=64, compression=5))
+        calls = []
+        with patch('filerepack.tiff.TIFF_SAMPLE_BYTES', 512):
+            res = _pack(pack_tif, path, calls)
+        assert calls[0][1:3] == ['-c', 'none'] and calls[0][-2].endswith('a.tif,0')
+        # The fake decode output is not a readable TIFF: fall back to full trials.
+        assert len(calls) == 5 and res.tier == 'tif:full'
+
+    def test_small_file_races_full_rewrites(self, tmp_path):
+        path = tmp_path / 'a.tif'
+        path.write_bytes(_tiff())
+        calls = []
+        res = _pack(pack_tif, path, calls)
+        assert len(calls) == 4 and res.tier == 'tif:full'
+        assert res.method == 'tiffcp zip:2:p9'
+
+    def test_dng_deflate_only_keeps_strips(self, tmp_path):
+        path = tmp_path / 'a.dng'
+        path.write_bytes(_tiff(width=64, height=64, bits=16))
+        calls = []
+        with patch('filerepack.tiff.TIFF_SAMPLE_BYTES', 512):
+            res = _pack(pack_dng, path, calls, threads=1)
+        assert sorted(c[2] for c in calls) == ['zip:2:p9', 'zip:p9']
+        assert all('-r' not in c for c in calls)
+        assert res.tier == 'dng:full'
+
+    def test_specs_pass_options(self):
+        assert _PACKERS['tif'].extra['ultra'] == 'ultra'
+        assert _PACKERS['dng'].extra['threads'] == 'threads'
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import os
+
+import pytest
+
 from filerepack.utils import (
-    parse_size, format_size, parse_extensions, should_process_file,
+    parse_size, parse_duration, format_size, parse_extensions, should_process_file,
     create_backup, output_json, output_csv,
     parse_jobs, parse_dir_names, DEFAULT_EXCLUDE_DIRS,
     dir_total_size, extract_exceeds_limit, zip_uncompressed_size,
@@ -38,6 +41,19 @@ class TestParseSize:
         assert parse_size('1000') == 1000
 
 
+class TestParseDuration:
+    def test_units(self):
+        assert parse_duration('90') == 90.0
+        assert parse_duration('45s') == 45.0
+        assert parse_duration('15m') == 900.0
+        assert parse_duration('1.5h') == 5400.0
+        assert parse_duration(None) == 0.0
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            parse_duration('soon')
+
+
 class TestFormatSize:
     def test_bytes(self):
         result = format_size(100)
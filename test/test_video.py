@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from filerepack import race, repack, video
+from filerepack.media import MediaInfo, MediaStream
+from filerepack.repack import _PACKERS, FileRepacker, pack_mp4
+
+_INFO = MediaInfo(
+    'mov,mp4,m4a,3gp,3g2,mj2', 240.0, 4000000, '',
+    (MediaStream('video', 'mpeg4', 1920, 1080), MediaStream('audio', 'aac')),
+)
+_PACKETS = '\n'.join(
+    f'{t / 2:.6f},{"K_" if t % 20 == 0 else "__"}' for t in range(480)
+)
+
+
+def _fake_ffmpeg(calls, fail_segment=False):
+    """Packet listing for ffprobe; segment, encode, and concat outputs for ffmpeg."""
+    def run(cmd, quiet=False, debug=False, cwd=None):
+        calls.append(cmd)
+        if '-show_entries' in cmd:
+            return MagicMock(returncode=0, stdout=_PACKETS)
+        if '-segment_times' in cmd:
+            pattern = cmd[-1]
+            for i in range(cmd[cmd.index('-segment_times') + 1].count(',') + 2):
+                with open(pattern % i, 'wb') as fh:
+                    fh.write(b'\x00' * 1000)
+        elif '-ss' in cmd:
+            with open(cmd[-1], 'wb') as fh:
+                fh.write(b'\x00' * 1000)
+        elif fail_segment and cmd[cmd.index('-i') + 1].endswith('in0002.mkv'):
+            return None
+        else:
+            with open(cmd[-1], 'wb') as fh:
+                fh.write(b'\x00' * 50)
+        return MagicMock(returncode=0, stdout='')
+    return run
+
+
+class TestCutPoints:
+    def test_nearest_keyframes(self):
+        frames = [0.0, 9.0, 21.0, 29.5, 41.0, 60.0]
+        assert video.cut_points(frames, 60.0, 3) == [21.0, 41.0]
+        assert video.cut_points([0.0, 55.0], 60.0, 4) == [55.0]
+        assert video.cut_points([0.0], 60.0, 4) == []
+
+
+class TestEncodeSegments:
+    def _encode(self, tmp_path, calls, events=None, **kw):
+        src = tmp_path / 'a.mp4'
+        src.write_bytes(b'\x00' * 4000)
+        dest = str(tmp_path / 'out.mp4')
+        with patch('filerepack.repack._run_command', side_effect=_fake_ffmpeg(calls, **kw)):
+            hook = (lambda event, **k: events.append((event, k['current'], k['total']))) \
+                if events is not None else None
+            parts = video.encode_segments(
+                '/bin/ffmpeg', '/bin/ffprobe', str(src), dest, _INFO, False, 'mp4', 4,
+                threads=8, on_progress=hook,
+            )
+        return parts, dest
+
+    def test_split_encode_concat_with_audio_once(self, tmp_path):
+        calls, events = [], []
+        parts, dest = self._encode(tmp_path, calls, events)
+        assert parts == 4 and os.path.getsize(dest) == 50
+        split = calls[1]
+        assert split[split.index('-segment_times') + 1] == '60.000000,120.000000,180.000000'
+        assert split[split.index('-c') + 1] == 'copy'
+        encodes = calls[2:6]
+        assert all(c[c.index('-threads') + 1] == '2' and '-an' in c for c in encodes)
+        assert all('libx264' in c for c in encodes)
+        concat = calls[-1]
+        assert concat[concat.index('-f') + 1] == 'concat'
+        maps = [concat[i + 1] for i, arg in enumerate(concat) if arg == '-map']
+        assert maps == ['0:v:0', '1', '-1:v']
+        assert '+faststart' in concat
+        assert events[0] == ('segment', 0, 4) and events[-1] == ('segment', 4, 4)
+        assert not os.path.exists(os.path.dirname(split[-1]))
+
+    def test_concat_keeps_subtitle_and_every_audio_stream(self, tmp_path):
+        streams = [MediaStream('video', 'h264'), MediaStream('audio', 'aac'),
+                   MediaStream('audio', 'ac3'), MediaStream('subtitle', 'subrip')]
+        calls = []
+        self._encode(tmp_path, calls)
+        concat = calls[-1]
+        kept = []
+        for i, arg in enumerate(concat):
+            if arg != '-map':
+                continue
+            spec = concat[i + 1]
+            source, _, kind = spec.lstrip('-').partition(':')
+            if source != '1':
+                continue
+            match = [s for s in streams if not kind or s.kind[0] == kind[0]]
+            kept = [s for s in kept if s not in match] if spec.startswith('-') else kept + match
+        assert [s.codec for s in kept] == ['aac', 'ac3', 'subrip']
+
+    def test_failed_segment_returns_none(self, tmp_path):
+        calls = []
+        parts, _dest = self._encode(tmp_path, calls, fail_segment=True)
+        assert parts is None
+        assert not any('concat' in c for c in calls)
+
+    def test_short_video_not_split(self, tmp_path):
+        info = MediaInfo('mp4', 45.0, 0, '', (MediaStream('video', 'h264'),))
+        with patch('filerepack.repack._run_command') as run:
+            assert video.encode_segments(
+                '/bin/ffmpeg', '/bin/ffprobe', 'a.mp4', 'b.mp4', info, False, 'mp4', 4,
+            ) is None
+        run.assert_not_called()
+
+
+class TestPackVideoSegments:
+    def test_standalone_repack_reports_segments(self, tmp_path):
+        path = tmp_path / 'a.mp4'
+        path.write_bytes(b'\x00' * 100000)
+        calls, events = [], []
+        with patch('filerepack.repack.resolve_tool', side_effect=lambda k: f'/bin/{k}'):
+            with patch('filerepack.repack.media.probe', return_value=_INFO):
+                with patch('filerepack.repack._run_command', side_effect=_fake_ffmpeg(calls)):
+                    with patch('filerepack.repack.verify_output', return_value=True):
+                        summary = FileRepacker().repack_zip_file(
+                            str(path), def_options={'video_segments': 3, 'threads': 3},
+                            on_progress=lambda event, **k: events.append(event),
+                        )
+        res, = summary.results
+        assert res.method == 'ffmpeg segments' and res.metrics['segments'] == 3.0
+        assert res.replaced and path.stat().st_size == 50
+        assert events.count('segment') == 4
+
+    def test_segments_killed_once_combined_output_would_grow(self, tmp_path):
+        path = tmp_path / 'a.mp4'
+        path.write_bytes(b'\x00' * 100000)
+        script = (
+            'import sys, time\n'
+            'open(sys.argv[1], "wb").write(bytes(60000))\n'
+            'time.sleep(30)\n'
+        )
+        calls = []
+        fake = _fake_ffmpeg(calls)
+        real_run = repack._run_command
+
+        def run(cmd, quiet=False, debug=False, cwd=None):
+            if '-threads' in cmd and '-an' in cmd and '-ss' not in cmd:
+                calls.append(cmd)
+                return real_run([sys.executable, '-c', script, cmd[-1]], quiet, debug)
+            return fake(cmd, quiet, debug, cwd)
+
+        started = time.monotonic()
+        with patch('filerepack.repack.resolve_tool', side_effect=lambda k: f'/bin/{k}'):
+            with patch('filerepack.repack.media.probe', return_value=_INFO):
+                with patch('filerepack.repack._run_command', side_effect=run):
+                    res = pack_mp4(str(path), segments=3, threads=3)
+        assert time.monotonic() - started < 20
+        assert res.note == race.ABORTED_WOULD_GROW and not res.replaced
+        assert not any('concat' in c for c in calls)
+        assert sum('-threads' in c and '-an' in c and '-ss' not in c for c in calls) == 3
+
+    def test_segment_watch_time_budget(self, tmp_path):
+        with patch('filerepack.video.time.monotonic', side_effect=[0.0, 50.0, 200.0]):
+            watch = video.SegmentWatch(None, budget=100)
+            watch.begin(1000)
+            assert watch.check() is None
+            assert watch.check() == video.ABORTED_TIME_BUDGET
+        out = tmp_path / 'out0000.mkv'
+        out.write_bytes(b'x' * 300)
+        watch = video.SegmentWatch(1000)
+        watch.begin(1000)
+        watch.running(str(out))
+        watch.finished(str(out), 250)
+        assert watch.check() == race.ABORTED_WOULD_GROW
+
+    def test_fallback_encode_gets_the_remaining_time_budget(self, tmp_path):
+        path = tmp_path / 'a.mp4'
+        info = MediaInfo('mp4', 20.0, 0, '', (MediaStream('video', 'mpeg4'),))
+        clock, spend, budgets, calls = [1000.0], [0.0], [], []
+        real_progress = video.EncodeProgress
+
+        def failed_segments(*args, **kwargs):
+            clock[0] += spend[0]
+            return None
+
+        def progress(*args):
+            budgets.append(args[-1])
+            return real_progress(*args)
+
+        for spent in (40.0, 120.0):
+            path.write_bytes(b'\x00' * 100000)
+            spend[0] = spent
+            with patch('filerepack.repack.resolve_tool', side_effect=lambda k: f'/bin/{k}'), \
+                    patch('filerepack.repack.media.probe', return_value=info), \
+                    patch('filerepack.repack._run_command', side_effect=_fake_ffmpeg(calls)), \
+                    patch('filerepack.repack.verify_output', return_value=True), \
+                    patch('filerepack.repack.time.monotonic', side_effect=lambda: clock[0]), \
+                    patch('filerepack.video.encode_segments', side_effect=failed_segments), \
+                    patch('filerepack.video.EncodeProgress', side_effect=progress):
+                res = pack_mp4(str(path), segments=3, max_encode_seconds=100)
+        assert budgets == [60.0]
+        assert res.note == video.ABORTED_TIME_BUDGET and not res.replaced
+        assert len(calls) == 1
+
+    def test_specs_pass_segments_and_threads(self):
+        for key in ('mp4', 'mkv', 'webm', 'wmv', 'ts'):
+            assert _PACKERS[key].extra['video_segments'] == 'segments'
+            assert _PACKERS[key].extra['threads'] == 'threads'
+
+
+def _ticks(step):
+    clock = iter(range(0, 10 ** 6, step))
+    return lambda: float(next(clock))
+
+
+class TestPreflight:
+    def test_extrapolates_samples_and_audio(self):
+        info = MediaInfo('mp4', 240.0, 0, '', (
+            MediaStream('video', 'h264'), MediaStream('audio', 'aac', bit_rate=128000),
+        ))
+        calls = []
+        with patch('filerepack.repack._run_command', side_effect=_fake_ffmpeg(calls)):
+            with patch('filerepack.video.time.monotonic', side_effect=_ticks(2)):
+                est = video.preflight('/bin/ffmpeg', 'a.mp4', info, False, 'mp4', threads=4)
+        assert [c[c.index('-ss') + 1] for c in calls] == ['60.000', '120.000', '180.000']
+        assert all(c[c.index('-t') + 1] == '4' and '-an' in c for c in calls)
+        assert est.size == 1000 * 3 // 12 * 240 + 128000 // 8 * 240
+        assert est.seconds == 2 * 3 / 12 * 240 and est.samples == 3
+
+    def test_short_file_not_sampled(self):
+        info = MediaInfo('mp4', 20.0, 0, '', (MediaStream('video', 'h264'),))
+        assert video.preflight('/bin/ffmpeg', 'a.mp4', info, False, 'mp4') is None
+
+
+class TestPackVideoPreflight:
+    def _pack(self, tmp_path, size, calls, step=1, **kw):
+        path = tmp_path / 'a.mp4'
+        path.write_bytes(b'\x00' * size)
+        with patch('filerepack.repack.resolve_tool', side_effect=lambda k: f'/bin/{k}'):
+            with patch('filerepack.repack.media.probe', return_value=_INFO):
+                with patch('filerepack.repack._run_command', side_effect=_fake_ffmpeg(calls)):
+                    with patch('filerepack.repack.verify_output', return_value=True):
+                        with patch('filerepack.video.time.monotonic', side_effect=_ticks(step)):
+                            return pack_mp4(str(path), **kw)
+
+    def test_predicted_growth_skips_full_encode(self, tmp_path):
+        calls = []
+        res = self._pack(tmp_path, 4000, calls)
+        assert len(calls) == 3 and all('-ss' in c for c in calls)
+        assert res.method == 'skip' and res.note == video.SKIP_PREDICTED_SAVINGS
+        assert res.tier == 'video:predicted' and res.metrics['predicted_bytes'] == 60000.0
+
+    def test_time_budget_skips(self, tmp_path):
+        calls = []
+        res = self._pack(tmp_path, 4000, calls, step=10, keep_if_larger=False,
+                         max_encode_seconds=300)
+        assert res.note == video.SKIP_PREDICTED_TIME
+        assert res.metrics['predicted_seconds'] == 600.0
+
+    def test_prediction_and_actual_recorded(self, tmp_path):
+        calls = []
+        res = self._pack(tmp_path, 100000, calls)
+        assert len(calls) == 4 and res.replaced
+        assert res.metrics['predicted_bytes'] == 60000.0
+        assert res.metrics['encoded_bytes'] == 50.0 and 'encode_seconds' in res.metrics
+
+    def test_no_budget_no_samples(self, tmp_path):
+        calls = []
+        self._pack(tmp_path, 100000, calls, keep_if_larger=False)
+        assert len(calls) == 1 and '-ss' not in calls[0]
+
+
+class TestRemux:
+    def test_compatibility_by_container(self):
+        h264 = MediaInfo('avi', 60.0, 0, '', (
+            MediaStream('video', 'h264'), MediaStream('audio', 'mp3'),
+        ))
+        assert video.remux_compatible(h264, 'mp4') and video.remux_compatible(h264, 'mkv')
+        assert not video.remux_compatible(h264, 'webm')
+        assert not video.remux_compatible(h264, 'ts')
+        assert not video.remux_compatible(_INFO, 'mp4')
+        subs = MediaInfo('mkv', 60.0, 0, '', h264.streams + (MediaStream('subtitle', 'ass'),))
+        assert not video.remux_compatible(subs, 'mp4') and video.remux_compatible(subs, 'mkv')
+
+    def _pack(self, tmp_path, name, info, calls, remux_size, encode_size=50, **kw):
+        path = tmp_path / name
+        path.write_bytes(b'\x00' * 100000)
+
+        def run(cmd, quiet=False, debug=False, cwd=None):
+            calls.append(cmd)
+            size = 1000 if '-ss' in cmd else remux_size if '-c' in cmd else encode_size
+            with open(cmd[-1], 'wb') as fh:
+                fh.write(b'\x00' * size)
+            return MagicMock(returncode=0, stdout='')
+
+        with patch('filerepack.repack.resolve_tool', side_effect=lambda k: f'/bin/{k}'):
+            with patch('filerepack.repack.media.probe', return_value=info):
+                with patch('filerepack.repack._run_command', side_effect=run):
+                    with patch('filerepack.repack.verify_output', return_value=True):
+                        return pack_mp4(str(path), **kw) if name.endswith('.mp4') else \
+                            _PACKERS['avi'].func(str(path), **kw)
+
+    def test_compatible_avi_remux_kept_without_estimate(self, tmp_path):
+        info = MediaInfo('avi', 20.0, 0, '', (
+            MediaStream('video', 'h264'), MediaStream('audio', 'mp3'),
+        ))
+        calls = []
+        res = self._pack(tmp_path, 'a.avi', info, calls, 90000)
+        assert len(calls) == 1 and '+faststart' in calls[0]
+        assert calls[0][calls[0].index('-map') + 1] == '0'
+        assert res.method == 'ffmpeg remux' and res.tier == 'video:remux'
+        assert res.filepath.endswith('a.mp4') and res.replaced and res.outsize == 90000
+        assert not (tmp_path / 'a.avi').exists()
+
+    def test_predicted_smaller_encode_beats_remux(self, tmp_path):
+        info = MediaInfo('mp4', 240.0, 0, '', (MediaStream('video', 'h264'),))
+        calls = []
+        res = self._pack(tmp_path, 'a.mp4', info, calls, 99000)
+        assert len(calls) == 5 and 'libx264' in calls[4] and '-ss' not in calls[4]
+        assert res.tier == 'video:encode' and res.replaced and res.outsize == 50
+
+    def test_remux_kept_when_predicted_encode_comes_out_larger(self, tmp_path):
+        info = MediaInfo('mp4', 240.0, 0, '', (MediaStream('video', 'h264'),))
+        calls = []
+        res = self._pack(tmp_path, 'a.mp4', info, calls, 99000, encode_size=99500)
+        assert len(calls) == 5
+        assert res.tier == 'video:remux' and res.replaced and res.outsize == 99000
+
+    def test_remux_kept_when_preflight_predicts_no_gain(self, tmp_path):
+        info = MediaInfo('mp4', 240.0, 0, '', (MediaStream('video', 'h264'),))
+        calls = []
+        res = self._pack(tmp_path, 'a.mp4', info, calls, 50000)
+        assert len(calls) == 4 and all('-ss' in c for c in calls[1:])
+        assert res.tier == 'video:remux' and res.replaced and res.outsize == 50000
+
+    def test_remux_without_savings_falls_through_to_encode(self, tmp_path):
+        info = MediaInfo('mp4', 20.0, 0, '', (MediaStream('video', 'h264'),))
+        calls = []
+        res = self._pack(tmp_path, 'a.mp4', info, calls, 100000)
+        assert len(calls) == 2 and 'libx264' in calls[1]
+        assert res.tier == 'video:encode' and res.outsize == 50
+
+
+_BLOCK = 'out_time_us={}\ntotal_size={}\nspeed={}x\nprogress=continue\n'
+
+
+class TestEncodeProgress:
+    def test_blocks_emit_encode_events(self):
+        events = []
+        with patch('filerepack.video.time.monotonic', side_effect=_ticks(10)):
+            tracker = video.EncodeProgress(
+                240.0, 'a.mp4', on_progress=lambda event, **k: events.append((event, k)),
+            )
+            for line in _BLOCK.format(60000000, 5000, '1.5').splitlines():
+                tracker.feed(line)
+        (event, kw), = events
+        assert event == 'encode' and (kw['current'], kw['total']) == (60, 240)
+        assert kw['fraction'] == 0.25 and kw['speed'] == 1.5 and kw['eta'] == 30.0
+        assert tracker.total_size == 5000
+
+    def test_legacy_hook_without_extras(self):
+        events = []
+        tracker = video.EncodeProgress(
+            240.0, on_progress=lambda event, current=0, total=0, name='': events.append(current),
+        )
+        for line in _BLOCK.format(120000000, 0, 'N/A').splitlines():
+            tracker.feed(line)
+        assert events == [120] and tracker.speed == 0.0
+
+    def test_hook_error_is_not_retried_without_extras(self):
+        calls = []
+
+        def hook(event, current=0, total=0, name='', **extra):
+            calls.append(extra)
+            raise TypeError('bug inside the hook')
+
+        tracker = video.EncodeProgress(240.0, on_progress=hook)
+        with pytest.raises(TypeError):
+            for line in _BLOCK.format(60000000, 0, '1x').splitlines():
+                tracker.feed(line)
+        assert len(calls) == 1 and 'eta' in calls[0]
+
+    def test_over_budget_projection(self):
+        with patch('filerepack.video.time.monotonic', side_effect=[0.0, 100.0, 100.0, 400.0]):
+            tracker = video.EncodeProgress(240.0, budget=300)
+            tracker.out_seconds = 200.0
+            assert tracker.over_budget() is None
+            tracker.out_seconds = 62.0
+            assert tracker.over_budget() == video.ABORTED_TIME_BUDGET
+            tracker.out_seconds = 239.0
+            assert tracker.over_budget() == video.ABORTED_TIME_BUDGET
+        assert video.EncodeProgress(240.0).over_budget() is None
+
+
+class TestPackVideoProgress:
+    def test_progress_drives_events_and_time_budget(self, tmp_path):
+        path = tmp_path / 'a.mp4'
+        path.write_bytes(b'\x00' * 100000)
+        info = MediaInfo('mp4', 20.0, 0, '', (MediaStream('video', 'mpeg4'),))
+        script = (
+            'import sys, time\n'
+            'open(sys.argv[1], "wb").write(bytes(10))\n'
+            'print("out_time_us=1000000\\nspeed=0.01x\\nprogress=continue", flush=True)\n'
+            'time.sleep(30)\n'
+        )
+        real_run = repack._run_command
+
+        def run(cmd, quiet=False, debug=False, cwd=None):
+            assert cmd[1:4] == ['-progress', 'pipe:1', '-nostats']
+            return real_run([sys.executable, '-c', script, cmd[-1]], quiet, debug)
+
+        events = []
+        started = time.monotonic()
+        with patch('filerepack.repack.resolve_tool', side_effect=lambda k: f'/bin/{k}'):
+            with patch('filerepack.repack.media.probe', return_value=info):
+                with patch('filerepack.repack._run_command', side_effect=run):
+                    res = repack._pack_video(
+                        str(path), 'mp4', keep_if_larger=False, max_encode_seconds=0.5,
+                        on_progress=lambda event, **k: events.append((event, k)),
+                    )
+        assert time.monotonic() - started < 20
+        assert res.note == video.ABORTED_TIME_BUDGET and not res.replaced
+        assert path.stat().st_size == 100000
+        assert ('encode', 1, 20) in [(e, k['current'], k['total']) for e, k in events]
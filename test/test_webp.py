@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+from unittest.mock import MagicMock, patch
+
+from filerepack import webp
+from filerepack.repack import pack_webp
+from test.image_fixtures import riff_chunk, vp8x, webp_file
+
+
+_VP8X = vp8x()
+_LOSSY = webp_file(riff_chunk(b'VP8 ', b'\x00' * 31))
+_LOSSLESS = webp_file(riff_chunk(b'VP8L', b'\x2f' + b'\x00' * 30))
+_ANIMATED = webp_file(_VP8X, riff_chunk(b'ANIM', b'\x00' * 6), riff_chunk(b'ANMF', b'\x00' * 40))
+
+
+def _pack(tmp_path, data, **kwargs):
+    path = tmp_path / 'a.webp'
+    path.write_bytes(data)
+    calls = []
+
+    def fake_run(cmd, quiet=False, debug=False, cwd=None):
+        calls.append(cmd)
+        with open(cmd[-1], 'wb') as fh:
+            fh.write(webp_file(riff_chunk(b'VP8L', b'\x2f')))
+        return MagicMock(returncode=0)
+
+    with patch('filerepack.repack.resolve_tool', side_effect=lambda k: f'/bin/{k}'):
+        with patch('filerepack.repack._run_command', side_effect=fake_run):
+            res = pack_webp(str(path), dryrun=True, **kwargs)
+    return res, calls
+
+
+class TestInspect:
+    def test_kinds(self, tmp_path):
+        path = tmp_path / 'a.webp'
+        cases = [
+            (_LOSSY, webp.LOSSY),
+            (_LOSSLESS, webp.LOSSLESS),
+            (webp_file(_VP8X, riff_chunk(b'ALPH', b'\x00' * 3),
+                       riff_chunk(b'VP8 ', b'\x00' * 31)), webp.LOSSY),
+            (_ANIMATED, webp.ANIMATED),
+        ]
+        for data, kind in cases:
+            path.write_bytes(data)
+            assert webp.inspect(str(path)).kind == kind
+
+    def test_metadata_flag_and_not_webp(self, tmp_path):
+        path = tmp_path / 'a.webp'
+        path.write_bytes(
+            webp_file(_VP8X, riff_chunk(b'VP8L', b'\x2f'), riff_chunk(b'XMP ', b'<x/>')),
+        )
+        assert webp.inspect(str(path)).metadata
+        path.write_bytes(b'RIFF\x04\x00\x00\x00WAVE')
+        assert webp.inspect(str(path)) is None
+
+
+class TestRouting:
+    def test_lossless_reencodes_from_webp_without_dwebp(self, tmp_path):
+        res, calls = _pack(tmp_path, _LOSSLESS)
+        assert len(calls) == 1
+        cmd = calls[0]
+        assert cmd[0] == '/bin/cwebp' and '-lossless' in cmd and '-exact' in cmd
+        assert cmd[-3].endswith('a.webp')
+        assert res.tier == 'webp:lossless' and res.method == 'cwebp'
+
+    def test_lossy_is_not_reencoded_without_lossy_flag(self, tmp_path):
+        res, calls = _pack(tmp_path, _LOSSY)
+        assert calls == [] and res is None
+        res, calls = _pack(tmp_path, _LOSSY, lossy=True)
+        assert '-q' in calls[0] and '-lossless' not in calls[0]
+        assert res.tier == 'webp:lossy'
+
+    def test_animated_only_strips(self, tmp_path):
+        data = webp_file(_VP8X, riff_chunk(b'ANIM', b'\x00' * 6), riff_chunk(b'ANMF', b'\x00' * 40),
+                     riff_chunk(b'EXIF', b'x' * 100))
+        res, calls = _pack(tmp_path, data, lossy=True)
+        assert calls == []
+        assert res.method == 'strip' and res.tier == 'webp:animated'
+        assert res.outsize == len(_ANIMATED)
+
+    def test_keep_meta_keeps_icc_profile_out_of_cwebp(self, tmp_path):
+        data = webp_file(
+            _VP8X, riff_chunk(b'ICCP', b'p' * 40), riff_chunk(b'VP8L', b'\x2f' + b'\x00' * 30),
+        )
+        res, calls = _pack(tmp_path, data, keep_meta=True)
+        assert calls == [] and res is None
+        res, calls = _pack(tmp_path, data)
+        assert calls and calls[0][0] == '/bin/cwebp'